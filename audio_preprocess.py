@@ -0,0 +1,266 @@
+import logging
+import shutil
+import subprocess
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from mp3_frames import iter_frames
+
+# Recordings are analysed as 16 kHz mono, plenty for telling speech from music and silence
+SAMPLE_RATE = 16000
+
+Span = Tuple[float, float]
+
+
+class TrimResult(NamedTuple):
+    """A recording with its non-speech spans cut out, and the map back to the original times."""
+    audio: bytes
+    kept_spans: List[Span]
+    original_seconds: float
+    kept_seconds: float
+
+    @property
+    def removed_fraction(self) -> float:
+        return 1 - self.kept_seconds / self.original_seconds if self.original_seconds else 0.0
+
+    def to_original(self, seconds: float) -> float:
+        """
+        Converts a time in the trimmed audio to the time in the original recording.
+
+        :param seconds: Seconds from the start of the trimmed audio.
+        :return: Seconds from the start of the original recording.
+        """
+        elapsed = 0.0
+        for start, end in self.kept_spans:
+            if seconds < elapsed + (end - start):
+                return start + seconds - elapsed
+            elapsed += end - start
+        return self.kept_spans[-1][1] if self.kept_spans else seconds
+
+
+def decode_to_pcm(audio: bytes, sample_rate: int = SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes compressed audio to mono PCM with an ffmpeg subprocess.
+
+    :param audio: The audio, in any format ffmpeg reads.
+    :param sample_rate: The sample rate of the decoded audio.
+    :return: The samples as float32 between -1 and 1.
+    """
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise FileNotFoundError("ffmpeg is needed to decode audio but was not found on the PATH")
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(sample_rate), "pipe:1"],
+        input=audio, capture_output=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg could not decode the audio: {result.stderr.decode('utf-8', errors='replace').strip()}")
+    return np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+def frame_features(samples: np.ndarray, sample_rate: int = SAMPLE_RATE, frame_seconds: float = 0.032) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Computes the energy and spectral flatness of every frame, for all frames at once.
+
+    Spectral flatness is the geometric over the arithmetic mean of the power spectrum: close to 1
+    for noise, close to 0 for tones. Speech sits in between, sustained music near the bottom.
+
+    :param samples: The PCM samples.
+    :param sample_rate: Their sample rate.
+    :param frame_seconds: The frame length.
+    :return: The energy of every frame in dBFS, and its spectral flatness.
+    """
+    frame_length = int(sample_rate * frame_seconds)
+    count = len(samples) // frame_length
+    if count == 0:
+        return np.empty(0), np.empty(0)
+    frames = samples[:count * frame_length].reshape(count, frame_length)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    power = np.abs(np.fft.rfft(frames * np.hanning(frame_length), axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    return energy_db, flatness
+
+
+def find_speech_spans(
+        samples: np.ndarray,
+        sample_rate: int = SAMPLE_RATE,
+        window_seconds: float = 1.0,
+        min_gap_seconds: float = 3.0,
+        padding_seconds: float = 0.5,
+        silence_db: float = -50.0,
+        music_modulation_db: float = 3.0,
+        music_flatness: float = 0.05
+) -> List[Span]:
+    """
+    Finds the spans of a recording that may contain speech.
+
+    The recording is judged one window at a time. A window is silent when fewer than a fifth of
+    its frames rise clearly above the recording's noise floor. It sounds like music when nearly
+    all its frames are loud, their energy barely moves (speech rises and falls with every
+    syllable) and the spectrum is tonal. Everything else is kept; so are gaps shorter than
+    min_gap_seconds, as cutting them saves little and risks clipping words.
+
+    :param samples: The PCM samples.
+    :param sample_rate: Their sample rate.
+    :param window_seconds: The length of the windows judged.
+    :param min_gap_seconds: The shortest run of non-speech that is cut.
+    :param padding_seconds: Audio kept on either side of speech.
+    :param silence_db: Frames quieter than this are silent whatever the noise floor.
+    :param music_modulation_db: Windows whose loud frames vary less than this (standard deviation, dB) may be music.
+    :param music_flatness: Windows whose mean flatness is below this may be music.
+    :return: The spans to keep, in seconds.
+    """
+    frame_seconds = 0.032
+    energy_db, flatness = frame_features(samples, sample_rate=sample_rate, frame_seconds=frame_seconds)
+    duration = len(samples) / sample_rate
+    if len(energy_db) == 0:
+        return []
+
+    frames_per_window = max(int(window_seconds / frame_seconds), 1)
+    windows = len(energy_db) // frames_per_window
+    if windows == 0:
+        return [(0.0, duration)]
+    energy = energy_db[:windows * frames_per_window].reshape(windows, frames_per_window)
+    flat = flatness[:windows * frames_per_window].reshape(windows, frames_per_window)
+
+    noise_floor = np.percentile(energy_db, 10)
+    loud = energy > max(noise_floor + 10, silence_db)
+    active = loud.mean(axis=1)
+    # the spread of the loud frames' energy, NaN free for windows without loud frames
+    loud_energy = np.where(loud, energy, np.nan)
+    counts = loud.sum(axis=1)
+    modulation = np.zeros(windows)
+    has_loud = counts > 1
+    modulation[has_loud] = np.nanstd(loud_energy[has_loud], axis=1)
+
+    silent = active < 0.2
+    music = (active > 0.9) & (modulation < music_modulation_db) & (flat.mean(axis=1) < music_flatness)
+    keep = ~(silent | music)
+
+    # cut only runs of non-speech long enough to matter
+    window_length = frames_per_window * frame_seconds
+    spans = []
+    run_start = None
+    for index in range(windows + 1):
+        dropped = index < windows and not keep[index]
+        if dropped and run_start is None:
+            run_start = index
+        elif not dropped and run_start is not None:
+            if (index - run_start) * window_length >= min_gap_seconds:
+                # no padding is needed where the recording starts or ends
+                start = run_start * window_length + padding_seconds if run_start else 0.0
+                end = index * window_length - padding_seconds if index < windows else duration
+                spans.append((start, end))
+            run_start = None
+    kept, position = [], 0.0
+    for start, end in spans:
+        if end <= start:
+            continue
+        if start > position:
+            kept.append((position, start))
+        position = end
+    if position < duration:
+        kept.append((position, duration))
+    return kept
+
+
+def _cut_frames(audio: bytes, spans: List[Span]) -> Tuple[bytes, float]:
+    # one pass over the frames keeps every frame overlapping a span, slicing span by span would parse the recording once per span
+    pieces = []
+    elapsed = 0.0
+    index = 0
+    for frame in iter_frames(audio):
+        frame_end = elapsed + frame.seconds
+        while index < len(spans) and spans[index][1] <= elapsed:
+            index += 1
+        if index < len(spans) and frame_end > spans[index][0]:
+            pieces.append(audio[frame.offset:frame.offset + frame.length])
+        elapsed = frame_end
+    return b"".join(pieces), elapsed
+
+
+def trim_non_speech(audio: bytes, samples: Optional[np.ndarray] = None, sample_rate: int = SAMPLE_RATE, **kwargs) -> TrimResult:
+    """
+    Cuts the silence and music out of an MP3 recording before it is uploaded.
+
+    The audio is decoded to PCM (unless samples are given) and analysed with find_speech_spans.
+    The frames overlapping the kept spans are cut out of the original MP3 and joined, so nothing
+    is re-encoded. The result maps times in the trimmed audio back to the recording.
+
+    :param audio: The MP3 recording.
+    :param samples: The recording already decoded to PCM, to skip decoding.
+    :param sample_rate: The sample rate of the samples.
+    :param kwargs: Passed on to find_speech_spans.
+    :return: The trimmed audio and its time map.
+    """
+    logger = logging.getLogger(__name__)
+
+    start_time = time.monotonic()
+    if samples is None:
+        samples = decode_to_pcm(audio, sample_rate=sample_rate)
+    spans = find_speech_spans(samples, sample_rate=sample_rate, **kwargs)
+    trimmed_audio, original_seconds = _cut_frames(audio, spans)
+    if spans == [(0.0, len(samples) / sample_rate)]:
+        trimmed = TrimResult(audio=audio, kept_spans=[(0.0, original_seconds)], original_seconds=original_seconds, kept_seconds=original_seconds)
+    else:
+        trimmed = TrimResult(audio=trimmed_audio, kept_spans=spans, original_seconds=original_seconds or len(samples) / sample_rate,
+                             kept_seconds=sum(end - start for start, end in spans))
+    logger.info(f"Trimmed {trimmed.removed_fraction:.0%} of {original_seconds:.1f} seconds of audio as silence or music "
+                f"in {time.monotonic() - start_time:.2f} seconds.")
+    return trimmed
+
+
+def make_sample_clip(sample_rate: int = SAMPLE_RATE, seed: int = 7) -> Tuple[np.ndarray, List[Span]]:
+    """
+    Synthesises a test clip of talk, dead air and a music bed, with the true speech spans.
+
+    The "talk" is noise shaped like voiced speech: a buzz with formant-like resonances, switched on
+    and off at syllable rate with pauses between phrases. The music bed is a sustained chord.
+
+    :param sample_rate: The sample rate of the clip.
+    :param seed: Seeds the random parts, so the clip is the same on every run.
+    :return: The samples, and the spans that hold talk.
+    """
+    rng = np.random.default_rng(seed)
+
+    def talk(seconds: float) -> np.ndarray:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        pitch = 120 + 20 * np.sin(2 * np.pi * 0.5 * t)
+        buzz = np.sign(np.sin(2 * np.pi * np.cumsum(pitch) / sample_rate)) * 0.3
+        formants = sum(np.sin(2 * np.pi * f * t) for f in (500, 1500, 2500)) * 0.05
+        voiced = buzz * (1 + formants) + rng.normal(0, 0.05, len(t))
+        syllables = (np.sin(2 * np.pi * 4 * t) > -0.2).astype(np.float32)
+        phrases = (np.sin(2 * np.pi * 0.3 * t) > -0.8).astype(np.float32)
+        return (voiced * syllables * phrases * 0.5).astype(np.float32)
+
+    def dead_air(seconds: float) -> np.ndarray:
+        return rng.normal(0, 0.0005, int(seconds * sample_rate)).astype(np.float32)
+
+    def music(seconds: float) -> np.ndarray:
+        t = np.arange(int(seconds * sample_rate)) / sample_rate
+        chord = sum(np.sin(2 * np.pi * f * t) for f in (220.0, 277.2, 329.6, 440.0))
+        return (chord * 0.08).astype(np.float32)
+
+    parts = [("talk", talk(12)), ("air", dead_air(6)), ("music", music(20)), ("talk", talk(10)), ("air", dead_air(4)), ("talk", talk(8))]
+    speech, position = [], 0.0
+    for kind, part in parts:
+        seconds = len(part) / sample_rate
+        if kind == "talk":
+            speech.append((position, position + seconds))
+        position += seconds
+    return np.concatenate([part for _, part in parts]), speech
+
+
+if __name__ == "__main__":
+    from mp3_frames import make_synthetic_frames
+
+    logging.basicConfig(level=logging.INFO)
+    clip, speech = make_sample_clip()
+    # stand-in MP3 frames of the same length, so the cutting can run without ffmpeg
+    frames = make_synthetic_frames(seconds=len(clip) / SAMPLE_RATE)
+    result = trim_non_speech(frames, samples=clip)
+    print(f"talk: {speech}")
+    print(f"kept: {[(round(s, 1), round(e, 1)) for s, e in result.kept_spans]}")
+    print(f"removed {result.removed_fraction:.0%}, {len(frames)} -> {len(result.audio)} bytes")
@@ -0,0 +1,307 @@
+import functools
+import json
+import logging
+import os
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import numpy as np
+
+from audio_preprocess import SAMPLE_RATE, make_sample_clip, trim_non_speech
+from clients import configure_clients
+from fake_services import FakeChatServer, FakeStreamServer, FakeTextbeltServer, FakeTranscriptionServer, default_transcript
+from instrumentation import METRICS
+from mp3_frames import make_synthetic_frames
+from notifications import NotificationDispatcher
+from rate_limit import ProviderRateLimiter
+from stations import capture_stations
+from stream_capture import capture_stream
+
+# Where benchmark_pipeline appends its results, one JSON object per run
+RESULTS_PATH = "benchmark_results/results.jsonl"
+
+
+def benchmark_capture(streams: int = 4, seconds: float = 5, buffer_size: int = 64 * 1024, icy_metadata: bool = True) -> Dict[str, Any]:
+    """
+    Measures capture throughput and CPU cost per stream against a local, unthrottled fake stream.
+
+    Every stream is captured by its own thread into a temporary file. CPU time is measured per
+    capture thread, so the fake server running in the same process is not counted.
+
+    :param streams: The number of streams captured concurrently.
+    :param seconds: The duration of each capture.
+    :param buffer_size: The read buffer size passed to capture_stream.
+    :param icy_metadata: Whether the captures request and strip ICY metadata.
+    :return: The throughput in MB/s and CPU seconds per stream, averaged over the streams.
+    """
+    results = []
+    lock = threading.Lock()
+
+    with FakeStreamServer(bytes_per_second=None, write_size=64 * 1024) as server, tempfile.TemporaryDirectory() as directory:
+        def capture(index: int) -> None:
+            cpu_start = time.thread_time()
+            with open(os.path.join(directory, f"stream_{index}.mp3"), "wb") as fd:
+                stats = capture_stream(url=f"{server.url}/stream.mp3", duration=seconds,
+                                       on_audio=lambda audio, title: fd.write(audio),
+                                       buffer_size=buffer_size, icy_metadata=icy_metadata)
+            with lock:
+                results.append((stats, time.thread_time() - cpu_start))
+
+        threads = [threading.Thread(target=capture, args=(i,)) for i in range(streams)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    megabytes = [stats["bytes"] / 1e6 for stats, _ in results]
+    cpu_seconds = [cpu for _, cpu in results]
+    elapsed = [stats["seconds"] for stats, _ in results]
+    return {
+        "streams": streams,
+        "buffer_size": buffer_size,
+        "mb_per_second_per_stream": round(sum(mb / s for mb, s in zip(megabytes, elapsed)) / len(results), 2),
+        "cpu_seconds_per_stream": round(sum(cpu_seconds) / len(results), 3),
+        "cpu_seconds_per_mb": round(sum(cpu_seconds) / max(sum(megabytes), 1e-9), 4),
+    }
+
+
+def compare_buffer_sizes(buffer_sizes: List[int] = (1024, 16 * 1024, 64 * 1024, 256 * 1024), streams: int = 4, seconds: float = 5) -> List[Dict[str, Any]]:
+    """
+    Runs benchmark_capture once per buffer size and prints the results as a table.
+
+    :param buffer_sizes: The read buffer sizes to compare.
+    :param streams: The number of streams captured concurrently.
+    :param seconds: The duration of each capture.
+    :return: The result of every run.
+    """
+    results = [benchmark_capture(streams=streams, seconds=seconds, buffer_size=size) for size in buffer_sizes]
+    print(f"{'buffer':>10} {'MB/s/stream':>12} {'CPU s/stream':>13} {'CPU s/MB':>9}")
+    for result in results:
+        print(f"{result['buffer_size']:>10} {result['mb_per_second_per_stream']:>12} {result['cpu_seconds_per_stream']:>13} {result['cpu_seconds_per_mb']:>9}")
+    return results
+
+
+def benchmark_stations(stations: int = 24, seconds: int = 10, bytes_per_second: int = 16000) -> Dict[str, Any]:
+    """
+    Captures many live-paced fake stations in one process and reports the CPU they cost.
+
+    :param stations: The number of stations captured concurrently.
+    :param seconds: The capture duration.
+    :param bytes_per_second: The pace of each fake station (16000 is a 128 kbps stream).
+    :return: The total process CPU time and its share of one core.
+    """
+    servers = [FakeStreamServer(bytes_per_second=bytes_per_second).start() for _ in range(stations)]
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config = [{"name": f"station_{i}", "url": f"{server.url}/stream.mp3", "segment_seconds": 5, "overlap_seconds": 1,
+                       "icy_metadata": True, "skip_songs": False} for i, server in enumerate(servers)]
+            cpu_start = time.process_time()
+            start = time.monotonic()
+            results = capture_stations(stations=config, duration=seconds, base_directory=directory)
+            elapsed = time.monotonic() - start
+            cpu = time.process_time() - cpu_start
+    finally:
+        for server in servers:
+            server.stop()
+    # the fake servers run in this process too, so this is an upper bound for the captures alone
+    return {
+        "stations": stations,
+        "segments": sum(len(paths) for paths in results.values()),
+        "cpu_seconds": round(cpu, 3),
+        "core_share": round(cpu / elapsed, 3),
+    }
+
+
+def benchmark_preprocess(repeats: int = 10, upload_bytes_per_second: float = 2e6, seconds_per_audio_second: float = 0.005) -> Dict[str, Any]:
+    """
+    Measures how much audio trim_non_speech removes from a synthesized clip and models what that saves end to end.
+
+    The clip is not a broadcast recording: audio_preprocess.make_sample_clip synthesizes it from a
+    speech-like buzz, dead air and a sustained chord. It is repeated to the length of a typical
+    recording and paired with synthetic MP3 frames of the same duration, so the benchmark needs
+    neither ffmpeg nor the network. No transcription request is sent either: one is modelled as an
+    upload at upload_bytes_per_second followed by processing proportional to the audio's duration,
+    and slept through, with and without trimming first. The speedup is therefore that of the model,
+    only the preprocessing time is measured.
+
+    :param repeats: The number of times the one minute clip is repeated.
+    :param upload_bytes_per_second: The modelled upload bandwidth.
+    :param seconds_per_audio_second: The modelled transcription time per second of audio.
+    :return: The fraction of audio removed, the measured preprocessing time and the modelled end-to-end speedup.
+    """
+    clip, _ = make_sample_clip()
+    samples = np.tile(clip, repeats)
+    audio = make_synthetic_frames(seconds=len(samples) / SAMPLE_RATE)
+
+    def transcribe(data: bytes, seconds: float) -> None:
+        time.sleep(len(data) / upload_bytes_per_second + seconds * seconds_per_audio_second)
+
+    start = time.monotonic()
+    transcribe(audio, len(samples) / SAMPLE_RATE)
+    untrimmed = time.monotonic() - start
+
+    start = time.monotonic()
+    result = trim_non_speech(audio, samples=samples)
+    preprocess = time.monotonic() - start
+    transcribe(result.audio, result.kept_seconds)
+    trimmed = time.monotonic() - start
+    return {
+        "clip": "synthesized by audio_preprocess.make_sample_clip",
+        "audio_seconds": round(result.original_seconds, 1),
+        "removed_fraction": round(result.removed_fraction, 3),
+        "preprocess_seconds": round(preprocess, 3),
+        "modelled_untrimmed_seconds": round(untrimmed, 3),
+        "modelled_trimmed_seconds": round(trimmed, 3),
+        "modelled_speedup": round(untrimmed / trimmed, 2),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, timeout=10,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return result.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def benchmark_pipeline(
+        duration: int = 30,
+        segment_seconds: int = 10,
+        overlap_seconds: int = 2,
+        stream_speed: float = 1.0,
+        transcription_latency_seconds: float = 0.2,
+        seconds_per_audio_second: float = 0.005,
+        chat_latency_seconds: float = 0.3,
+        sms_latency_seconds: float = 0.1,
+        jitter_seconds: float = 0.1,
+        error_rate: float = 0.0,
+        announcement_rate: float = 0.3,
+        seed: int = 1,
+        label: str = "",
+        results_path: Optional[str] = RESULTS_PATH
+) -> Dict[str, Any]:
+    """
+    Runs main.main_pipelined end to end against local stand-ins for every external service.
+
+    The stream, the Groq transcription endpoint, the OpenAI chat endpoint and Textbelt are all
+    served from this process, with the latency, jitter and error rate given. The run happens in a
+    temporary working directory, so recordings, the transcript store and the cache start empty
+    and nothing is left behind; missing API keys are set to a placeholder for the run only, and
+    main logs to log.log in the directory the benchmark is started from. Stage latencies come
+    from the instrumentation spans, and memory is traced with tracemalloc, which slows the run
+    down somewhat; compare runs with each other, not with production timings.
+
+    :param duration: The capture duration in seconds.
+    :param segment_seconds: The length of each captured segment in seconds.
+    :param overlap_seconds: The audio shared by consecutive segments in seconds.
+    :param stream_speed: Seconds of audio the fake stream sends per second, to make segments bigger without waiting longer.
+    :param transcription_latency_seconds: The base latency of a transcription request.
+    :param seconds_per_audio_second: The transcription processing time per second of audio.
+    :param chat_latency_seconds: The latency of a chat completion.
+    :param sms_latency_seconds: The latency of a Textbelt request.
+    :param jitter_seconds: A random extra delay of up to this many seconds on every API request.
+    :param error_rate: The fraction of API requests answered with a 500.
+    :param announcement_rate: The chance a transcribed segment contains a code word announcement.
+    :param seed: Seeds the fake services, for repeatable runs.
+    :param label: A note stored with the results, for example the change being measured.
+    :param results_path: The JSON lines file the results are appended to, None to not store them.
+    :return: The throughput, per-stage latency percentiles and peak memory of the run.
+    """
+    config = {key: value for key, value in locals().items() if key not in ("label", "results_path")}
+    # imported before moving into the temporary directory: main opens log.log in the working directory on its
+    # first import, and a log file left open inside the temporary directory keeps it from being removed cleanly
+    from main import main_pipelined
+
+    results_path = os.path.abspath(results_path) if results_path else None
+    api_settings = {"jitter_seconds": jitter_seconds, "error_rate": error_rate, "error_status": 500, "seed": seed}
+    # the clients need some key, the caller's environment is restored afterwards
+    api_keys = {key: os.environ.get(key, "benchmark") for key in ("GROQ_API_KEY", "OPENAI_API_KEY", "TEXTBELT_API_KEY")}
+
+    stream = FakeStreamServer(bytes_per_second=int(16000 * stream_speed)).start()
+    transcription = FakeTranscriptionServer(transcriber=functools.partial(default_transcript, announcement_rate=announcement_rate),
+                                            latency_seconds=transcription_latency_seconds, seconds_per_audio_second=seconds_per_audio_second,
+                                            **api_settings).start()
+    chat = FakeChatServer(latency_seconds=chat_latency_seconds, **api_settings).start()
+    textbelt = FakeTextbeltServer(latency_seconds=sms_latency_seconds, jitter_seconds=jitter_seconds).start()
+    working_directory = os.getcwd()
+    try:
+        configure_clients(openai_base_url=chat.api_url, groq_base_url=transcription.url)
+        with patch.dict(os.environ, api_keys), tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            dispatcher = NotificationDispatcher(phone_numbers=["5550100"], textbelt_url=textbelt.text_url)
+            # the fake provider has no quota, only the latency is measured
+            rate_limiter = ProviderRateLimiter(requests_per_minute=60000, audio_seconds_per_hour=1e9)
+            METRICS.reset()
+            tracemalloc.start()
+            start = time.monotonic()
+            try:
+                responses = main_pipelined(url=f"{stream.url}/stream.mp3", duration=duration, segment_seconds=segment_seconds,
+                                           overlap_seconds=overlap_seconds, dispatcher=dispatcher, rate_limiter=rate_limiter)
+            finally:
+                elapsed = time.monotonic() - start
+                _, peak_bytes = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                os.chdir(working_directory)
+    finally:
+        configure_clients(openai_base_url=None, groq_base_url=None)
+        for server in (stream, transcription, chat, textbelt):
+            server.stop()
+
+    stages = METRICS.summary()["stages"]
+    segments = stages.get("transcription.recording", {}).get("count", 0)
+    result = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "label": label,
+        "commit": _git_commit(),
+        "config": config,
+        "seconds": round(elapsed, 3),
+        "segments": segments,
+        "segments_per_minute": round(segments / elapsed * 60, 2),
+        "audio_seconds_transcribed": round(transcription.audio_seconds, 1),
+        "transcription_requests": transcription.requests,
+        "chat_requests": chat.requests,
+        "sms_sent": len(textbelt.messages),
+        "responses": len(responses),
+        "peak_memory_mb": round(peak_bytes / 1e6, 2),
+        "stages": {name: {key: stats[key] for key in ("count", "errors", "p50_seconds", "p95_seconds", "p99_seconds")} for name, stats in stages.items()},
+    }
+    if results_path:
+        os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        with open(file=results_path, mode="a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+    return result
+
+
+def compare_pipeline_runs(results_path: str = RESULTS_PATH, last: int = 10, stages: tuple = ("transcription.request", "model.cascade", "sms.send", "air_to_alert")) -> List[Dict[str, Any]]:
+    """
+    Prints the most recent benchmark_pipeline results side by side.
+
+    :param results_path: The JSON lines file written by benchmark_pipeline.
+    :param last: The number of runs shown.
+    :param stages: The stages whose p95 latency is shown.
+    :return: The runs shown, oldest first.
+    """
+    with open(file=results_path, mode="r", encoding="utf-8") as f:
+        runs = [json.loads(line) for line in f if line.strip()][-last:]
+    header = f"{'timestamp':<20} {'commit':<8} {'label':<16} {'seg/min':>8} {'peak MB':>8}" + "".join(f" {stage + ' p95':>24}" for stage in stages)
+    print(header)
+    for run in runs:
+        p95s = "".join(f" {str(run['stages'].get(stage, {}).get('p95_seconds')):>24}" for stage in stages)
+        print(f"{run['timestamp']:<20} {str(run['commit']):<8} {run['label'][:16]:<16} {run['segments_per_minute']:>8} {run['peak_memory_mb']:>8}{p95s}")
+    return runs
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    compare_buffer_sizes()
+    print(benchmark_stations())
+    print(benchmark_preprocess())
+    print(json.dumps(benchmark_pipeline(), indent=4))
+    compare_pipeline_runs()
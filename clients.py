@@ -0,0 +1,209 @@
+import logging
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+if TYPE_CHECKING:
+    # the provider SDKs take a second or more to import, they are only imported when a client is first needed
+    import httpx
+    from groq import Groq
+    from openai import OpenAI
+
+# Connection pool and timeout settings used when the clients are created
+CLIENT_CONFIG = {
+    "pool_size": 10,
+    "keepalive_expiry": 300.0,
+    "connect_timeout": 10.0,
+    "timeout": 120.0,
+    # None uses the provider's default endpoint (or the OPENAI_BASE_URL / GROQ_BASE_URL environment variable)
+    "openai_base_url": None,
+    "groq_base_url": None,
+}
+
+_clients = {}
+_http_clients = {}
+_stats = {}
+_lock = threading.Lock()
+
+
+def configure_clients(**settings: Any) -> None:
+    """
+    Changes the connection pool and timeout settings.
+
+    Clients that were already created are closed, so the next call to a getter builds them with the new settings.
+
+    :param settings: Any of the keys of CLIENT_CONFIG.
+    """
+    unknown = set(settings) - set(CLIENT_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown client settings: {', '.join(sorted(unknown))}")
+    close_clients()
+    CLIENT_CONFIG.update(settings)
+
+
+def _make_httpx_client(name: str) -> "httpx.Client":
+    import httpx
+
+    with _lock:
+        stats = _stats.setdefault(name, {"requests": 0, "connections": 0})
+    # holds only the streams of open connections, a closed connection's stream drops out once it is collected
+    seen_streams = weakref.WeakSet()
+
+    def on_response(response: "httpx.Response") -> None:
+        # a network stream not seen before means a new connection (and TLS handshake) was made
+        stream = response.extensions.get("network_stream")
+        with _lock:
+            stats["requests"] += 1
+            if stream is not None and stream not in seen_streams:
+                seen_streams.add(stream)
+                stats["connections"] += 1
+
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=CLIENT_CONFIG["pool_size"],
+            max_keepalive_connections=CLIENT_CONFIG["pool_size"],
+            keepalive_expiry=CLIENT_CONFIG["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(CLIENT_CONFIG["timeout"], connect=CLIENT_CONFIG["connect_timeout"]),
+        event_hooks={"response": [on_response]},
+    )
+    return http_client
+
+
+def _get(name: str, factory) -> Any:
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    # the SDK import and client construction take a second or more, so they run outside the lock
+    # every response hook takes; two threads may both build a client, only the first one is kept
+    created, http_client = factory()
+    with _lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = created
+            if http_client is not None:
+                _http_clients[name] = http_client
+            created = None
+    if created is not None:
+        created.close()
+    return client
+
+
+def get_openai_client() -> "OpenAI":
+    """
+    Returns the shared OpenAI client, importing the SDK and creating the client on first use.
+
+    :return: An OpenAI client whose connections are kept alive between requests.
+    """
+    def make_client() -> Tuple["OpenAI", "httpx.Client"]:
+        from openai import OpenAI
+        http_client = _make_httpx_client("openai")
+        return OpenAI(base_url=CLIENT_CONFIG["openai_base_url"], http_client=http_client), http_client
+
+    return _get("openai", make_client)
+
+
+def get_groq_client() -> "Groq":
+    """
+    Returns the shared Groq client, importing the SDK and creating the client on first use.
+
+    :return: A Groq client whose connections are kept alive between requests.
+    """
+    def make_client() -> Tuple["Groq", "httpx.Client"]:
+        from groq import Groq
+        http_client = _make_httpx_client("groq")
+        return Groq(base_url=CLIENT_CONFIG["groq_base_url"], http_client=http_client), http_client
+
+    return _get("groq", make_client)
+
+
+class _TimeoutAdapter(HTTPAdapter):
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (CLIENT_CONFIG["connect_timeout"], CLIENT_CONFIG["timeout"])
+        return super().send(request, **kwargs)
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the shared requests session used for plain HTTP APIs such as Textbelt, creating it on first use.
+
+    :return: A session with a keep-alive connection pool and default timeouts.
+    """
+    def make_session() -> Tuple[requests.Session, None]:
+        session = requests.Session()
+        adapter = _TimeoutAdapter(pool_connections=CLIENT_CONFIG["pool_size"], pool_maxsize=CLIENT_CONFIG["pool_size"])
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session, None
+
+    return _get("http", make_session)
+
+
+def warm_up(textbelt_url: Optional[str] = "https://textbelt.com/text") -> None:
+    """
+    Opens a connection to every provider ahead of time, so the first real request does not pay for the TLS handshake.
+
+    The warm-up requests are unauthenticated HEAD requests; their responses are ignored.
+
+    :param textbelt_url: The Textbelt endpoint to connect to, or None to skip it.
+    """
+    logger = logging.getLogger(__name__)
+
+    targets = [("openai", get_openai_client), ("groq", get_groq_client)]
+    if textbelt_url:
+        targets.append(("http", get_http_session))
+    for name, getter in targets:
+        try:
+            client = getter()
+            if name == "http":
+                client.head(textbelt_url)
+            else:
+                _http_clients[name].head(str(client.base_url))
+            logger.info(f"Warmed up {name} connection.")
+        except Exception as e:
+            logger.error(f"Failed to warm up {name} connection: {type(e).__name__}, {e}")
+
+
+def connection_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Reports how many requests each client sent and how many connections it had to open for them.
+
+    :return: The requests and connections per client; requests minus connections were served on a reused connection.
+    """
+    with _lock:
+        stats = {name: dict(counts) for name, counts in _stats.items()}
+    session = _clients.get("http")
+    if session is not None:
+        requests_sent = 0
+        connections = 0
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        stats["http"] = {"requests": requests_sent, "connections": connections}
+    return stats
+
+
+def log_connection_stats() -> None:
+    """Logs the connection reuse statistics of every client."""
+    logger = logging.getLogger(__name__)
+    for name, counts in connection_stats().items():
+        reused = counts["requests"] - counts["connections"]
+        logger.info(f"Client {name}: {counts['requests']} request(s), {counts['connections']} connection(s), {max(reused, 0)} reused.")
+
+
+def close_clients() -> None:
+    """Closes every shared client and its connections."""
+    with _lock:
+        clients = list(_clients.values())
+        _clients.clear()
+        _http_clients.clear()
+        _stats.clear()
+    for client in clients:
+        client.close()
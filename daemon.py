@@ -0,0 +1,459 @@
+import json
+import logging
+import os
+import shutil
+import signal
+import threading
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as dtime
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional
+
+from dotenv import load_dotenv
+
+from clients import get_groq_client, log_connection_stats, warm_up
+from detection import detect_candidate_announcements
+from hedging import HedgedExecutor
+from instrumentation import export_metrics, span
+from journal import STAGES, StageJournal
+from models import log_cascade_stats, parse_code_word, run_cascade
+from notifications import NotificationDispatcher, alert_code_word
+from pipeline import Pipeline, Stage
+from prompts import SYSTEM_PROMPT, build_transcript_context, build_user_prompt
+from rate_limit import ProviderRateLimiter
+from stations import load_stations
+from stream_capture import capture_segments, publish_recording
+from timeline import log_air_lag
+from transcript_store import CheckpointTracker, TranscriptStore
+from transcription_cache import TranscriptionCache
+from transcriptions import save_response, store_transcription, transcribe_recording_timed
+
+_WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+# When contests usually run, used when stations.json has no "schedule"
+DEFAULT_SCHEDULE = [
+    {"name": "morning drive", "days": "mon-fri", "start": "06:00", "end": "10:00"},
+    {"name": "afternoon drive", "days": "mon-fri", "start": "15:00", "end": "19:00"},
+    {"name": "weekend", "days": "sat-sun", "start": "10:00", "end": "16:00"},
+]
+
+
+class Daypart(NamedTuple):
+    """A recurring part of the broadcast week during which the stream is captured."""
+    name: str
+    days: FrozenSet[int]
+    start: dtime
+    end: dtime
+
+
+class CaptureWindow(NamedTuple):
+    """One occurrence of one or more adjoining dayparts."""
+    start: datetime
+    end: datetime
+    names: List[str]
+
+
+def parse_days(days: str) -> FrozenSet[int]:
+    """
+    Parses a set of weekdays such as "mon-fri", "sat,sun", "tue" or "daily".
+
+    :param days: The weekdays, as three letter names, ranges and commas.
+    :return: The weekdays as numbers, Monday being 0.
+    """
+    if days.strip().lower() == "daily":
+        return frozenset(range(7))
+    result = set()
+    for part in days.lower().replace(" ", "").split(","):
+        first, _, last = part.partition("-")
+        if first not in _WEEKDAYS or (last and last not in _WEEKDAYS):
+            raise ValueError(f"Unknown weekday in {days!r}, use {', '.join(_WEEKDAYS)}")
+        start, end = _WEEKDAYS.index(first), _WEEKDAYS.index(last or first)
+        # a range may wrap around the weekend, as in "fri-mon"
+        result.update((start + i) % 7 for i in range((end - start) % 7 + 1))
+    return frozenset(result)
+
+
+def parse_schedule(entries: List[Dict[str, Any]]) -> List[Daypart]:
+    """
+    Parses the dayparts of a schedule.
+
+    Every entry has "days" (see parse_days), "start" and "end" as "HH:MM", and optionally a "name".
+    A daypart whose end is not after its start runs past midnight.
+
+    :param entries: The schedule entries.
+    :return: The dayparts.
+    """
+    dayparts = []
+    for entry in entries:
+        try:
+            start = datetime.strptime(entry["start"], "%H:%M").time()
+            end = datetime.strptime(entry["end"], "%H:%M").time()
+        except (KeyError, ValueError) as e:
+            raise ValueError(f"Schedule entries need a start and an end as HH:MM: {entry}") from e
+        dayparts.append(Daypart(name=entry.get("name", f"{entry['start']}-{entry['end']}"), days=parse_days(entry.get("days", "daily")), start=start, end=end))
+    return dayparts
+
+
+def load_schedule(config_path: str = "stations.json") -> List[Daypart]:
+    """
+    Loads the capture schedule from the "schedule" list of the stations config, or DEFAULT_SCHEDULE when it has none.
+
+    :param config_path: The path of the config file.
+    :return: The dayparts.
+    """
+    entries = DEFAULT_SCHEDULE
+    if os.path.exists(config_path):
+        with open(file=config_path, mode="r", encoding="utf-8") as f:
+            entries = json.load(f).get("schedule") or DEFAULT_SCHEDULE
+    return parse_schedule(entries)
+
+
+def upcoming_windows(schedule: List[Daypart], now: datetime, days: int = 8) -> List[CaptureWindow]:
+    """
+    Lists the capture windows that have not ended yet, joining dayparts that touch or overlap.
+
+    :param schedule: The dayparts.
+    :param now: The current time.
+    :param days: How many days ahead to look.
+    :return: The windows, in time order. The first one may already have started.
+    """
+    occurrences = []
+    # start a day back, for dayparts that began yesterday and run past midnight
+    for offset in range(-1, days):
+        day: date = now.date() + timedelta(days=offset)
+        for part in schedule:
+            if day.weekday() not in part.days:
+                continue
+            start = datetime.combine(day, part.start)
+            end = datetime.combine(day if part.end > part.start else day + timedelta(days=1), part.end)
+            if end > now:
+                occurrences.append((start, end, part.name))
+    windows = []
+    for start, end, name in sorted(occurrences):
+        if windows and start <= windows[-1].end:
+            last = windows[-1]
+            windows[-1] = CaptureWindow(start=last.start, end=max(last.end, end), names=last.names + [name])
+        else:
+            windows.append(CaptureWindow(start=start, end=end, names=[name]))
+    return windows
+
+
+class RadioDaemon:
+    """
+    A resident process that captures a station during its scheduled dayparts and keeps every
+    recording moving through transcription, detection and notification across restarts.
+
+    Between windows the process sleeps with its clients, cache and stores loaded, so a window
+    starts without paying for interpreter start-up or the provider SDK imports again. Every
+    recording's stage is committed to a StageJournal as it completes. On start-up, segments left
+    in the in-progress directory by a crash are published as they are (a truncated MP3 is still
+    playable up to its last whole frame) and every unfinished recording is resumed at the stage it
+    had reached: audio already transcribed is never sent again, and a live broadcast that was
+    missed cannot be captured again anyway. The alert of a recording that crashed between the
+    alert going out and its stage being committed may be sent twice; it is never lost.
+    """
+
+    def __init__(
+            self,
+            url: str,
+            schedule: List[Daypart],
+            station: str = "KQMV",
+            segment_seconds: int = 60,
+            overlap_seconds: int = 5,
+            base_directory: str = "recordings",
+            store_path: str = "transcriptions/transcripts.db",
+            max_attempts: int = 3,
+            dispatcher: Optional[NotificationDispatcher] = None,
+            rate_limiter: Optional[ProviderRateLimiter] = None
+    ):
+        """
+        :param url: The URL of the station's stream.
+        :param schedule: The dayparts to capture.
+        :param station: The station name, recorded with its transcripts.
+        :param segment_seconds: The length of each captured segment in seconds.
+        :param overlap_seconds: The audio shared by consecutive segments in seconds.
+        :param base_directory: The directory holding the in_progress, completed and archive directories and the journal.
+        :param store_path: The transcript store.
+        :param max_attempts: The number of times a failing recording is tried before it is abandoned and the checkpoint moves past it.
+        :param dispatcher: The dispatcher the alerts are sent with, defaults to one configured from the environment.
+        :param rate_limiter: The transcription rate limiter, defaults to Groq's free tier limits.
+        """
+        self.url = url
+        self.schedule = schedule
+        self.station = station
+        self.segment_seconds = segment_seconds
+        self.overlap_seconds = overlap_seconds
+        self.in_progress_directory = os.path.join(base_directory, "in_progress")
+        self.completed_directory = os.path.join(base_directory, "completed")
+        self.archive_directory = os.path.join(base_directory, "archive")
+        for directory in (self.in_progress_directory, self.completed_directory, self.archive_directory):
+            os.makedirs(directory, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.journal = StageJournal(path=os.path.join(base_directory, "journal.db"))
+        self.store = TranscriptStore(path=store_path)
+        # transcription runs on two workers, so segments reach detection out of order
+        self.checkpoint = CheckpointTracker(store=self.store, name="detector")
+        self.dispatcher = dispatcher or NotificationDispatcher.from_env(save_request_response=True)
+        self.cache = TranscriptionCache()
+        self.rate_limiter = rate_limiter or ProviderRateLimiter()
+        self.transcription_executor = HedgedExecutor(name="groq", deadline_seconds=120)
+        self.model_executor = HedgedExecutor(name="openai", deadline_seconds=60)
+        self._stop_event = threading.Event()
+        self._pipeline: Optional[Pipeline] = None
+
+    @classmethod
+    def from_config(cls, config_path: str = "stations.json", station: Optional[str] = None, **kwargs) -> "RadioDaemon":
+        """
+        Builds a daemon for one station of the stations config, with the config's schedule.
+
+        :param config_path: The path of the config file.
+        :param station: The name of the station, defaults to the first one.
+        :param kwargs: Passed on to the constructor.
+        :return: The daemon.
+        """
+        stations = load_stations(config_path=config_path)
+        entry = next((s for s in stations if station is None or s["name"] == station), None)
+        if entry is None:
+            raise ValueError(f"Station {station!r} is not in {config_path}")
+        return cls(url=entry["url"], schedule=load_schedule(config_path=config_path), station=entry["name"],
+                   segment_seconds=entry["segment_seconds"], overlap_seconds=entry["overlap_seconds"], **kwargs)
+
+    def recover(self) -> List[str]:
+        """
+        Brings the recordings left behind by an earlier process back under the journal.
+
+        Segments still in the in-progress directory are published when they hold any bytes and
+        removed when empty; a crash can cut a segment anywhere, even before its first whole frame
+        or in the middle of a stream that is not MP3, so its content is not checked. Published
+        recordings the journal does not know yet are added to it as captured.
+
+        :return: The names of every unfinished recording, oldest first.
+        """
+        logger = logging.getLogger(__name__)
+
+        for file_name in sorted(os.listdir(self.in_progress_directory)):
+            path = os.path.join(self.in_progress_directory, file_name)
+            if os.path.getsize(path) > 0:
+                logger.info(f"Publishing {file_name}, left in progress by an earlier run.")
+                publish_recording(in_process_filepath=path, completed_recording_directory=self.completed_directory)
+            else:
+                os.remove(path)
+        for file_name in sorted(os.listdir(self.completed_directory)):
+            if self.journal.get(file_name) is None:
+                self.journal.advance(file_name, "captured", path=os.path.join(self.completed_directory, file_name))
+        entries = self.journal.unfinished(max_attempts=self.max_attempts)
+        for entry in entries:
+            if entry.stage == "transcribed":
+                self.checkpoint.register(entry.segment_id)
+        names = [entry.name for entry in entries]
+        if names:
+            logger.info(f"Resuming {len(names)} unfinished recording(s).")
+        return names
+
+    def _failed(self, name: str, stage: str, e: Exception, segment_id: Optional[int] = None) -> None:
+        logger = logging.getLogger(__name__)
+        attempts = self.journal.record_failure(name, f"{stage}: {type(e).__name__}, {e}")
+        if attempts >= self.max_attempts:
+            logger.error(f"Giving up on {name} after {attempts} failed attempt(s) to {stage} it.")
+            self.journal.abandon(name)
+            if segment_id is not None:
+                # it is not retried, so it must not hold the checkpoint below every later segment
+                self.checkpoint.done(segment_id)
+
+    def transcribe(self, name: str) -> Optional[str]:
+        """
+        Transcribes a recording into the transcript store, unless it got that far before.
+
+        :param name: The recording's file name.
+        :return: The name, for the next stage.
+        """
+        logger = logging.getLogger(__name__)
+
+        entry = self.journal.get(name)
+        if STAGES.index(entry.stage) >= STAGES.index("transcribed"):
+            return name
+        full_path = os.path.join(self.completed_directory, name)
+        segment_id = None
+        try:
+            # the process may have died between storing the transcript and journaling it
+            segment = self.store.find_source(name, station=self.station)
+            if segment is not None:
+                segment_id = segment.id
+                self.checkpoint.register(segment_id)
+            else:
+                text, timeline, model = transcribe_recording_timed(client=get_groq_client(), full_path=full_path, cache=self.cache, rate_limiter=self.rate_limiter,
+                                                                   executor=self.transcription_executor, fallback_model="whisper-large-v3-turbo", trim_non_speech=True)
+                with self.checkpoint.lock:
+                    segment_id = store_transcription(store=self.store, text=text, full_path=full_path, station=self.station, model=model, timeline=timeline)
+                    self.checkpoint.register(segment_id)
+            if os.path.exists(full_path):
+                shutil.move(full_path, os.path.join(self.archive_directory, name))
+                logger.info(f"{name} moved to {self.archive_directory}")
+        except Exception as e:
+            self._failed(name, "transcribe", e, segment_id=segment_id)
+            raise
+        self.journal.advance(name, "transcribed", path=os.path.join(self.archive_directory, name), segment_id=segment_id)
+        return name
+
+    def detect(self, name: str) -> Optional[str]:
+        """
+        Checks the transcript of a recording for an announcement, alerting as soon as the model names the code word.
+
+        A failed model request is recorded as a failed attempt and leaves the recording transcribed,
+        so the next window retries it; only a transcript found to hold no announcement is done.
+
+        :param name: The recording's file name.
+        :return: The name when there is a response to notify about, None otherwise.
+        """
+        entry = self.journal.get(name)
+        if entry.stage == "detected":
+            return name
+        if entry.stage == "done":
+            return None
+        try:
+            segment = self.store.get(entry.segment_id)
+            text = segment.text if segment is not None else ""
+            with span("detection"):
+                hits = detect_candidate_announcements(text=text)
+            if not hits:
+                self.checkpoint.done(entry.segment_id)
+                self.journal.advance(name, "done")
+                return None
+            timeline = self.store.get_timeline(entry.segment_id)
+            lag = log_air_lag(timeline=timeline, text=text, char_offset=hits[0].start) if timeline is not None else None
+            aired_at = None if lag is None else time.time() - lag
+            context = build_transcript_context(text=text, hits=hits)
+            response = run_cascade(system_prompt=SYSTEM_PROMPT, user_prompt=build_user_prompt(text_transcript=context), text=context,
+                                   on_code_word=lambda word: alert_code_word(dispatcher=self.dispatcher, word=word, station=self.station, aired_at=aired_at),
+                                   executor=self.model_executor)
+        except Exception as e:
+            self._failed(name, "detect", e, segment_id=entry.segment_id)
+            raise
+        self.checkpoint.done(entry.segment_id)
+        # None means the cascade rejected the transcript, a failed request raised above
+        if response is None:
+            self.journal.advance(name, "done")
+            return None
+        self.journal.advance(name, "detected", response=response)
+        return name
+
+    def notify(self, name: str) -> str:
+        """
+        Saves the model's response for a recording and sends it when the code word alert could not be.
+
+        :param name: The recording's file name.
+        :return: The response.
+        """
+        logger = logging.getLogger(__name__)
+
+        response = self.journal.get(name).response
+        try:
+            save_response(model_response=response, save_dir="responses")
+            if parse_code_word(response) is None:
+                # the code word alert already went out while the response streamed, unless the format was not followed
+                self.dispatcher.dispatch(message=response)
+        except Exception as e:
+            self._failed(name, "notify", e)
+            raise
+        self.journal.advance(name, "done")
+        logger.info(f"model response: {response}")
+        return response
+
+    def run_window(self, end: Optional[datetime] = None) -> list:
+        """
+        Resumes every unfinished recording and, until end, captures new ones, all through one pipeline.
+
+        :param end: When to stop capturing, None to only work through the unfinished recordings.
+        :return: The model responses of the window.
+        """
+        started_at = datetime.now()
+        unfinished = self.recover()
+        duration = int((end - datetime.now()).total_seconds()) if end is not None else 0
+
+        def produce(emit) -> None:
+            for name in unfinished:
+                emit(name)
+            if duration <= 0:
+                return
+
+            def on_segment(path: str) -> None:
+                name = os.path.basename(path)
+                self.journal.advance(name, "captured", path=path)
+                emit(name)
+
+            capture_segments(url=self.url, duration=duration, segment_seconds=self.segment_seconds, overlap_seconds=self.overlap_seconds,
+                             in_process_recording_directory=self.in_progress_directory, completed_recording_directory=self.completed_directory,
+                             on_segment=on_segment)
+
+        if not unfinished and duration <= 0:
+            return []
+        warm_up(textbelt_url=self.dispatcher.textbelt_url)
+        self._pipeline = Pipeline(producer=produce, stages=[
+            Stage(name="transcription", func=self.transcribe, workers=2),
+            Stage(name="detection", func=self.detect),
+            Stage(name="notification", func=self.notify),
+        ])
+        try:
+            responses = self._pipeline.run()
+        finally:
+            self._pipeline = None
+        self.cache.log_stats()
+        log_cascade_stats()
+        self.transcription_executor.log_stats()
+        self.model_executor.log_stats()
+        log_connection_stats()
+        # one summary per window, the daemon's registry keeps counting across windows
+        export_metrics(summary_name=f"daemon_{started_at:%Y%m%d_%H%M%S_%f}", mode="daemon", window_start=started_at.isoformat(), window_end=datetime.now().isoformat())
+        return responses
+
+    def run_forever(self) -> None:
+        """Finishes what an earlier process left behind, then captures every scheduled window until stopped."""
+        logger = logging.getLogger(__name__)
+
+        self.run_window()
+        while not self._stop_event.is_set():
+            now = datetime.now()
+            windows = upcoming_windows(self.schedule, now)
+            if not windows:
+                logger.error("The schedule has no capture windows, stopping.")
+                return
+            window = windows[0]
+            if window.start > now:
+                logger.info(f"Next capture window ({', '.join(window.names)}) starts at {window.start:%a %H:%M}, sleeping.")
+                # wake up at the start, or earlier when stopped; the schedule is checked again either way
+                self._stop_event.wait(min((window.start - now).total_seconds(), 3600))
+                continue
+            logger.info(f"Capturing {self.station} for {', '.join(window.names)} until {window.end:%H:%M}.")
+            self.run_window(end=window.end)
+        self.close()
+
+    def stop(self) -> None:
+        """Asks the daemon to stop. Queued recordings finish their stages, the rest is resumed on the next start."""
+        self._stop_event.set()
+        pipeline = self._pipeline
+        if pipeline is not None:
+            pipeline.stop()
+
+    def close(self) -> None:
+        self.dispatcher.close()
+        self.transcription_executor.close()
+        self.model_executor.close()
+        self.store.close()
+        self.journal.close()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("log.log", mode='a'),  # Log to file
+            logging.StreamHandler()  # Also log to console
+        ]
+    )
+    daemon = RadioDaemon.from_config()
+    # stop cleanly on Ctrl+C and on the service manager's SIGTERM
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    daemon.run_forever()
@@ -0,0 +1,126 @@
+import logging
+import re
+from typing import Iterable, List, NamedTuple, Optional, Pattern
+
+# Words the DJ uses in front of "word" when announcing it, plus the ways Whisper tends to misspell them
+TRIGGER_QUALIFIERS = [
+    "code", "coat", "coats", "cold", "coed", "kode", "coke", "co",
+    "magic", "majic", "magik",
+    "entry", "entree", "entrée", "entri",
+    "winning", "winnin", "wining", "win",
+    "secret", "key", "keyword", "contest", "bonus", "special",
+]
+# Variants of "word" itself
+WORD_VARIANTS = ["word", "words", "werd", "wurd", "ward", "whirred"]
+# Whole phrases that announce a word without any of the qualifiers above
+TRIGGER_PHRASES = [
+    r"text\s+(?:the\s+word|in\s+the\s+word|it\s+in)",
+    r"word\s+of\s+the\s+(?:day|hour)",
+    r"key\s*words?",
+    r"code\s*words?",
+]
+# The score every trigger phrase adds, see score_announcement
+TRIGGER_HIT_WEIGHT = 0.2
+
+# Signs that a window really announces a word, with the score each one adds in score_announcement
+ANNOUNCEMENT_SIGNALS = [
+    # "the code word is vampire", "the word for this hour is vampire"
+    (re.compile(r"\bword\b(?:\s+(?:for|of)\s+(?:\w+\s+){0,3}?)?\s*(?:is|was)\s+['\"]?[a-z0-9]+", re.IGNORECASE), 0.35),
+    # "text it in to 92.5", "text vampire to 57500"
+    (re.compile(r"\btext(?:\s+\w+){0,4}\s+to\s+\d", re.IGNORECASE), 0.25),
+    (re.compile(r"\b(?:tickets?|qualify|contest|winner|caller|enter)\b", re.IGNORECASE), 0.1),
+]
+
+
+class TriggerHit(NamedTuple):
+    """A trigger phrase found in a transcript, with the character offsets of the match."""
+    start: int
+    end: int
+    phrase: str
+
+
+def build_trigger_pattern(qualifiers: Iterable[str] = TRIGGER_QUALIFIERS, word_variants: Iterable[str] = WORD_VARIANTS, phrases: Iterable[str] = TRIGGER_PHRASES) -> Pattern:
+    """
+    Compiles the trigger phrases into a single case-insensitive pattern.
+
+    All alternatives are matched in one pass over the text. The qualifier and "word" must be
+    separate words, hyphenated or separated by whitespace ("code-word", "code word"), so ordinary
+    words that happen to start with a qualifier ("coward", "windward") do not match; the usual
+    compounds ("codeword", "keyword") are listed in TRIGGER_PHRASES.
+
+    :param qualifiers: Words that precede "word" in an announcement.
+    :param word_variants: Spellings of "word" itself.
+    :param phrases: Additional regular expressions matched as-is.
+    :return: The compiled pattern.
+    """
+    # longest alternatives first so "keyword" wins over "key"
+    qualifier_group = "|".join(re.escape(q) for q in sorted(set(qualifiers), key=len, reverse=True))
+    word_group = "|".join(re.escape(w) for w in sorted(set(word_variants), key=len, reverse=True))
+    alternatives = [rf"(?:{qualifier_group})\b[\s\-]+\b(?:{word_group})"] + list(phrases)
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+TRIGGER_PATTERN = build_trigger_pattern()
+
+
+def find_trigger_phrases(text: str, pattern: Optional[Pattern] = None) -> List[TriggerHit]:
+    """
+    Finds every trigger phrase in a transcript.
+
+    :param text: The transcript to search.
+    :param pattern: The compiled pattern to use, defaults to TRIGGER_PATTERN.
+    :return: The hits, in order of appearance.
+    """
+    if not text:
+        return []
+    pattern = pattern or TRIGGER_PATTERN
+    return [TriggerHit(start=m.start(), end=m.end(), phrase=m.group(0)) for m in pattern.finditer(text)]
+
+
+def detect_candidate_announcements(text: str, pattern: Optional[Pattern] = None) -> List[TriggerHit]:
+    """
+    Checks a transcript for a possible code word announcement before it is sent to a model.
+
+    :param text: The transcript to search.
+    :param pattern: The compiled pattern to use, defaults to TRIGGER_PATTERN.
+    :return: The hits found; an empty list means the model call can be skipped.
+    """
+    logger = logging.getLogger(__name__)
+
+    hits = find_trigger_phrases(text=text, pattern=pattern)
+    if hits:
+        phrases = ", ".join(sorted({hit.phrase.lower() for hit in hits}))
+        logger.info(f"Found {len(hits)} trigger phrase(s) in transcript: {phrases}.")
+    else:
+        logger.info("No trigger phrases found in transcript.")
+    return hits
+
+
+def score_announcement(text: str, hits: Optional[List[TriggerHit]] = None) -> float:
+    """
+    Scores how likely a transcript window is to announce a code word, without calling a model.
+
+    Every trigger phrase adds to the score (at most two count), as does every announcement signal
+    that matches, so a window that only mentions a "code word" in passing scores low while
+    "the code word is vampire, text it to 92.5" scores high.
+
+    :param text: The transcript window.
+    :param hits: The trigger phrases already found in the window, found again when None.
+    :return: A score between 0 and 1.
+    """
+    if not text:
+        return 0.0
+    if hits is None:
+        hits = find_trigger_phrases(text=text)
+    score = TRIGGER_HIT_WEIGHT * min(len(hits), 2)
+    for pattern, weight in ANNOUNCEMENT_SIGNALS:
+        if pattern.search(text):
+            score += weight
+    return round(min(score, 1.0), 3)
+
+
+if __name__ == "__main__":
+    sample = "That was Olivia Rodrigo. Your cold word for this hour is vampire, text it in to 92.5 now. The Code-Word again is vampire."
+    for hit in find_trigger_phrases(sample):
+        print(hit)
+    print(f"announcement score: {score_announcement(sample)}")
@@ -1,44 +1,79 @@
 import os
 import logging
 import smtplib
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-def send_email(subject: str, body: str, to_emails: List[str], from_email: str, password: str) -> None:
+def send_email_batch(
+        subject: str,
+        body: str,
+        to_emails: List[str],
+        from_email: str,
+        password: Optional[str],
+        smtp_host: str = 'smtp.gmail.com',
+        smtp_port: int = 587,
+        use_tls: bool = True
+) -> Dict[str, float]:
     """
-    Send an email to multiple recipients using Gmail's SMTP server.
+    Send an email to multiple recipients over a single SMTP connection.
 
     :param subject: The subject of the email
     :param body: The body of the email
     :param to_emails: A list of recipient email addresses
-    :param from_email: The sender's email address (must be a Gmail address)
-    :param password: The password for the sender's email account
+    :param from_email: The sender's email address
+    :param password: The password for the sender's email account, or None to skip logging in
+    :param smtp_host: The SMTP server
+    :param smtp_port: The SMTP server's port
+    :param use_tls: Whether to upgrade the connection with STARTTLS
+    :return: The seconds from the start of the batch until each recipient's message was accepted
+    :raises smtplib.SMTPException: If the connection, login or a send fails
     """
-    logger = logging.getLogger(__name__)
-    try:
-        # Create the email message
-        msg = MIMEMultipart()
-        msg['From'] = from_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'plain'))
+    start_time = time.monotonic()
+    latencies = {}
+
+    # Create the email message
+    msg = MIMEMultipart()
+    msg['From'] = from_email
+    msg['Subject'] = subject
+    msg.attach(MIMEText(body, 'plain'))
 
-        # Set up the server
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(from_email, password)
+    # Set up the server
+    with smtplib.SMTP(smtp_host, smtp_port) as server:
+        if use_tls:
+            server.starttls()
+        if password:
+            server.login(from_email, password)
 
         # Send email to each recipient
         for to_email in to_emails:
+            # replace, rather than add to, the previous recipient's header
+            del msg['To']
             msg['To'] = to_email
             server.send_message(msg)
+            latencies[to_email] = time.monotonic() - start_time
+    return latencies
+
+
+def send_email(subject: str, body: str, to_emails: List[str], from_email: str, password: str) -> None:
+    """
+    Send an email to multiple recipients using Gmail's SMTP server.
 
-        server.quit()
+    :param subject: The subject of the email
+    :param body: The body of the email
+    :param to_emails: A list of recipient email addresses
+    :param from_email: The sender's email address (must be a Gmail address)
+    :param password: The password for the sender's email account
+    """
+    logger = logging.getLogger(__name__)
+    try:
+        send_email_batch(subject=subject, body=body, to_emails=to_emails, from_email=from_email, password=password)
         print("Emails sent successfully.")
         logger.info(f"Emails sent successfully.")
     except Exception as e:
@@ -0,0 +1,530 @@
+import json
+import logging
+import random
+import re
+import socketserver
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+from mp3_frames import audio_duration, make_synthetic_frames
+
+
+class FakeServer:
+    """
+    Base class for the local stand-ins used by the benchmarks, serving on 127.0.0.1 from a background thread.
+
+    Subclasses provide the request handler class. Use as a context manager, or call start and stop.
+    """
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, port: int = 0):
+        """
+        :param port: The port to listen on, 0 picks a free one.
+        """
+        self.port = port
+        self.requests = 0
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def start(self) -> "FakeServer":
+        fake = self
+
+        class Handler(self.handler_class):
+            server_state = fake
+
+            def log_message(self, format, *args):
+                logging.getLogger(__name__).debug(format % args)
+
+            def handle(self):
+                try:
+                    super().handle()
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client hung up, as it does on a hedged request that lost
+                    pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"{type(self).__name__}-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def do_GET(self):
+        state = self.server_state
+        state.count_request()
+        metaint = state.metaint if self.headers.get("Icy-MetaData") == "1" else None
+
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/mpeg")
+        if metaint:
+            self.send_header("icy-metaint", str(metaint))
+        self.end_headers()
+
+        payload = state.payload
+        position = 0
+        sent = 0
+        since_meta = 0
+        blocks = 0
+        start = time.monotonic()
+        stall = state.stall_after_bytes if state.requests == 1 else None
+        try:
+            while True:
+                if stall is not None and sent >= stall:
+                    # stop sending without closing, like a stalled Icecast relay
+                    time.sleep(3600)
+                size = state.write_size if not metaint else min(state.write_size, metaint - since_meta)
+                data = payload[position:position + size]
+                if len(data) < size:
+                    data += payload[:size - len(data)]
+                position = (position + size) % len(payload)
+                self.wfile.write(data)
+                sent += size
+                if metaint:
+                    since_meta += size
+                    if since_meta == metaint:
+                        since_meta = 0
+                        self.wfile.write(state.metadata_block(blocks // state.title_every))
+                        blocks += 1
+                if state.bytes_per_second:
+                    # pace the stream like a live broadcast
+                    ahead = sent / state.bytes_per_second - (time.monotonic() - start)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeStreamServer(FakeServer):
+    """
+    An Icecast-style MP3 stream made of synthetic frames.
+
+    The stream can be paced like a live broadcast or served as fast as possible, can interleave ICY
+    metadata when the client asks for it, and can stall after a number of bytes on its first
+    connection to exercise reconnects.
+    """
+
+    handler_class = _StreamHandler
+
+    def __init__(
+            self,
+            port: int = 0,
+            bytes_per_second: Optional[int] = 16000,
+            write_size: int = 4096,
+            metaint: Optional[int] = 16000,
+            titles: tuple = ("Movin 92.5", "Olivia Rodrigo - Vampire"),
+            title_every: int = 5,
+            stall_after_bytes: Optional[int] = None
+    ):
+        """
+        :param port: The port to listen on, 0 picks a free one.
+        :param bytes_per_second: The pace of the stream, None to send as fast as the client reads.
+        :param write_size: The size of each write to the socket.
+        :param metaint: The audio bytes between metadata blocks when the client asks for ICY metadata, None to never send them.
+        :param titles: The StreamTitles cycled through.
+        :param title_every: The number of metadata blocks between title changes.
+        :param stall_after_bytes: Stop sending after this many bytes on the first connection.
+        """
+        super().__init__(port=port)
+        self.bytes_per_second = bytes_per_second
+        self.write_size = write_size
+        self.metaint = metaint
+        self.titles = titles
+        self.title_every = title_every
+        self.stall_after_bytes = stall_after_bytes
+        self.payload = make_synthetic_frames(seconds=10)
+
+    def metadata_block(self, index: int) -> bytes:
+        metadata = f"StreamTitle='{self.titles[index % len(self.titles)]}';".encode("utf-8")
+        blocks = (len(metadata) + 15) // 16
+        return bytes([blocks]) + metadata.ljust(blocks * 16, b"\x00")
+
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status: int, body: dict, headers: Optional[dict] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+class FakeApiServer(FakeServer):
+    """
+    Base class for fake JSON APIs with configurable latency and error rate.
+
+    A failed request is answered with ``error_status`` (429 by default, with a retry-after header).
+    """
+
+    def __init__(self, port: int = 0, latency_seconds: float = 0.0, jitter_seconds: float = 0.0, error_rate: float = 0.0, error_status: int = 429, seed: Optional[int] = None):
+        """
+        :param port: The port to listen on, 0 picks a free one.
+        :param latency_seconds: The delay before every response.
+        :param jitter_seconds: A random extra delay of up to this many seconds.
+        :param error_rate: The fraction of requests answered with error_status.
+        :param error_status: The status code of failed requests.
+        :param seed: Seeds the random latency and errors, for repeatable runs.
+        """
+        super().__init__(port=port)
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.errors = 0
+        self._random = random.Random(seed)
+
+    def delay_and_fail(self, handler: _JsonHandler) -> bool:
+        """Sleeps for the configured latency; answers with an error and returns True if this request should fail."""
+        self.count_request()
+        with self._lock:
+            delay = self.latency_seconds + self._random.random() * self.jitter_seconds
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        time.sleep(delay)
+        if fail:
+            handler.send_json(self.error_status, {"error": {"message": "simulated failure"}}, headers={"retry-after": "0.1"})
+        return fail
+
+
+class _TextbeltHandler(_JsonHandler):
+    def do_POST(self):
+        state = self.server_state
+        form = parse_qs(self.read_body().decode("utf-8"))
+        if state.delay_and_fail(self):
+            return
+        with state._lock:
+            state.messages.append({"phone": form.get("phone", [""])[0], "message": form.get("message", [""])[0]})
+        self.send_json(200, {"success": True, "textId": str(len(state.messages)), "quotaRemaining": 100})
+
+
+class FakeTextbeltServer(FakeApiServer):
+    """A stand-in for the Textbelt /text endpoint that records every message it receives."""
+
+    handler_class = _TextbeltHandler
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.messages = []
+
+    @property
+    def text_url(self) -> str:
+        return f"{self.url}/text"
+
+
+def default_chat_reply(model: str, messages: List[dict]) -> str:
+    """
+    Answers a chat request the way the real models are expected to, from a simple reading of the transcript.
+
+    Screening requests (whose system prompt asks for a probability) get a probability, every other
+    request gets a CODE_WORD line followed by an explanation.
+    """
+    system = " ".join(m.get("content", "") for m in messages if m.get("role") == "system")
+    user = " ".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    # only read the transcript, the instructions around it talk about the winning word too
+    transcript = re.search(r"<text_transcript>(.*?)</text_transcript>", user, re.DOTALL)
+    if transcript:
+        user = transcript.group(1)
+    match = re.search(r"\bword\b(?:\s+(?:for|of)\s+(?:\w+\s+){0,3}?)?\s*is\s+['\"]?([A-Za-z0-9]+)", user, re.IGNORECASE)
+    if "probability" in system.lower():
+        return "0.9" if match else "0.1"
+    if match:
+        return f"CODE_WORD: {match.group(1)}\nThe DJ said the word is {match.group(1)}."
+    return "CODE_WORD: NONE\nNo winning word was announced in the transcript."
+
+
+class _ChatHandler(_JsonHandler):
+    def do_POST(self):
+        state = self.server_state
+        request = json.loads(self.read_body() or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        model = request.get("model", "")
+        with state._lock:
+            state.models.append(model)
+        if state.delay_and_fail(self, model=model):
+            return
+        content = state.responder(model, request.get("messages", []))
+        created = int(time.time())
+        if not request.get("stream"):
+            self.send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(content.split()), "total_tokens": len(content.split())},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = [content[i:i + state.stream_chunk_chars] for i in range(0, len(content), state.stream_chunk_chars)]
+        events = [{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None} for piece in pieces]
+        events.append({"index": 0, "delta": {}, "finish_reason": "stop"})
+        for choice in events:
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model, "choices": [choice]}
+            self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            time.sleep(state.stream_delay_seconds)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeChatServer(FakeApiServer):
+    """
+    A stand-in for the OpenAI chat completions endpoint, streamed or not.
+
+    Point the OpenAI client at ``api_url`` (for example with clients.configure_clients(openai_base_url=...)).
+    Every requested model is recorded in ``models``, so tests can check which tiers were called.
+    """
+
+    handler_class = _ChatHandler
+
+    def __init__(
+            self,
+            responder: Callable[[str, List[dict]], str] = default_chat_reply,
+            model_latency_seconds: Optional[Dict[str, float]] = None,
+            stream_chunk_chars: int = 8,
+            stream_delay_seconds: float = 0.0,
+            **kwargs
+    ):
+        """
+        :param responder: Builds the reply from the requested model and messages.
+        :param model_latency_seconds: The delay before responding per model, overriding latency_seconds.
+        :param stream_chunk_chars: The characters sent per streamed chunk.
+        :param stream_delay_seconds: The delay between streamed chunks.
+        :param kwargs: Passed on to FakeApiServer.
+        """
+        super().__init__(**kwargs)
+        self.responder = responder
+        self.model_latency_seconds = model_latency_seconds or {}
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_delay_seconds = stream_delay_seconds
+        self.models = []
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.url}/v1"
+
+    def delay_and_fail(self, handler: _JsonHandler, model: Optional[str] = None) -> bool:
+        if model in self.model_latency_seconds:
+            time.sleep(max(self.model_latency_seconds[model] - self.latency_seconds, 0.0))
+        return super().delay_and_fail(handler)
+
+
+_FILLER = ("that was the new one from olivia rodrigo coming up after the break we have traffic and weather "
+           "on the nines stay with us for the morning show movin ninety two point five plays the hits all day "
+           "call the studio line if you saw the accident on the freeway this morning").split()
+
+
+def default_transcript(audio_seconds: float, rng: random.Random, words_per_second: float = 2.5, announcement_rate: float = 0.2) -> List[str]:
+    """
+    Makes up the words of a stretch of radio talk, with a code word announcement in some of them.
+
+    :param audio_seconds: The duration of the audio.
+    :param rng: The random generator, seeded by the server for repeatable runs.
+    :param words_per_second: The speaking rate.
+    :param announcement_rate: The chance that the audio contains an announcement.
+    :return: The words.
+    """
+    words = [rng.choice(_FILLER) for _ in range(max(int(audio_seconds * words_per_second), 1))]
+    if rng.random() < announcement_rate:
+        announcement = f"the code word is {rng.choice(('vampire', 'drivers', 'guts', 'butterfly'))} text it to 72881 now".split()
+        position = rng.randrange(len(words))
+        words[position:position] = announcement
+    return words
+
+
+class _TranscriptionHandler(_JsonHandler):
+    def do_POST(self):
+        state = self.server_state
+        if not self.path.rstrip("/").endswith("/audio/transcriptions"):
+            self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        body = self.read_body()
+        message = BytesParser().parsebytes(f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8") + body)
+        fields = {part.get_param("name", header="content-disposition"): part.get_payload(decode=True) for part in message.get_payload()}
+        audio = fields.get("file", b"")
+        audio_seconds = audio_duration(audio)
+        model = fields.get("model", b"").decode("utf-8")
+        if state.delay_and_fail(self, audio_seconds=audio_seconds, model=model):
+            return
+        with state._lock:
+            state.audio_seconds += audio_seconds
+            state.models.append(model)
+            words = state.transcriber(audio_seconds, state._random)
+        if fields.get("response_format", b"").decode("utf-8") != "verbose_json":
+            self.send_json(200, {"text": " ".join(words)})
+            return
+        step = audio_seconds / len(words) if words else 0.0
+        word_items = [{"word": word, "start": round(i * step, 3), "end": round((i + 0.8) * step, 3)} for i, word in enumerate(words)]
+        segments = []
+        for first in range(0, len(word_items), state.words_per_segment):
+            chunk = word_items[first:first + state.words_per_segment]
+            segments.append({"id": len(segments), "start": chunk[0]["start"], "end": chunk[-1]["end"], "text": " " + " ".join(w["word"] for w in chunk),
+                             "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.3})
+        self.send_json(200, {"task": "transcribe", "language": "english", "duration": audio_seconds, "text": " ".join(words),
+                             "segments": segments, "words": word_items})
+
+
+class FakeTranscriptionServer(FakeApiServer):
+    """
+    A stand-in for Groq's (OpenAI compatible) audio transcription endpoint.
+
+    Each request takes latency_seconds plus seconds_per_audio_second for every second of MP3
+    audio uploaded, so trimming or splitting recordings shows up in the timings. Responses are
+    plain json or verbose_json with segment and word timestamps. Point the Groq client at ``url``
+    (for example with clients.configure_clients(groq_base_url=...)).
+    """
+
+    handler_class = _TranscriptionHandler
+
+    def __init__(
+            self,
+            transcriber: Callable[[float, random.Random], List[str]] = default_transcript,
+            seconds_per_audio_second: float = 0.0,
+            words_per_segment: int = 12,
+            model_latency_seconds: Optional[Dict[str, float]] = None,
+            **kwargs
+    ):
+        """
+        :param transcriber: Makes up the words of a request from its audio duration and the server's random generator.
+        :param seconds_per_audio_second: The processing delay per second of uploaded audio.
+        :param words_per_segment: The number of words in each verbose_json segment.
+        :param model_latency_seconds: The delay before responding per model, overriding latency_seconds.
+        :param kwargs: Passed on to FakeApiServer.
+        """
+        super().__init__(**kwargs)
+        self.transcriber = transcriber
+        self.seconds_per_audio_second = seconds_per_audio_second
+        self.words_per_segment = words_per_segment
+        self.model_latency_seconds = model_latency_seconds or {}
+        self.audio_seconds = 0.0
+        self.models = []
+
+    def delay_and_fail(self, handler: _JsonHandler, audio_seconds: float = 0.0, model: Optional[str] = None) -> bool:
+        time.sleep(audio_seconds * self.seconds_per_audio_second)
+        if model in self.model_latency_seconds:
+            time.sleep(max(self.model_latency_seconds[model] - self.latency_seconds, 0.0))
+        return super().delay_and_fail(handler)
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        state = self.server.state
+        state.count_request()
+        self.reply("220 localhost fake SMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data_line)
+                time.sleep(state.latency_seconds)
+                with state._lock:
+                    state.messages.append({"recipients": recipients, "data": b"".join(lines)})
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+class FakeSmtpServer(FakeServer):
+    """A plain SMTP server (no TLS, no authentication) that records every message it accepts."""
+
+    def __init__(self, port: int = 0, latency_seconds: float = 0.0):
+        """
+        :param port: The port to listen on, 0 picks a free one.
+        :param latency_seconds: The delay before each message is accepted.
+        """
+        super().__init__(port=port)
+        self.latency_seconds = latency_seconds
+        self.messages = []
+
+    def start(self) -> "FakeSmtpServer":
+        self._server = socketserver.ThreadingTCPServer(("127.0.0.1", self.port), _SmtpHandler)
+        self._server.daemon_threads = True
+        self._server.state = self
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"FakeSmtpServer-{self.port}", daemon=True)
+        self._thread.start()
+        return self
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with FakeStreamServer(port=8000) as server:
+        print(f"Serving a fake stream at {server.url}/stream.mp3, press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,320 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when no attempt of a call finished before its deadline."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a provider's circuit is open and there is no fallback to send the call to."""
+
+
+class LatencyTracker:
+    """
+    Keeps the latencies of the most recent successful calls and reports their percentiles.
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 10):
+        """
+        Parameters:
+        - window (int): The number of recent latencies kept.
+        - min_samples (int): The number of latencies needed before percentiles are reported.
+        """
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns a percentile of the recent latencies.
+
+        Parameters:
+        - percentile (float): The percentile, between 0 and 100.
+
+        Returns:
+        Optional[float]: The latency in seconds, or None while fewer than min_samples calls were recorded.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        # nearest rank
+        rank = max(math.ceil(percentile / 100 * len(latencies)) - 1, 0)
+        return latencies[min(rank, len(latencies) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Stops sending calls to a provider that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls are refused. Once
+    ``reset_seconds`` have passed a single trial call is let through: if it succeeds the circuit
+    closes again, if it fails the circuit stays open for another ``reset_seconds``.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30):
+        """
+        Parameters:
+        - failure_threshold (int): The number of consecutive failures that opens the circuit.
+        - reset_seconds (float): How long the circuit stays open before a trial call is allowed.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a call may be sent to the provider.
+
+        Returns:
+        bool: False while the circuit is open.
+        """
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = "half-open"
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class HedgedExecutor:
+    """
+    Runs calls to one provider with a deadline, a hedged second attempt and a circuit breaker.
+
+    When a call is still running after the hedge percentile of the provider's recent latencies, a
+    second attempt is started, sent to the fallback when one is given and otherwise a duplicate of
+    the call. Whichever attempt succeeds first is returned, and the other is cancelled if it has
+    not started yet or abandoned otherwise. Python threads cannot be interrupted, so a call that
+    should stop early must check its own cancellation flag (see models.run_openai_streaming).
+
+    When the primary attempt fails outright the fallback is tried straight away. Failures of the
+    primary feed the circuit breaker; while it is open calls go to the fallback only, or raise
+    CircuitOpenError when there is none.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            hedge_percentile: float = 95,
+            min_hedge_seconds: float = 1.0,
+            default_hedge_seconds: Optional[float] = None,
+            deadline_seconds: Optional[float] = None,
+            failure_threshold: int = 5,
+            reset_seconds: float = 30,
+            max_workers: int = 16
+    ):
+        """
+        Parameters:
+        - name (str): The provider name, used in logs.
+        - hedge_percentile (float): The latency percentile after which a hedged attempt is started.
+        - min_hedge_seconds (float): The shortest delay before hedging, so fast providers are not doubled up on noise.
+        - default_hedge_seconds (float): The hedge delay used until enough latencies were recorded, None to not hedge until then.
+        - deadline_seconds (float): The default deadline of a call, None for no deadline.
+        - failure_threshold (int): The number of consecutive failures that opens the circuit.
+        - reset_seconds (float): How long the circuit stays open before a trial call is allowed.
+        - max_workers (int): The number of attempts in flight at once.
+        """
+        self.name = name
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_seconds = min_hedge_seconds
+        self.default_hedge_seconds = default_hedge_seconds
+        self.deadline_seconds = deadline_seconds
+        self.latencies = LatencyTracker()
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_seconds=reset_seconds)
+        self.stats = {"calls": 0, "hedged": 0, "hedge_wins": 0, "fallbacks": 0, "deadline_exceeded": 0, "circuit_rejections": 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"hedge-{name}")
+        self._lock = threading.Lock()
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Returns how long a call may run before a hedged attempt is started.
+
+        Returns:
+        Optional[float]: The delay in seconds, or None when calls are not hedged yet.
+        """
+        delay = self.latencies.percentile(self.hedge_percentile)
+        if delay is None:
+            delay = self.default_hedge_seconds
+        return None if delay is None else max(delay, self.min_hedge_seconds)
+
+    @staticmethod
+    def _timed(func: Callable[[], Any], acquire: Optional[Callable[[], Any]], sent: Future) -> Tuple[Any, float]:
+        try:
+            if acquire is not None:
+                acquire()
+        finally:
+            sent.set_result(time.monotonic())
+        result = func()
+        return result, time.monotonic() - sent.result()
+
+    def call(self, primary: Callable[[], Any], fallback: Optional[Callable[[], Any]] = None, deadline_seconds: Optional[float] = None,
+             acquire: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Runs a call, hedging it when it is slow and giving up at the deadline.
+
+        Only the requests themselves are timed: the hedge delay, the deadline and the recorded
+        latencies count from when the first attempt was sent, not from when the call was made. Time
+        spent waiting for a free worker or in acquire does not make a call look slow, so it neither
+        fires a hedge nor runs into the deadline.
+
+        Parameters:
+        - primary (Callable): Sends the request to the provider.
+        - fallback (Callable): Sends the request another way, for example to a fallback model. Used for the hedged attempt when given.
+        - deadline_seconds (float): The deadline of this call, defaults to the executor's.
+        - acquire (Callable): Waits until an attempt may be sent, for example for a rate limit token. Runs before every attempt.
+
+        Returns:
+        The result of the first attempt that succeeded.
+        """
+        logger = logging.getLogger(__name__)
+
+        deadline_seconds = deadline_seconds if deadline_seconds is not None else self.deadline_seconds
+        start_time = time.monotonic()
+        self._count("calls")
+
+        # every attempt maps to its kind and whether it went to the primary provider
+        attempts: Dict[Any, Tuple[str, bool]] = {}
+
+        def submit(func: Callable[[], Any], kind: str, to_primary: bool) -> Future:
+            # resolves with the time the attempt was sent, once it had a worker and acquire returned
+            sent = Future()
+            attempts[self._executor.submit(self._timed, func, acquire, sent)] = (kind, to_primary)
+            return sent
+
+        if self.breaker.allow():
+            first_sent = submit(primary, "primary", True)
+            hedged = False
+        elif fallback is not None:
+            logger.warning(f"The {self.name} circuit is open, sending the call to the fallback.")
+            self._count("fallbacks")
+            first_sent = submit(fallback, "fallback", False)
+            hedged = True
+        else:
+            self._count("circuit_rejections")
+            raise CircuitOpenError(f"The {self.name} circuit is open after {self.breaker.failures} consecutive failures")
+
+        hedge_delay = self.hedge_delay()
+        last_error = None
+        while attempts:
+            sent_at = first_sent.result() if first_sent.done() else None
+            waiting = list(attempts)
+            timeouts = []
+            if sent_at is None:
+                # the timers start once the first attempt is sent
+                waiting.append(first_sent)
+            else:
+                if deadline_seconds:
+                    timeouts.append(sent_at + deadline_seconds - time.monotonic())
+                if not hedged and hedge_delay is not None:
+                    timeouts.append(sent_at + hedge_delay - time.monotonic())
+            timeout = max(min(timeouts), 0) if timeouts else None
+            done, _ = wait(waiting, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            primary_failed = False
+            for future in done:
+                if future is first_sent:
+                    continue
+                kind, to_primary = attempts.pop(future)
+                try:
+                    result, latency = future.result()
+                except Exception as e:
+                    last_error = e
+                    if to_primary:
+                        self.breaker.record_failure()
+                        primary_failed = True
+                    logger.warning(f"The {kind} {self.name} attempt failed after {time.monotonic() - start_time:.2f} seconds: {type(e).__name__}, {e}")
+                    continue
+                if to_primary:
+                    self.breaker.record_success()
+                    self.latencies.add(latency)
+                if kind != "primary":
+                    self._count("hedge_wins")
+                    logger.info(f"The {kind} {self.name} attempt finished first, after {time.monotonic() - start_time:.2f} seconds.")
+                for other in attempts:
+                    other.cancel()
+                return result
+
+            if sent_at is not None and deadline_seconds and time.monotonic() >= sent_at + deadline_seconds:
+                self._count("deadline_exceeded")
+                for other in attempts:
+                    other.cancel()
+                raise DeadlineExceeded(f"No {self.name} attempt finished within {deadline_seconds:.1f} seconds")
+
+            if not hedged:
+                if primary_failed and fallback is not None:
+                    hedged = True
+                    self._count("fallbacks")
+                    submit(fallback, "fallback", False)
+                elif attempts and hedge_delay is not None and sent_at is not None and time.monotonic() - sent_at >= hedge_delay:
+                    hedged = True
+                    self._count("hedged")
+                    logger.info(f"The {self.name} call is still running after {hedge_delay:.2f} seconds, sending a hedged attempt.")
+                    if fallback is not None:
+                        submit(fallback, "hedged fallback", False)
+                    else:
+                        submit(primary, "hedged", True)
+        raise last_error
+
+    def log_stats(self) -> None:
+        """Logs how many calls were hedged, won by the hedge, sent to the fallback or cut off by their deadline."""
+        logger = logging.getLogger(__name__)
+        with self._lock:
+            stats = dict(self.stats)
+        p95 = self.latencies.percentile(95)
+        p95_text = "n/a" if p95 is None else f"{p95:.2f} seconds"
+        logger.info(f"{self.name}: {stats['calls']} call(s), {stats['hedged']} hedged, {stats['hedge_wins']} won by the second attempt, "
+                    f"{stats['fallbacks']} sent to the fallback, {stats['deadline_exceeded']} past their deadline, "
+                    f"{stats['circuit_rejections']} refused by the open circuit, p95 latency {p95_text}, circuit {self.breaker.state}.")
+
+    def close(self) -> None:
+        """Stops the worker threads without waiting for abandoned attempts."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import random
+
+    logging.basicConfig(level=logging.INFO)
+    executor = HedgedExecutor(name="example", hedge_percentile=90, min_hedge_seconds=0.05, deadline_seconds=2)
+
+    def slow_sometimes() -> str:
+        # one call in ten takes ten times as long
+        time.sleep(1.0 if random.random() < 0.1 else 0.1)
+        return "done"
+
+    start = time.monotonic()
+    for _ in range(50):
+        executor.call(slow_sometimes)
+    print(f"50 calls took {time.monotonic() - start:.2f} seconds")
+    executor.log_stats()
+    executor.close()
@@ -0,0 +1,106 @@
+import logging
+import re
+from typing import List, Optional, Tuple
+
+# Asks an Icecast/SHOUTcast server to interleave stream metadata with the audio
+ICY_REQUEST_HEADERS = {"Icy-MetaData": "1"}
+
+_STREAM_TITLE = re.compile(rb"StreamTitle='(.*?)';", re.DOTALL)
+
+
+def parse_stream_title(block: bytes) -> Optional[str]:
+    """
+    Extracts the StreamTitle from an ICY metadata block.
+
+    :param block: The metadata block, without its length byte.
+    :return: The title, or None when the block has no StreamTitle.
+    """
+    match = _STREAM_TITLE.search(block.rstrip(b"\x00"))
+    if match is None:
+        return None
+    return match.group(1).decode("utf-8", errors="replace").strip()
+
+
+def is_song_title(title: Optional[str]) -> bool:
+    """
+    Guesses whether a StreamTitle announces a song.
+
+    Stations put "Artist - Title" in the StreamTitle while music plays and leave it empty, or set it
+    to the station or show name, during talk and ad breaks.
+
+    :param title: The current StreamTitle.
+    :return: True when the title looks like "Artist - Title".
+    """
+    if not title:
+        return False
+    artist, separator, song = title.partition(" - ")
+    return bool(separator and artist.strip() and song.strip())
+
+
+class IcyDemuxer:
+    """
+    Separates audio from the metadata blocks an ICY server interleaves with it.
+
+    With ``Icy-MetaData: 1`` the server inserts a metadata block after every ``metaint`` bytes of
+    audio: one length byte (in units of 16 bytes) followed by that many bytes of metadata. Data can
+    be fed in chunks of any size; a block split across chunks is reassembled.
+    """
+
+    def __init__(self, metaint: Optional[int]):
+        """
+        :param metaint: The icy-metaint response header, or None when the stream has no inline metadata.
+        """
+        if metaint is not None and metaint <= 0:
+            raise ValueError("Metaint must be a positive integer")
+        self.metaint = metaint
+        self.title = None
+        self.title_changes = 0
+        self._audio_left = metaint
+        self._meta_left = None
+        self._meta_buf = bytearray()
+
+    def feed(self, data: bytes) -> List[Tuple[Optional[str], bytes]]:
+        """
+        Strips the metadata from a chunk of the stream.
+
+        :param data: The next bytes read from the stream, as bytes or a memoryview.
+        :return: Runs of audio, each paired with the StreamTitle current while it played.
+        """
+        if self.metaint is None:
+            return [(self.title, data)] if data else []
+
+        logger = logging.getLogger(__name__)
+
+        runs = []
+        pos = 0
+        end = len(data)
+        while pos < end:
+            if self._meta_left is None:
+                take = min(self._audio_left, end - pos)
+                if take:
+                    # slices of a memoryview are passed on without copying the audio
+                    runs.append((self.title, data[pos:pos + take]))
+                    pos += take
+                    self._audio_left -= take
+                if self._audio_left == 0 and pos < end:
+                    length = data[pos] * 16
+                    pos += 1
+                    if length:
+                        self._meta_left = length
+                        self._meta_buf = bytearray()
+                    else:
+                        self._audio_left = self.metaint
+            else:
+                take = min(self._meta_left, end - pos)
+                self._meta_buf += data[pos:pos + take]
+                pos += take
+                self._meta_left -= take
+                if self._meta_left == 0:
+                    title = parse_stream_title(bytes(self._meta_buf))
+                    if title is not None and title != self.title:
+                        self.title = title
+                        self.title_changes += 1
+                        logger.info(f"Stream title changed to '{title}'.")
+                    self._meta_left = None
+                    self._audio_left = self.metaint
+        return runs
@@ -0,0 +1,344 @@
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Upper bounds of the latency histogram buckets in seconds, from a local regex match to a long capture
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 900.0)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "radioapp"
+
+
+class Histogram:
+    """
+    The latencies of one stage: cumulative bucket counts for Prometheus, and the most recent
+    samples for percentiles.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 1024):
+        """
+        Parameters:
+        - buckets (Sequence[float]): The upper bounds of the buckets, in increasing order.
+        - window (int): The number of recent samples kept for percentiles.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.errors = 0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds: float, error: bool = False) -> None:
+        # callers hold the registry lock
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self._recent.append(seconds)
+        if error:
+            self.errors += 1
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns a percentile of the recent samples (nearest rank).
+
+        Parameters:
+        - percentile (float): The percentile, between 0 and 100.
+
+        Returns:
+        Optional[float]: The latency in seconds, or None before the first sample.
+        """
+        if not self._recent:
+            return None
+        ordered = sorted(self._recent)
+        rank = max(math.ceil(percentile / 100 * len(ordered)) - 1, 0)
+        return ordered[min(rank, len(ordered) - 1)]
+
+    def summary(self) -> Dict[str, Any]:
+        p50, p95, p99 = (self.percentile(p) for p in (50, 95, 99))
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum_seconds": round(self.sum, 6),
+            "mean_seconds": round(self.sum / self.count, 6) if self.count else None,
+            "p50_seconds": None if p50 is None else round(p50, 6),
+            "p95_seconds": None if p95 is None else round(p95, 6),
+            "p99_seconds": None if p99 is None else round(p99, 6),
+        }
+
+
+class Metrics:
+    """
+    A registry of per-stage latency histograms and counters.
+
+    Stages are timed with ``span``, which works as a context manager and as a decorator, or
+    recorded directly with ``observe`` for latencies measured elsewhere (such as the time from an
+    announcement airing to the alert going out). Recording a sample takes one clock read at each
+    end and a short lock, so spans can wrap every request without measurable overhead.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """
+        Parameters:
+        - buckets (Sequence[float]): The histogram bucket bounds shared by every stage.
+        """
+        self.buckets = tuple(buckets)
+        self.started_at = time.time()
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, error: bool = False) -> None:
+        """
+        Records one latency sample of a stage.
+
+        Parameters:
+        - stage (str): The stage name, for example "transcription.request".
+        - seconds (float): The latency.
+        - error (bool): Whether the timed operation failed.
+        """
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(buckets=self.buckets)
+            histogram.observe(seconds, error=error)
+
+    def increment(self, name: str, value: float = 1) -> None:
+        """
+        Adds to a counter, for example the number of recordings trimmed.
+
+        Parameters:
+        - name (str): The counter name.
+        - value (float): The amount added.
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def span(self, stage: str) -> "Span":
+        """
+        Times a block of code or, used as a decorator, every call of a function.
+
+        Parameters:
+        - stage (str): The stage name the latencies are recorded under.
+
+        Returns:
+        Span: The span.
+        """
+        return Span(self, stage)
+
+    def percentile(self, stage: str, percentile: float) -> Optional[float]:
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            return histogram.percentile(percentile) if histogram else None
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Returns every stage's count, errors and latency percentiles, and every counter.
+        """
+        with self._lock:
+            return {
+                "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds"),
+                "seconds": round(time.time() - self.started_at, 3),
+                "stages": {stage: histogram.summary() for stage, histogram in sorted(self._histograms.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Renders the histograms and counters in the Prometheus text exposition format.
+        """
+        name = f"{METRIC_PREFIX}_stage_duration_seconds"
+        lines = [f"# HELP {name} Latency of each pipeline stage.", f"# TYPE {name} histogram"]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            for stage, histogram in histograms:
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            errors = f"{METRIC_PREFIX}_stage_errors_total"
+            lines += [f"# HELP {errors} Failed operations of each pipeline stage.", f"# TYPE {errors} counter"]
+            lines += [f'{errors}{{stage="{stage}"}} {histogram.errors}' for stage, histogram in histograms]
+            for counter, value in counters:
+                metric = f"{METRIC_PREFIX}_{counter.replace('.', '_')}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {value:g}"]
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path: str = "metrics/radioapp.prom") -> str:
+        """
+        Writes the metrics to a file for the node_exporter textfile collector.
+
+        The file is written next to its final name and renamed into place, so the collector never
+        reads half of it.
+
+        Parameters:
+        - path (str): The .prom file, in the collector's directory.
+
+        Returns:
+        str: The path written.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(file=temporary_path, mode="w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary_path, path)
+        return path
+
+    def write_run_summary(self, directory: str = "metrics/runs", name: Optional[str] = None, **extra: Any) -> str:
+        """
+        Saves the summary of this run as a JSON file named after the time it started.
+
+        Parameters:
+        - directory (str): The directory the summaries are kept in.
+        - name (str): The file name without its extension, instead of run_<start time>; a process
+          exporting several times, such as the daemon once per window, passes a new one each time.
+        - extra: Additional fields stored with the summary, for example the run's mode.
+
+        Returns:
+        str: The path of the summary.
+        """
+        logger = logging.getLogger(__name__)
+
+        os.makedirs(directory, exist_ok=True)
+        summary = {**self.summary(), **extra}
+        name = name or f"run_{datetime.fromtimestamp(self.started_at).strftime('%Y%m%d_%H%M%S')}"
+        path = os.path.join(directory, f"{name}.json")
+        with open(file=path, mode="w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=4)
+        logger.info(f"Run summary saved to {path}.")
+        return path
+
+    def log_summary(self) -> None:
+        """Logs the count and p50/p95/p99 latency of every stage."""
+        logger = logging.getLogger(__name__)
+        for stage, stats in self.summary()["stages"].items():
+            logger.info(f"{stage}: {stats['count']} call(s), {stats['errors']} failed, p50 {stats['p50_seconds']}s, "
+                        f"p95 {stats['p95_seconds']}s, p99 {stats['p99_seconds']}s.")
+
+    def reset(self) -> None:
+        """Forgets every sample and counter, for example between benchmark runs."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.started_at = time.time()
+
+
+class Span:
+    """
+    Times a block of code as a context manager, or every call of a function as a decorator.
+
+    A failed block is recorded with its latency and counted as an error; the exception is not
+    swallowed. Each decorated call gets its own Span, so decorated functions stay thread safe.
+    """
+
+    __slots__ = ("metrics", "stage", "_start")
+
+    def __init__(self, metrics: Metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+        self._start = 0.0
+
+    def __enter__(self) -> "Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> bool:
+        self.metrics.observe(self.stage, time.perf_counter() - self._start, error=exc_type is not None)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        metrics, stage = self.metrics, self.stage
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Span(metrics, stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+# The registry the application's modules record into
+METRICS = Metrics()
+
+
+def span(stage: str) -> Span:
+    """
+    Times a block of code or a function under a stage name in the shared registry.
+
+    Parameters:
+    - stage (str): The stage name.
+
+    Returns:
+    Span: A span usable as ``with span("stage"):`` or ``@span("stage")``.
+    """
+    return Span(METRICS, stage)
+
+
+def observe(stage: str, seconds: float, error: bool = False) -> None:
+    """Records a latency measured elsewhere in the shared registry."""
+    METRICS.observe(stage, seconds, error=error)
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Adds to a counter in the shared registry."""
+    METRICS.increment(name, value)
+
+
+def export_metrics(prometheus_path: Optional[str] = "metrics/radioapp.prom", summary_directory: Optional[str] = "metrics/runs", summary_name: Optional[str] = None, **extra: Any) -> List[str]:
+    """
+    Logs the shared registry's stage latencies and exports them as a Prometheus textfile and a JSON run summary.
+
+    Parameters:
+    - prometheus_path (str): The .prom file, None to skip it.
+    - summary_directory (str): The directory of the run summaries, None to skip it.
+    - summary_name (str): The run summary's file name without its extension, defaults to run_<start time>.
+    - extra: Additional fields stored with the run summary.
+
+    Returns:
+    List[str]: The paths written.
+    """
+    logger = logging.getLogger(__name__)
+
+    METRICS.log_summary()
+    paths = []
+    try:
+        if prometheus_path:
+            paths.append(METRICS.export_prometheus(path=prometheus_path))
+        if summary_directory:
+            paths.append(METRICS.write_run_summary(directory=summary_directory, name=summary_name, **extra))
+    except OSError as e:
+        logger.error(f"Could not export metrics: {type(e).__name__}, {e}")
+    return paths
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    @span("example.sleep")
+    def nap(seconds: float) -> None:
+        time.sleep(seconds)
+
+    for i in range(20):
+        nap(0.001 * (i % 5))
+    with span("example.block"):
+        sum(range(100000))
+
+    # the cost of a span around nothing
+    start = time.perf_counter()
+    for _ in range(100000):
+        with span("example.overhead"):
+            pass
+    print(f"{(time.perf_counter() - start) / 100000 * 1e6:.2f} microseconds per span")
+    print(METRICS.to_prometheus())
@@ -0,0 +1,177 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+# The stages a recording goes through, in order
+STAGES = ("captured", "transcribed", "detected", "done")
+# The state of a recording that kept failing and was given up on
+ABANDONED = "abandoned"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    name TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    path TEXT,
+    segment_id INTEGER,
+    response TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_stage ON items (stage);
+"""
+
+_COLUMNS = "name, stage, path, segment_id, response, attempts, error, updated_at"
+
+
+class JournalEntry(NamedTuple):
+    """The state of one recording on its way through the pipeline."""
+    name: str
+    stage: str
+    path: Optional[str]
+    segment_id: Optional[int]
+    response: Optional[str]
+    attempts: int
+    error: Optional[str]
+    updated_at: float
+
+
+class StageJournal:
+    """
+    A small SQLite journal of the stage every recording has reached.
+
+    Each recording is recorded under its file name as it is captured, transcribed, checked for an
+    announcement and notified about. Every stage is committed as soon as it completes, so after a
+    crash the journal tells which recordings still need which stage, and a restarted process picks
+    them up there instead of capturing or transcribing them again. A stage never moves back, and
+    a recording that was abandoned stays abandoned.
+    """
+
+    def __init__(self, path: str = "recordings/journal.db"):
+        """
+        Parameters:
+        - path (str): The database file, created along with its directory when missing.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # a committed stage must survive a power cut, not only a crash of the process
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def advance(self, name: str, stage: str, path: Optional[str] = None, segment_id: Optional[int] = None, response: Optional[str] = None) -> None:
+        """
+        Records that a recording has completed a stage.
+
+        Fields left as None keep their stored value, and a stage earlier than the stored one, or any
+        stage of an abandoned recording, is ignored.
+
+        Parameters:
+        - name (str): The recording's file name.
+        - stage (str): One of STAGES.
+        - path (str): Where the recording's audio is now.
+        - segment_id (int): The id of its transcript in the transcript store.
+        - response (str): The model's response to its transcript.
+        """
+        logger = logging.getLogger(__name__)
+
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r}, expected one of {', '.join(STAGES)}")
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT stage FROM items WHERE name = ?", (name,)).fetchone()
+            if row is not None and (row[0] == ABANDONED or STAGES.index(row[0]) > STAGES.index(stage)):
+                return
+            self._connection.execute(
+                "INSERT INTO items (name, stage, path, segment_id, response, attempts, error, updated_at) VALUES (?, ?, ?, ?, ?, 0, NULL, ?) "
+                "ON CONFLICT(name) DO UPDATE SET stage = excluded.stage, path = COALESCE(excluded.path, path), "
+                "segment_id = COALESCE(excluded.segment_id, segment_id), response = COALESCE(excluded.response, response), "
+                "attempts = 0, error = NULL, updated_at = excluded.updated_at",
+                (name, stage, path, segment_id, response, time.time())
+            )
+        logger.debug(f"{name} reached stage {stage}.")
+
+    def record_failure(self, name: str, error: str) -> int:
+        """
+        Records that the next stage of a recording failed.
+
+        Parameters:
+        - name (str): The recording's file name.
+        - error (str): A description of the failure.
+
+        Returns:
+        int: The number of consecutive failures of the recording.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE items SET attempts = attempts + 1, error = ?, updated_at = ? WHERE name = ?", (error, time.time(), name))
+            row = self._connection.execute("SELECT attempts FROM items WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def abandon(self, name: str) -> None:
+        """
+        Records that a recording is given up on, so it is no longer returned as unfinished.
+
+        Parameters:
+        - name (str): The recording's file name.
+        """
+        logger = logging.getLogger(__name__)
+
+        with self._lock, self._connection:
+            self._connection.execute("UPDATE items SET stage = ?, updated_at = ? WHERE name = ?", (ABANDONED, time.time(), name))
+        logger.debug(f"{name} was abandoned.")
+
+    def get(self, name: str) -> Optional[JournalEntry]:
+        """
+        Returns the state of a recording.
+
+        Parameters:
+        - name (str): The recording's file name.
+
+        Returns:
+        Optional[JournalEntry]: The entry, or None when the recording is not in the journal.
+        """
+        with self._lock:
+            row = self._connection.execute(f"SELECT {_COLUMNS} FROM items WHERE name = ?", (name,)).fetchone()
+        return JournalEntry(*row) if row else None
+
+    def unfinished(self, max_attempts: Optional[int] = None) -> List[JournalEntry]:
+        """
+        Returns the recordings that have not been through every stage and were not abandoned, oldest first.
+
+        Parameters:
+        - max_attempts (int): Leave out recordings that failed this many times in a row, None to include them all.
+
+        Returns:
+        List[JournalEntry]: The unfinished recordings.
+        """
+        sql = f"SELECT {_COLUMNS} FROM items WHERE stage NOT IN (?, ?)"
+        params = (STAGES[-1], ABANDONED)
+        if max_attempts is not None:
+            sql += " AND attempts < ?"
+            params += (max_attempts,)
+        with self._lock:
+            rows = self._connection.execute(sql + " ORDER BY name", params).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "StageJournal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with StageJournal(path="recordings/journal.db") as journal:
+        for entry in journal.unfinished():
+            print(f"{entry.name}: {entry.stage}, {entry.attempts} failed attempt(s){f', last error: {entry.error}' if entry.error else ''}")
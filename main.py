@@ -1,11 +1,27 @@
+import argparse
 import os
 import logging
+import shutil
+import threading
+import time
+from typing import List, Optional, Tuple, Union
+
 from dotenv import load_dotenv
 
-from stream_capture import download_audio_chunk
-from transcriptions import transcribe_and_move_audio_files, get_contents, save_response
-from models import run_openai
-from text_belt_sms_sender import send_sms
+from clients import get_groq_client, warm_up, log_connection_stats
+from detection import TriggerHit, detect_candidate_announcements
+from pipeline import PipelineStopped, Stage, run_pipeline
+from prompts import SYSTEM_PROMPT, build_transcript_context, build_user_prompt
+from stream_capture import download_audio_chunk, capture_segments
+from transcriptions import transcribe_and_move_audio_files, save_response, transcribe_recording_timed, store_transcription
+from transcript_store import CheckpointTracker, Segment, TranscriptStore
+from timeline import log_air_lag
+from transcription_cache import TranscriptionCache
+from rate_limit import ProviderRateLimiter
+from hedging import HedgedExecutor
+from models import ModelRequestError, run_cascade, parse_code_word, log_cascade_stats
+from notifications import NotificationDispatcher, alert_code_word
+from instrumentation import export_metrics, observe, span
 
 load_dotenv()
 
@@ -21,39 +37,239 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+def log_hit_air_time(store: TranscriptStore, segments: List[Segment], hit: TriggerHit) -> Optional[float]:
+    """
+    Logs when a hit in the space-joined text of several segments aired, and how far behind live it was found.
+
+    :param store: The store holding the segments' timelines.
+    :param segments: The segments, in the order their texts were joined.
+    :param hit: The hit in the joined text.
+    :return: When the hit aired, in epoch seconds, None when the segment has no timeline.
+    """
+    offset = 0
+    for segment in segments:
+        if hit.start < offset + len(segment.text):
+            timeline = store.get_timeline(segment.id)
+            if timeline is not None:
+                lag = log_air_lag(timeline=timeline, text=segment.text, char_offset=hit.start - offset)
+                return None if lag is None else time.time() - lag
+            return None
+        offset += len(segment.text) + 1
+    return None
+
+
 def main():
     # download audio stream (https://playerservices.streamtheworld.com/api/livestream-redirect/KQMVFM.mp3)
     # url = 'https://18743.live.streamtheworld.com/KQMVFM.mp3?dist=hubbard&source=hubbard-web&ttag=web&gdpr=0'
     # url = 'https://23093.live.streamtheworld.com/KQMVFM.mp3?dist=hubbard&source=hubbard-web&ttag=web&gdpr=0'
     url = 'https://18743.live.streamtheworld.com/KQMVFM.mp3'
+    # open the provider connections while the stream is being captured
+    threading.Thread(target=warm_up, daemon=True).start()
+    try:
+        with span("run"):
+            run_once(url=url)
+    finally:
+        export_metrics(mode="one-shot")
+
+
+def run_once(url: str) -> None:
+    """
+    Captures one chunk of the stream, transcribes it and notifies the code word if one was announced.
+
+    The detector checkpoint only moves past the new segments once they were found to hold no
+    announcement or their announcement was handled. When the model request fails, the segments
+    are left for the next run.
+
+    :param url: The URL of the audio stream.
+    """
     download_audio_chunk(url=url, duration=660)
-    # transcribe file(s) to transcriptions directory
-    transcribe_and_move_audio_files()
-    # walk transcription directory and extract contents from file
-    t_dir = "transcriptions/completed"
-    text_transcript = get_contents(completed_transcription_dir=t_dir)
-    system_prompt = f"""You are a contestant attempting to win Olivia Rodrigo concert tickets from a radio station named 'Movin 92.5'. In order to win you must determine, then extract the winning word within a large corpus of text."""
-
-    user_prompt = f"""You are attempting to extract the winning/code word out of a large corpus of text to win Olivia Rodrigo
-    concert tickets. The winning word may be referred to as the 'winning' word, the 'code' word, the
-    'magic' word, the 'entry' word or something similar to those. If the winning word is determined, respond back with
-    the winning word, and the context or sentence that led you to determine the word. If you cannot determine the 
-    winning word, reply back saying so. The text is provided below.
-
-    <text_transcript>
-    {text_transcript}
-    </text_transcript>"""
-
-    # get model response
-    response = run_openai(system_prompt=system_prompt, user_prompt=user_prompt)
-    save_response(model_response=response, save_dir="responses")
-    # phone numbers to send sms to
-    phone_numbers = [os.getenv("PHONE_NUMBER_ONE"), os.getenv("PHONE_NUMBER_TWO"), os.getenv("PHONE_NUMBER_THREE")]
-    # phone_numbers = [os.getenv("PHONE_NUMBER_ONE")]
-    send_sms(phone_numbers=phone_numbers, message=response, save_request_response=True)
-    logger.info(f"model response: {response}")
-    print(f"model response: {response}")
+    # slow requests are hedged, requests to a failing provider go to the fallback model
+    transcription_executor = HedgedExecutor(name="groq", deadline_seconds=120)
+    model_executor = HedgedExecutor(name="openai", deadline_seconds=60)
+    store = TranscriptStore()
+    dispatcher = None
+    try:
+        # pick up transcription files left behind by earlier versions
+        store.import_directory(directory="transcriptions/completed", archive_directory="transcriptions/archive")
+        # transcribe file(s) into the transcript store
+        transcribe_and_move_audio_files(completed_recordings_directory="recordings/completed", archive_recordings_directory="recordings/archive",
+                                        completed_transcription_directory=None, executor=transcription_executor, store=store, trim_non_speech=True)
+        # only read the segments the detector has not seen yet
+        segments = list(store.iter_since(last_id=store.get_checkpoint("detector")))
+        text_transcript = " ".join(segment.text for segment in segments)
+        # only ask the model when the DJ actually mentioned a code word
+        with span("detection"):
+            hits = detect_candidate_announcements(text=text_transcript)
+        if not hits:
+            logger.info("No candidate announcement in transcript, skipping model request.")
+            if segments:
+                store.set_checkpoint("detector", segments[-1].id)
+            return
+        aired_at = log_hit_air_time(store=store, segments=segments, hit=hits[0])
+        # keep only the sentences around the announcement(s)
+        context = build_transcript_context(text=text_transcript, hits=hits)
+        system_prompt = SYSTEM_PROMPT
+        user_prompt = build_user_prompt(text_transcript=context)
+
+        # phone numbers (and any email recipients) are read from the environment
+        dispatcher = NotificationDispatcher.from_env(save_request_response=True)
+        # screen the context cheaply first, the final model's response is streamed and the code word sent out as soon as it is named
+        try:
+            response = run_cascade(system_prompt=system_prompt, user_prompt=user_prompt, text=context,
+                                   on_code_word=lambda word: alert_code_word(dispatcher=dispatcher, word=word, station="Movin 92.5", aired_at=aired_at), executor=model_executor)
+        except ModelRequestError as e:
+            logger.error(f"Model request failed, the segments will be checked again on the next run: {type(e).__name__}, {e}")
+            return
+        finally:
+            log_cascade_stats()
+            model_executor.log_stats()
+        if response is None:
+            logger.info("Model cascade found no announcement, no notification sent.")
+            store.set_checkpoint("detector", segments[-1].id)
+            return
+        save_response(model_response=response, save_dir="responses")
+        if parse_code_word(response) is None:
+            # the model did not answer in the expected format, send its whole response instead
+            dispatcher.dispatch(message=response)
+            if aired_at is not None:
+                observe("air_to_alert", time.time() - aired_at)
+        store.set_checkpoint("detector", segments[-1].id)
+        logger.info(f"model response: {response}")
+        print(f"model response: {response}")
+        log_connection_stats()
+    finally:
+        if dispatcher is not None:
+            dispatcher.close()
+        transcription_executor.close()
+        model_executor.close()
+        store.close()
+
+
+def main_pipelined(
+        url: str = 'https://18743.live.streamtheworld.com/KQMVFM.mp3',
+        duration: int = 660,
+        segment_seconds: int = 60,
+        overlap_seconds: int = 5,
+        dispatcher: Optional[NotificationDispatcher] = None,
+        rate_limiter: Optional[ProviderRateLimiter] = None
+) -> list:
+    """
+    Runs capture, transcription, detection and notification as concurrent pipeline stages.
+
+    The stream is captured as overlapping segments, and every segment is transcribed and
+    checked for the winning word as soon as it lands, while the next one is still recording.
+    Segments stored past the detector checkpoint by an earlier run are checked again first.
+
+    :param url: The URL of the audio stream.
+    :param duration: The total capture duration in seconds.
+    :param segment_seconds: The length of each captured segment in seconds.
+    :param overlap_seconds: The audio shared by consecutive segments in seconds.
+    :param dispatcher: The dispatcher the alerts are sent with, defaults to one configured from the environment.
+    :param rate_limiter: The transcription rate limiter, defaults to Groq's free tier limits.
+    :return: The model responses, one per segment that mentioned a code word.
+    """
+    completed_recordings_directory = "recordings/completed"
+    archive_recordings_directory = "recordings/archive"
+    os.makedirs(archive_recordings_directory, exist_ok=True)
+
+    dispatcher = dispatcher or NotificationDispatcher.from_env(save_request_response=True)
+    warm_up(textbelt_url=dispatcher.textbelt_url)
+    client = get_groq_client()
+    cache = TranscriptionCache()
+    rate_limiter = rate_limiter or ProviderRateLimiter()
+    transcription_executor = HedgedExecutor(name="groq", deadline_seconds=120)
+    model_executor = HedgedExecutor(name="openai", deadline_seconds=60)
+    store = TranscriptStore()
+    # transcription runs on two workers, so segments reach detection out of order
+    checkpoint = CheckpointTracker(store=store, name="detector")
+
+    def replay(emit, backlog: List[Segment]) -> None:
+        try:
+            for segment in backlog:
+                emit(segment)
+        except PipelineStopped:
+            pass
+
+    def capture(emit) -> None:
+        # segments an earlier run stored but did not finish detecting, for example because the model request failed;
+        # they are fed to detection from their own thread, so a long backlog does not hold up the capture
+        backlog = list(store.iter_since(last_id=store.get_checkpoint("detector")))
+        for segment in backlog:
+            checkpoint.register(segment.id)
+        if backlog:
+            logger.info(f"Checking {len(backlog)} segment(s) an earlier run did not finish detecting.")
+        replay_thread = threading.Thread(target=replay, args=(emit, backlog), name="replay", daemon=True)
+        replay_thread.start()
+        try:
+            capture_segments(url=url, duration=duration, segment_seconds=segment_seconds, overlap_seconds=overlap_seconds,
+                             completed_recording_directory=completed_recordings_directory, on_segment=emit)
+        finally:
+            replay_thread.join()
+
+    def transcribe(item: Union[str, Segment]) -> Tuple[int, str]:
+        if isinstance(item, Segment):
+            # already stored by an earlier run
+            return item.id, item.text
+        full_path = item
+        abbrevFileName = os.path.basename(full_path)
+        text, timeline, model = transcribe_recording_timed(client=client, full_path=full_path, cache=cache, rate_limiter=rate_limiter,
+                                                           executor=transcription_executor, fallback_model="whisper-large-v3-turbo", trim_non_speech=True)
+        with checkpoint.lock:
+            segment_id = store_transcription(store=store, text=text, full_path=full_path, model=model, timeline=timeline)
+            checkpoint.register(segment_id)
+        shutil.move(full_path, archive_recordings_directory)
+        logger.info(f"{abbrevFileName} moved to {archive_recordings_directory}")
+        return segment_id, text
+
+    def detect(segment: Tuple[int, str]) -> Optional[str]:
+        segment_id, text_transcript = segment
+        with span("detection"):
+            hits = detect_candidate_announcements(text=text_transcript)
+        if not hits:
+            checkpoint.done(segment_id)
+            return None
+        timeline = store.get_timeline(segment_id)
+        lag = log_air_lag(timeline=timeline, text=text_transcript, char_offset=hits[0].start) if timeline is not None else None
+        aired_at = None if lag is None else time.time() - lag
+        context = build_transcript_context(text=text_transcript, hits=hits)
+        # a failed model request raises, leaving the segment below the checkpoint; the next run, one-shot or
+        # pipelined, reads every segment past the checkpoint and checks it again
+        response = run_cascade(system_prompt=SYSTEM_PROMPT, user_prompt=build_user_prompt(text_transcript=context), text=context,
+                               on_code_word=lambda word: alert_code_word(dispatcher=dispatcher, word=word, station="Movin 92.5", aired_at=aired_at), executor=model_executor)
+        checkpoint.done(segment_id)
+        return response
+
+    def notify(response: str) -> str:
+        save_response(model_response=response, save_dir="responses")
+        if parse_code_word(response) is None:
+            # the code word alert already went out while the response streamed, unless the format was not followed
+            dispatcher.dispatch(message=response)
+        logger.info(f"model response: {response}")
+        return response
+
+    responses = run_pipeline(producer=capture, stages=[
+        Stage(name="transcription", func=transcribe, workers=2),
+        Stage(name="detection", func=detect),
+        Stage(name="notification", func=notify),
+    ])
+    dispatcher.close()
+    cache.log_stats()
+    log_cascade_stats()
+    transcription_executor.log_stats()
+    model_executor.log_stats()
+    transcription_executor.close()
+    model_executor.close()
+    store.close()
+    log_connection_stats()
+    export_metrics(mode="pipelined")
+    return responses
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Listen to Movin 92.5 for the winning word and text it out.")
+    parser.add_argument("--pipelined", action="store_true", help="capture in overlapping segments and process each one while the next records")
+    args = parser.parse_args()
+    if args.pipelined:
+        main_pipelined()
+    else:
+        main()
@@ -1,6 +1,53 @@
 import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
 
-from openai import OpenAI
+from clients import get_openai_client
+from detection import TRIGGER_HIT_WEIGHT, score_announcement
+from hedging import HedgedExecutor
+from instrumentation import observe, span
+
+# Appended to the system prompt of streamed requests so the code word can be read from the first line
+CODE_WORD_FORMAT = """Start your reply with a single line of the form "CODE_WORD: <word>", or "CODE_WORD: NONE" if the winning word cannot be determined. Explain your answer on the lines that follow."""
+
+_CODE_WORD_LINE = re.compile(r"^[\s*#>]*CODE_WORD[\s*]*:[\s*]*(.*?)[\s*]*$", re.IGNORECASE)
+
+# Models and thresholds of the tiers tried by run_cascade
+CASCADE_CONFIG = {
+    # windows the local heuristic scores below this are dropped without any model call; a single trigger
+    # phrase is not below it, so an ambiguous window with a hit is always screened by a model
+    "heuristic_reject_below": TRIGGER_HIT_WEIGHT,
+    # windows it scores at or above this skip the screen and go straight to the final model
+    "heuristic_escalate_above": 0.8,
+    "screen_model": "gpt-4o-mini",
+    # windows the screen model rates below this probability are dropped, anything else escalates
+    "screen_reject_below": 0.3,
+    "final_model": "gpt-4o",
+    # the model hedged or fallback requests of the final tier go to, None to repeat the request with final_model
+    "final_fallback_model": "gpt-4o-mini",
+}
+
+SCREEN_SYSTEM_PROMPT = """You screen radio transcripts for contest announcements. Reply with only a number between 0 and 1: the probability that the transcript announces a specific winning, code, magic or entry word that listeners should use."""
+
+# a lookbehind rather than \b, which never matches between a space and the "." of ".85"
+_PROBABILITY = re.compile(r"(?<![\w.])(0(?:\.\d+)?|1(?:\.0+)?|\.\d+)\b")
+
+_cascade_stats = {}
+_cascade_lock = threading.Lock()
+
+
+class ModelRequestError(Exception):
+    """Raised when a model request failed, as opposed to the model finding no code word."""
+
+
+class CascadeDecision(NamedTuple):
+    """The outcome of one tier of the cascade for one transcript window."""
+    tier: str
+    score: Optional[float]
+    escalate: bool
+    latency_seconds: float
 
 
 def run_openai(system_prompt: str, user_prompt: str) -> str:
@@ -20,19 +67,295 @@ def run_openai(system_prompt: str, user_prompt: str) -> str:
     # model = "gpt-4-turbo-preview"
     model = "gpt-4o"
     # model = "gpt-3.5-turbo"
-    client = OpenAI()
+    client = get_openai_client()
 
     logger.info(msg=f"Sending request to {model}.")
 
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        with span("model.request"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ]
+            )
         logger.info(msg="Model response received.")
         return response.choices[0].message.content
     except Exception as e:
         logger.error(f"An unexpected error occurred getting models response: {type(e).__name__}, {e}")
+
+
+def parse_code_word_line(line: str) -> Optional[str]:
+    """
+    Reads the code word from a "CODE_WORD: <word>" line.
+
+    Args:
+        line (str): The first line of a model response.
+
+    Returns:
+        Optional[str]: The code word, "" when the model answered NONE, or None when the line is not in the expected format.
+    """
+    match = _CODE_WORD_LINE.match(line)
+    if match is None:
+        return None
+    word = match.group(1).strip().strip("'\"`.").strip()
+    return "" if word.upper() in ("NONE", "") else word
+
+
+def parse_code_word(response: Optional[str]) -> Optional[str]:
+    """
+    Reads the code word from a complete model response in the CODE_WORD format.
+
+    Args:
+        response (str): The model response.
+
+    Returns:
+        Optional[str]: The code word, "" when the model answered NONE, or None when the response is not in the expected format.
+    """
+    for line in (response or "").splitlines():
+        if line.strip():
+            return parse_code_word_line(line)
+    return None
+
+
+@span("model.stream")
+def _stream_completion(model: str, messages: List[dict], on_first_line: Callable[[str], None], cancelled: threading.Event) -> str:
+    client = get_openai_client()
+    start_time = time.perf_counter()
+    parts = []
+    first_line_parsed = False
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True)
+    try:
+        for chunk in stream:
+            if cancelled.is_set():
+                # another attempt already answered, stop reading and drop the connection
+                break
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            parts.append(delta)
+            if not first_line_parsed and "\n" in delta:
+                text = "".join(parts).lstrip()
+                if "\n" in text:
+                    first_line_parsed = True
+                    observe("model.first_line", time.perf_counter() - start_time)
+                    on_first_line(text.split("\n", 1)[0])
+    finally:
+        stream.close()
+    response = "".join(parts)
+    if not first_line_parsed and not cancelled.is_set():
+        # the reply was a single line
+        on_first_line(response.strip())
+    return response
+
+
+def run_openai_streaming(
+        system_prompt: str,
+        user_prompt: str,
+        on_code_word: Optional[Callable[[str], None]] = None,
+        model: str = "gpt-4o",
+        executor: Optional[HedgedExecutor] = None,
+        fallback_model: Optional[str] = None
+) -> str:
+    """
+        Run the OpenAI model with streaming, reporting the code word as soon as the model writes it.
+
+        The model is asked to put the code word on the first line of its reply. As soon as that line
+        is complete, on_code_word is called with the word, so notifications can go out while the rest
+        of the explanation is still being generated.
+
+        With an executor the request has a deadline and is hedged when it runs long, with a second
+        stream from fallback_model (or the same model). on_code_word is still called at most once,
+        by whichever stream names the word first, and the losing stream is closed.
+
+        Args:
+            system_prompt (str): The system prompt for the OpenAI model.
+            user_prompt (str): The user prompt for the OpenAI model.
+            on_code_word (Callable[[str], None]): Called once with the code word, unless the model answers NONE.
+            model (str): The OpenAI model to use.
+            executor (HedgedExecutor): Optional executor adding deadlines, hedging and circuit breaking to the request.
+            fallback_model (str): The model of the hedged or fallback stream, None to repeat the request with model.
+
+        Returns:
+            str: The complete response from the OpenAI model.
+
+        Raises:
+            ModelRequestError: If the request failed, so callers can tell a failure from a reply without a code word.
+        """
+    # Get the logger
+    logger = logging.getLogger(__name__)
+
+    logger.info(msg=f"Sending streaming request to {model}.")
+
+    messages = [
+        {"role": "system", "content": f"{system_prompt}\n\n{CODE_WORD_FORMAT}"},
+        {"role": "user", "content": user_prompt}
+    ]
+    cancelled = threading.Event()
+    reported = []
+    lock = threading.Lock()
+
+    def on_first_line(line: str) -> None:
+        word = parse_code_word_line(line)
+        with lock:
+            if reported:
+                return
+            reported.append(word)
+        logger.info(msg=f"Model answered code word {word!r} before the rest of the response.")
+        if word and on_code_word is not None:
+            on_code_word(word)
+
+    try:
+        if executor is None:
+            response = _stream_completion(model=model, messages=messages, on_first_line=on_first_line, cancelled=cancelled)
+        else:
+            fallback = (lambda: _stream_completion(model=fallback_model, messages=messages, on_first_line=on_first_line, cancelled=cancelled)) if fallback_model else None
+            try:
+                response = executor.call(primary=lambda: _stream_completion(model=model, messages=messages, on_first_line=on_first_line, cancelled=cancelled), fallback=fallback)
+            finally:
+                cancelled.set()
+        logger.info(msg="Model response received.")
+        return response
+    except Exception as e:
+        logger.error(f"An unexpected error occurred getting models response: {type(e).__name__}, {e}")
+        raise ModelRequestError(f"{model} request failed: {type(e).__name__}, {e}") from e
+
+
+def configure_cascade(**settings: Any) -> None:
+    """
+    Changes the models and thresholds used by run_cascade.
+
+    :param settings: Any of the keys of CASCADE_CONFIG.
+    """
+    unknown = set(settings) - set(CASCADE_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown cascade settings: {', '.join(sorted(unknown))}")
+    CASCADE_CONFIG.update(settings)
+
+
+def _record_decision(decision: CascadeDecision) -> None:
+    with _cascade_lock:
+        stats = _cascade_stats.setdefault(decision.tier, {"calls": 0, "escalated": 0, "seconds": 0.0})
+        stats["calls"] += 1
+        stats["escalated"] += int(decision.escalate)
+        stats["seconds"] += decision.latency_seconds
+
+
+def screen_window(text: str, model: Optional[str] = None) -> Optional[float]:
+    """
+    Asks the cheap screening model how likely a transcript window is to announce a code word.
+
+    Args:
+        text (str): The transcript window.
+        model (str): The screening model, defaults to CASCADE_CONFIG["screen_model"].
+
+    Returns:
+        Optional[float]: The probability, or None when the request failed or the reply was not a number.
+    """
+    # Get the logger
+    logger = logging.getLogger(__name__)
+
+    model = model or CASCADE_CONFIG["screen_model"]
+    client = get_openai_client()
+    try:
+        with span("model.screen"):
+            response = client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SCREEN_SYSTEM_PROMPT},
+                    {"role": "user", "content": text}
+                ],
+                max_tokens=5,
+                temperature=0
+            )
+        reply = response.choices[0].message.content or ""
+    except Exception as e:
+        logger.error(f"An unexpected error occurred getting screening response: {type(e).__name__}, {e}")
+        return None
+    match = _PROBABILITY.search(reply)
+    if match is None:
+        logger.warning(f"Screening model {model} did not reply with a probability: {reply!r}")
+        return None
+    return float(match.group(1))
+
+
+@span("model.cascade")
+def run_cascade(system_prompt: str, user_prompt: str, text: str, on_code_word: Optional[Callable[[str], None]] = None, executor: Optional[HedgedExecutor] = None) -> Optional[str]:
+    """
+        Run the transcript window through increasingly expensive tiers, calling the final model only when needed.
+
+        The tiers are:
+            1. heuristic: detection.score_announcement, free. Low scores stop here, high scores skip the screen.
+            2. screen: a cheap model rates the window. Confident negatives stop here.
+            3. final: the final model extracts the code word with run_openai_streaming.
+        The thresholds and models are read from CASCADE_CONFIG. Every decision is logged with its latency.
+
+        Args:
+            system_prompt (str): The system prompt for the final model.
+            user_prompt (str): The user prompt for the final model.
+            text (str): The transcript window the prompts were built from, scored by the first two tiers.
+            on_code_word (Callable[[str], None]): Passed on to run_openai_streaming.
+            executor (HedgedExecutor): Optional executor adding deadlines, hedging and circuit breaking to the final model's request.
+
+        Returns:
+            Optional[str]: The final model's response, or None when a cheaper tier rejected the window.
+
+        Raises:
+            ModelRequestError: If the final model's request failed. The window was not rejected and should be tried again.
+        """
+    # Get the logger
+    logger = logging.getLogger(__name__)
+
+    config = dict(CASCADE_CONFIG)
+    decisions: List[CascadeDecision] = []
+
+    def decide(tier: str, score: Optional[float], escalate: bool, start_time: float) -> None:
+        decision = CascadeDecision(tier=tier, score=score, escalate=escalate, latency_seconds=time.monotonic() - start_time)
+        decisions.append(decision)
+        _record_decision(decision)
+        score_text = "n/a" if score is None else f"{score:.2f}"
+        logger.info(f"Cascade {tier} tier scored {score_text} in {decision.latency_seconds:.3f} seconds, {'escalating' if escalate else 'stopping'}.")
+
+    start_time = time.monotonic()
+    score = score_announcement(text=text)
+    skip_screen = score >= config["heuristic_escalate_above"]
+    decide(tier="heuristic", score=score, escalate=score >= config["heuristic_reject_below"], start_time=start_time)
+    if not decisions[-1].escalate:
+        return None
+
+    if not skip_screen:
+        start_time = time.monotonic()
+        probability = screen_window(text=text, model=config["screen_model"])
+        # an unusable screen reply is ambiguous, so it escalates
+        decide(tier="screen", score=probability, escalate=probability is None or probability >= config["screen_reject_below"], start_time=start_time)
+        if not decisions[-1].escalate:
+            return None
+
+    start_time = time.monotonic()
+    try:
+        return run_openai_streaming(system_prompt=system_prompt, user_prompt=user_prompt, on_code_word=on_code_word, model=config["final_model"],
+                                    executor=executor, fallback_model=config["final_fallback_model"])
+    finally:
+        decide(tier="final", score=None, escalate=False, start_time=start_time)
+
+
+def cascade_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Reports how often each tier of the cascade ran, how often it escalated and how long it took.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The calls, escalations and total seconds per tier.
+    """
+    with _cascade_lock:
+        return {tier: dict(stats) for tier, stats in _cascade_stats.items()}
+
+
+def log_cascade_stats() -> None:
+    """Logs the number of calls, escalations and mean latency of every tier of the cascade."""
+    logger = logging.getLogger(__name__)
+    for tier, stats in cascade_stats().items():
+        logger.info(f"Cascade {tier} tier: {stats['calls']} call(s), {stats['escalated']} escalated, "
+                    f"{stats['seconds'] / stats['calls']:.3f} seconds on average.")
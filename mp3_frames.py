@@ -0,0 +1,238 @@
+import logging
+from typing import Iterator, List, NamedTuple, Optional
+
+# Bitrates in kbps, indexed by [version is MPEG-1][layer][bitrate index]
+_BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+# Sample rates in Hz, indexed by the two version bits and the sample rate index
+_SAMPLE_RATES = {
+    0b11: [44100, 48000, 32000],  # MPEG-1
+    0b10: [22050, 24000, 16000],  # MPEG-2
+    0b00: [11025, 12000, 8000],   # MPEG-2.5
+}
+# Layer bits to layer number
+_LAYERS = {0b11: 1, 0b10: 2, 0b01: 3}
+
+
+class FrameHeader(NamedTuple):
+    """An MPEG audio frame located in a byte buffer."""
+    offset: int
+    length: int
+    bitrate_kbps: int
+    sample_rate: int
+    samples: int
+
+    @property
+    def seconds(self) -> float:
+        return self.samples / self.sample_rate
+
+
+class Mp3Chunk(NamedTuple):
+    """A run of whole frames cut from a recording, with its position in the recording."""
+    start_seconds: float
+    end_seconds: float
+    data: bytes
+
+
+def parse_frame_header(data: bytes, offset: int = 0) -> Optional[FrameHeader]:
+    """
+    Parses the four byte MPEG audio frame header at an offset.
+
+    :param data: The buffer holding the audio.
+    :param offset: The offset of the candidate header.
+    :return: The frame, or None if the bytes at the offset are not a valid header.
+    """
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2 = data[offset], data[offset + 1], data[offset + 2]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    version_bits = (b1 >> 3) & 0b11
+    layer = _LAYERS.get((b1 >> 1) & 0b11)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 0b11
+    if version_bits not in _SAMPLE_RATES or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    padding = (b2 >> 1) & 0b1
+
+    mpeg1 = version_bits == 0b11
+    bitrate_kbps = _BITRATES[mpeg1][layer][bitrate_index]
+    sample_rate = _SAMPLE_RATES[version_bits][sample_rate_index]
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate_kbps * 1000 // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples = 1152
+        length = 144 * bitrate_kbps * 1000 // sample_rate + padding
+    else:
+        samples = 576
+        length = 72 * bitrate_kbps * 1000 // sample_rate + padding
+    return FrameHeader(offset=offset, length=length, bitrate_kbps=bitrate_kbps, sample_rate=sample_rate, samples=samples)
+
+
+def _skip_id3v2(data: bytes) -> int:
+    # an ID3v2 tag stores its size as a 28 bit synchsafe integer
+    if len(data) >= 10 and data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        return 10 + size + footer
+    return 0
+
+
+def iter_frames(data: bytes) -> Iterator[FrameHeader]:
+    """
+    Iterates over the frames of an MP3 buffer without decoding them.
+
+    Garbage between frames (a leading ID3 tag, a partial frame where a stream capture started,
+    inline metadata) is skipped by searching for the next header that is followed by another valid header.
+
+    :param data: The buffer holding the audio.
+    :return: An iterator of frames, in order.
+    """
+    offset = _skip_id3v2(data)
+    end = len(data)
+    while offset + 4 <= end:
+        frame = parse_frame_header(data, offset)
+        if frame is not None and frame.length > 4:
+            next_offset = offset + frame.length
+            # the last frame may be followed by nothing, anything else must be followed by a frame
+            if next_offset == end or (next_offset < end and parse_frame_header(data, next_offset) is not None):
+                yield frame
+                offset = next_offset
+                continue
+            if next_offset > end:
+                # truncated final frame
+                return
+        offset = data.find(b"\xff", offset + 1)
+        if offset < 0:
+            return
+
+
+def audio_duration(data: bytes) -> float:
+    """
+    Computes the duration of an MP3 buffer from its frame headers.
+
+    :param data: The buffer holding the audio.
+    :return: The duration in seconds.
+    """
+    return sum(frame.seconds for frame in iter_frames(data))
+
+
+def split_frames(data: bytes, chunk_seconds: float = 120, overlap_seconds: float = 5) -> List[Mp3Chunk]:
+    """
+    Cuts an MP3 recording into pieces at frame boundaries, with a small overlap between consecutive pieces.
+
+    Every piece is a valid MP3 on its own, since it is made of whole frames. A piece starts
+    overlap_seconds before the previous one ends, so a word spoken across the cut is heard
+    completely by at least one of them.
+
+    :param data: The buffer holding the audio.
+    :param chunk_seconds: The target length of each piece in seconds.
+    :param overlap_seconds: The audio shared by consecutive pieces in seconds.
+    :return: The pieces, in order.
+    """
+    if chunk_seconds <= 0:
+        raise ValueError("Chunk length must be positive")
+    if not 0 <= overlap_seconds < chunk_seconds:
+        raise ValueError("Overlap must be non-negative and shorter than the chunk length")
+
+    frames = list(iter_frames(data))
+    if not frames:
+        return []
+    # start time of every frame
+    starts = []
+    elapsed = 0.0
+    for frame in frames:
+        starts.append(elapsed)
+        elapsed += frame.seconds
+    total_seconds = elapsed
+
+    chunks = []
+    first = 0
+    while first < len(frames):
+        chunk_start = starts[first]
+        last = first
+        while last + 1 < len(frames) and starts[last + 1] < chunk_start + chunk_seconds:
+            last += 1
+        chunk_end = starts[last] + frames[last].seconds
+        chunks.append(Mp3Chunk(start_seconds=chunk_start, end_seconds=chunk_end,
+                               data=bytes(data[frames[first].offset:frames[last].offset + frames[last].length])))
+        if last + 1 >= len(frames):
+            break
+        # the next piece starts overlap_seconds before this one ends, but always moves forward
+        next_first = last + 1
+        while next_first - 1 > first and starts[next_first - 1] >= chunk_end - overlap_seconds:
+            next_first -= 1
+        first = next_first
+
+    logger = logging.getLogger(__name__)
+    logger.info(f"Split {total_seconds:.1f} seconds of audio into {len(chunks)} piece(s).")
+    return chunks
+
+
+def slice_seconds(data: bytes, start_seconds: float, end_seconds: float) -> bytes:
+    """
+    Cuts the frames between two times out of an MP3 buffer.
+
+    :param data: The buffer holding the audio.
+    :param start_seconds: The start of the slice, relative to the start of the buffer.
+    :param end_seconds: The end of the slice, relative to the start of the buffer.
+    :return: The whole frames overlapping the interval.
+    """
+    elapsed = 0.0
+    first_offset = None
+    last_end = None
+    for frame in iter_frames(data):
+        frame_end = elapsed + frame.seconds
+        if frame_end > start_seconds and elapsed < end_seconds:
+            if first_offset is None:
+                first_offset = frame.offset
+            last_end = frame.offset + frame.length
+        elif elapsed >= end_seconds:
+            break
+        elapsed = frame_end
+    if first_offset is None:
+        return b""
+    return bytes(data[first_offset:last_end])
+
+
+def make_synthetic_frames(seconds: float, bitrate_kbps: int = 128, sample_rate: int = 44100) -> bytes:
+    """
+    Builds a buffer of silent MPEG-1 Layer III frames, for exercising the parser without real audio.
+
+    :param seconds: The duration of audio to generate.
+    :param bitrate_kbps: The bitrate written in every header.
+    :param sample_rate: The sample rate written in every header (44100, 48000 or 32000).
+    :return: The generated frames.
+    """
+    bitrate_index = _BITRATES[True][3].index(bitrate_kbps)
+    sample_rate_index = _SAMPLE_RATES[0b11].index(sample_rate)
+    frames = []
+    elapsed = 0.0
+    index = 0
+    while elapsed < seconds:
+        # pad every other frame so the average bitrate stays exact for 44.1 kHz
+        padding = index % 2 if sample_rate == 44100 else 0
+        header = bytes([0xFF, 0xFB, (bitrate_index << 4) | (sample_rate_index << 2) | (padding << 1), 0xC4])
+        length = 144 * bitrate_kbps * 1000 // sample_rate + padding
+        frames.append(header + bytes(length - 4))
+        elapsed += 1152 / sample_rate
+        index += 1
+    return b"".join(frames)
+
+
+if __name__ == "__main__":
+    audio = b"junk" + make_synthetic_frames(seconds=300)
+    print(f"duration: {audio_duration(audio):.2f} seconds")
+    for chunk in split_frames(audio, chunk_seconds=120, overlap_seconds=5):
+        print(f"{chunk.start_seconds:7.2f} - {chunk.end_seconds:7.2f} seconds, {len(chunk.data)} bytes, duration check {audio_duration(chunk.data):.2f}")
@@ -0,0 +1,190 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from email_sender import send_email_batch
+from instrumentation import observe
+from text_belt_sms_sender import TEXTBELT_URL, send_single_sms
+
+
+class Delivery(NamedTuple):
+    """The outcome of sending a notification to one recipient."""
+    channel: str
+    recipient: str
+    ok: bool
+    latency_seconds: float
+    error: Optional[str] = None
+
+
+class NotificationDispatcher:
+    """
+    Sends a notification to every recipient on every channel at once.
+
+    Each SMS is posted from its own worker thread, and all emails of a notification go out
+    over one SMTP connection on another worker, so the last recipient hears about the code
+    word about as soon as the first. A message identical to one being sent, or delivered to at
+    least one recipient within the dedupe window, is not sent again. Every delivery is recorded
+    with its latency from the start of the dispatch.
+    """
+
+    def __init__(
+            self,
+            phone_numbers: List[str],
+            emails: Optional[List[str]] = None,
+            email_sender: Optional[str] = None,
+            email_password: Optional[str] = None,
+            smtp_host: str = 'smtp.gmail.com',
+            smtp_port: int = 587,
+            smtp_use_tls: bool = True,
+            textbelt_url: str = TEXTBELT_URL,
+            dedupe_window_seconds: float = 600,
+            max_workers: int = 8,
+            save_request_response: bool = False
+    ):
+        """
+        :param phone_numbers: The phone numbers to text; empty entries are ignored.
+        :param emails: The email addresses to notify; empty entries are ignored.
+        :param email_sender: The address emails are sent from.
+        :param email_password: The password of the sender's account.
+        :param smtp_host: The SMTP server.
+        :param smtp_port: The SMTP server's port.
+        :param smtp_use_tls: Whether to upgrade the SMTP connection with STARTTLS.
+        :param textbelt_url: The Textbelt endpoint.
+        :param dedupe_window_seconds: How long an identical message is suppressed after it was sent.
+        :param max_workers: The number of deliveries in flight at once.
+        :param save_request_response: Whether to save the Textbelt responses as json.
+        """
+        self.phone_numbers = [number for number in phone_numbers if number]
+        self.emails = [email for email in (emails or []) if email]
+        self.email_sender = email_sender
+        self.email_password = email_password
+        self.smtp_host = smtp_host
+        self.smtp_port = smtp_port
+        self.smtp_use_tls = smtp_use_tls
+        self.textbelt_url = textbelt_url
+        self.dedupe_window_seconds = dedupe_window_seconds
+        self.save_request_response = save_request_response
+        self.deliveries = []
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="notify")
+        self._sent = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "NotificationDispatcher":
+        """
+        Builds a dispatcher from the PHONE_NUMBER_ONE/TWO/THREE, EMAIL_RECIPIENTS (comma separated),
+        EMAIL_SENDER and GMAIL_PASSWORD environment variables.
+        """
+        phone_numbers = [os.getenv("PHONE_NUMBER_ONE"), os.getenv("PHONE_NUMBER_TWO"), os.getenv("PHONE_NUMBER_THREE")]
+        emails = [email.strip() for email in os.getenv("EMAIL_RECIPIENTS", "").split(",")]
+        return cls(phone_numbers=phone_numbers, emails=emails, email_sender=os.getenv("EMAIL_SENDER"),
+                   email_password=os.getenv("GMAIL_PASSWORD"), **kwargs)
+
+    @staticmethod
+    def _dedupe_key(message: str) -> str:
+        return hashlib.sha256(" ".join(message.lower().split()).encode("utf-8")).hexdigest()
+
+    def _claim(self, key: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            # forget messages whose window has passed
+            self._sent = {k: t for k, t in self._sent.items() if now - t < self.dedupe_window_seconds}
+            if key in self._sent:
+                return False
+            # marked before sending, so a concurrent dispatch of the same message is skipped while this one is in flight
+            self._sent[key] = now
+            return True
+
+    def _forget(self, key: str) -> None:
+        with self._lock:
+            self._sent.pop(key, None)
+
+    def _send_sms(self, phone_number: str, message: str, start_time: float) -> List[Delivery]:
+        try:
+            body = send_single_sms(phone_number=phone_number, message=message, save_request_response=self.save_request_response, textbelt_url=self.textbelt_url)
+            ok = bool(body.get("success", True))
+            error = None if ok else str(body.get("error"))
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}, {e}"
+        return [Delivery(channel="sms", recipient=phone_number, ok=ok, latency_seconds=time.monotonic() - start_time, error=error)]
+
+    def _send_emails(self, subject: str, message: str, start_time: float) -> List[Delivery]:
+        batch_offset = time.monotonic() - start_time
+        try:
+            latencies = send_email_batch(subject=subject, body=message, to_emails=self.emails, from_email=self.email_sender,
+                                         password=self.email_password, smtp_host=self.smtp_host, smtp_port=self.smtp_port,
+                                         use_tls=self.smtp_use_tls)
+        except Exception as e:
+            failed_at = time.monotonic() - start_time
+            return [Delivery(channel="email", recipient=email, ok=False, latency_seconds=failed_at, error=f"{type(e).__name__}, {e}") for email in self.emails]
+        return [Delivery(channel="email", recipient=email, ok=True, latency_seconds=batch_offset + latency) for email, latency in latencies.items()]
+
+    def dispatch(self, message: str, subject: str = "Code word alert") -> List[Delivery]:
+        """
+        Sends a message to every recipient and waits for all deliveries to finish.
+
+        :param message: The message to send.
+        :param subject: The subject used for emails.
+        :return: One delivery per recipient, or an empty list when the message was a duplicate.
+        """
+        logger = logging.getLogger(__name__)
+
+        if not message:
+            return []
+        key = self._dedupe_key(message)
+        if not self._claim(key):
+            logger.info(f"Skipping notification, an identical message was sent in the last {self.dedupe_window_seconds:.0f} seconds.")
+            return []
+
+        start_time = time.monotonic()
+        futures = [self._executor.submit(self._send_sms, number, message, start_time) for number in self.phone_numbers]
+        if self.emails and self.email_sender:
+            futures.append(self._executor.submit(self._send_emails, subject, message, start_time))
+
+        deliveries = []
+        for future in futures:
+            deliveries.extend(future.result())
+        with self._lock:
+            self.deliveries.extend(deliveries)
+        # only a message that reached someone is suppressed, a retry of one that reached nobody goes out
+        if not any(delivery.ok for delivery in deliveries):
+            self._forget(key)
+
+        for delivery in deliveries:
+            if delivery.ok:
+                logger.info(f"Notified {delivery.channel} {delivery.recipient} in {delivery.latency_seconds:.2f} seconds.")
+            else:
+                logger.error(f"Failed to notify {delivery.channel} {delivery.recipient}: {delivery.error}")
+        return deliveries
+
+    def latency_summary(self) -> Dict[str, float]:
+        """Returns the worst and mean delivery latency of every successful delivery so far."""
+        with self._lock:
+            latencies = [d.latency_seconds for d in self.deliveries if d.ok]
+        if not latencies:
+            return {"deliveries": 0}
+        return {"deliveries": len(latencies), "max_seconds": max(latencies), "mean_seconds": sum(latencies) / len(latencies)}
+
+    def close(self) -> None:
+        """Waits for in-flight deliveries and stops the worker threads."""
+        self._executor.shutdown(wait=True)
+
+
+def alert_code_word(dispatcher: NotificationDispatcher, word: str, station: str, aired_at: Optional[float] = None) -> None:
+    """
+    Notifies every recipient of the code word as soon as the model has named it.
+
+    :param dispatcher: The dispatcher used to send the alert.
+    :param word: The code word.
+    :param station: The station that announced it, named in the alert.
+    :param aired_at: When the announcement aired, in epoch seconds, to record the air-to-alert latency.
+    """
+    logger = logging.getLogger(__name__)
+    logger.info(f"Code word {word!r} found, alerting before the model has finished its explanation.")
+    dispatcher.dispatch(message=f"{station} code word: {word}")
+    if aired_at is not None:
+        observe("air_to_alert", time.time() - aired_at)
@@ -0,0 +1,249 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Marks the end of the stream of items flowing through a queue
+_SENTINEL = object()
+
+
+class PipelineStopped(Exception):
+    """Raised inside the producer when the pipeline has been asked to stop."""
+
+
+class Stage:
+    """
+    A pipeline stage that applies a function to every item taken from its input queue.
+
+    The function returns the item to hand to the next stage, or None to drop it (for example
+    a transcript in which nothing worth notifying about was detected).
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1, max_queue_size: int = 4):
+        """
+        Parameters:
+        - name (str): The name of the stage, used in logs and statistics.
+        - func (Callable[[Any], Any]): The function applied to each item.
+        - workers (int): The number of worker threads running the function.
+        - max_queue_size (int): The capacity of the stage's input queue; producers block when it is full.
+        """
+        if not isinstance(workers, int) or workers <= 0:
+            raise ValueError("Workers must be a positive integer")
+        if not isinstance(max_queue_size, int) or max_queue_size <= 0:
+            raise ValueError("Max queue size must be a positive integer")
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.input_queue = queue.Queue(maxsize=max_queue_size)
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self._lock = threading.Lock()
+        self._finished_workers = 0
+
+    def put(self, item: Any) -> None:
+        """Puts an item on the stage's input queue, blocking while the queue is full."""
+        start_time = time.monotonic()
+        self.input_queue.put(item)
+        waited = time.monotonic() - start_time
+        with self._lock:
+            self.blocked_seconds += waited
+            self.max_queue_depth = max(self.max_queue_depth, self.input_queue.qsize())
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns a snapshot of the stage's counters."""
+        with self._lock:
+            return {
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "busy_seconds": round(self.busy_seconds, 3),
+                "upstream_blocked_seconds": round(self.blocked_seconds, 3),
+                "queue_depth": self.input_queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+
+class Pipeline:
+    """
+    Runs a producer and a chain of stages concurrently, joined by bounded queues.
+
+    The producer (typically the stream capture) is called with an ``emit`` function and hands
+    every item it produces to the first stage. Each stage runs in its own worker threads, so
+    segment N can be transcribed while segment N+1 is still being recorded. Because every queue
+    is bounded, a slow stage makes the stages before it wait instead of piling up work in memory.
+    """
+
+    def __init__(self, producer: Callable[[Callable[[Any], None]], Any], stages: List[Stage], producer_name: str = "capture"):
+        """
+        Parameters:
+        - producer (Callable[[Callable[[Any], None]], Any]): Called once with ``emit``; returns when it has nothing more to produce.
+        - stages (List[Stage]): The stages, in the order items flow through them.
+        - producer_name (str): The name the producer is reported under.
+        """
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        self.producer = producer
+        self.producer_name = producer_name
+        self.stages = stages
+        self.results = []
+        self.producer_seconds = 0.0
+        self.produced = 0
+        self._stop_event = threading.Event()
+        self._results_lock = threading.Lock()
+        self._produced_lock = threading.Lock()
+
+    def stop(self) -> None:
+        """
+        Asks the pipeline to shut down cleanly.
+
+        The producer is interrupted the next time it emits, and every item already queued is
+        still carried through the remaining stages before ``run`` returns.
+        """
+        self._stop_event.set()
+
+    def emit(self, item: Any) -> None:
+        """Hands an item from the producer to the first stage. The producer may call it from several threads."""
+        if self._stop_event.is_set():
+            raise PipelineStopped()
+        with self._produced_lock:
+            self.produced += 1
+        self.stages[0].put(item)
+
+    def _forward(self, index: int, item: Any) -> None:
+        if index + 1 < len(self.stages):
+            self.stages[index + 1].put(item)
+        else:
+            with self._results_lock:
+                self.results.append(item)
+
+    def _work(self, index: int) -> None:
+        logger = logging.getLogger(__name__)
+        stage = self.stages[index]
+        while True:
+            item = stage.input_queue.get()
+            if item is _SENTINEL:
+                break
+            start_time = time.monotonic()
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                result = None
+                with stage._lock:
+                    stage.failed += 1
+                logger.error(f"An unexpected error occurred in stage {stage.name}: {type(e).__name__}, {e}")
+            else:
+                with stage._lock:
+                    stage.processed += 1
+                    if result is None:
+                        stage.dropped += 1
+            finally:
+                with stage._lock:
+                    stage.busy_seconds += time.monotonic() - start_time
+            if result is not None:
+                self._forward(index, result)
+
+        # the last worker of a stage to finish passes the end of stream downstream
+        with stage._lock:
+            stage._finished_workers += 1
+            last_worker = stage._finished_workers == stage.workers
+        if last_worker and index + 1 < len(self.stages):
+            next_stage = self.stages[index + 1]
+            for _ in range(next_stage.workers):
+                next_stage.input_queue.put(_SENTINEL)
+
+    def run(self) -> List[Any]:
+        """
+        Runs the producer and every stage until all items have flowed through.
+
+        Returns:
+        List[Any]: The items returned by the last stage, in completion order.
+        """
+        logger = logging.getLogger(__name__)
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f"{stage.name}-{worker}", daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        start_time = time.monotonic()
+        try:
+            self.producer(self.emit)
+        except PipelineStopped:
+            logger.info(f"Pipeline stopped, {self.producer_name} interrupted.")
+        except Exception as e:
+            logger.error(f"An unexpected error occurred in {self.producer_name}: {type(e).__name__}, {e}")
+        finally:
+            self.producer_seconds = time.monotonic() - start_time
+            first_stage = self.stages[0]
+            for _ in range(first_stage.workers):
+                first_stage.input_queue.put(_SENTINEL)
+
+        for thread in threads:
+            thread.join()
+
+        self.log_stats()
+        return self.results
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Returns per-stage queue depth, item counts and time spent, keyed by stage name."""
+        stats = {self.producer_name: {"produced": self.produced, "busy_seconds": round(self.producer_seconds, 3)}}
+        for stage in self.stages:
+            stats[stage.name] = stage.stats()
+        return stats
+
+    def log_stats(self) -> None:
+        """Logs the statistics of the producer and every stage."""
+        logger = logging.getLogger(__name__)
+        for name, stage_stats in self.stats().items():
+            summary = ", ".join(f"{key}={value}" for key, value in stage_stats.items())
+            logger.info(f"Pipeline stage {name}: {summary}.")
+
+
+def run_pipeline(producer: Callable[[Callable[[Any], None]], Any], stages: List[Stage], producer_name: str = "capture") -> List[Any]:
+    """
+    Builds and runs a pipeline in one call.
+
+    Parameters:
+    - producer (Callable[[Callable[[Any], None]], Any]): Called once with ``emit`` to feed the first stage.
+    - stages (List[Stage]): The stages, in the order items flow through them.
+    - producer_name (str): The name the producer is reported under.
+
+    Returns:
+    List[Any]: The items returned by the last stage.
+    """
+    return Pipeline(producer=producer, stages=stages, producer_name=producer_name).run()
+
+
+if __name__ == "__main__":
+    # Example usage with fake stages standing in for capture, transcription, detection and notification
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def fake_capture(emit: Callable[[Any], None]) -> None:
+        for i in range(6):
+            time.sleep(0.2)
+            emit(f"segment_{i}.mp3")
+
+    def fake_transcribe(path: str) -> str:
+        time.sleep(0.3)
+        return f"transcript of {path}, the code word is {path[8]}" if path.endswith(("1.mp3", "4.mp3")) else f"transcript of {path}"
+
+    def fake_detect(text: str) -> Optional[str]:
+        return text if "code word" in text else None
+
+    def fake_notify(text: str) -> str:
+        print(f"notify: {text}")
+        return text
+
+    results = run_pipeline(producer=fake_capture, stages=[
+        Stage(name="transcription", func=fake_transcribe, workers=2),
+        Stage(name="detection", func=fake_detect),
+        Stage(name="notification", func=fake_notify),
+    ])
+    print(f"{len(results)} notification(s) sent.")
@@ -0,0 +1,206 @@
+import bisect
+import logging
+import math
+import re
+from typing import List, Sequence, Tuple
+
+from detection import TriggerHit
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character based estimate
+    tiktoken = None
+
+# Separator placed between non-adjacent windows of the transcript
+WINDOW_SEPARATOR = "\n...\n"
+
+SYSTEM_PROMPT = f"""You are a contestant attempting to win Olivia Rodrigo concert tickets from a radio station named 'Movin 92.5'. In order to win you must determine, then extract the winning word within a large corpus of text."""
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens gpt-4o will count for a piece of text.
+
+    Uses tiktoken's o200k_base encoding when it is installed, otherwise roughly four characters per token.
+
+    :param text: The text to measure.
+    :return: The estimated token count.
+    """
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoding is None:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def split_sentences(text: str) -> List[Tuple[int, int]]:
+    """
+    Splits text into sentences.
+
+    :param text: The text to split.
+    :return: The (start, end) character offsets of every sentence.
+    """
+    spans = []
+    start = 0
+    for match in _SENTENCE_END.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def extract_context_windows(text: str, hits: Sequence[TriggerHit], window_sentences: int = 3) -> List[Tuple[int, int]]:
+    """
+    Finds the windows of sentences surrounding each trigger hit, merging windows that overlap or touch.
+
+    :param text: The transcript the hits were found in.
+    :param hits: The trigger hits.
+    :param window_sentences: The number of sentences kept on each side of the sentence containing a hit.
+    :return: The (start, end) character offsets of each merged window, in order.
+    """
+    sentences = split_sentences(text)
+    if not sentences or not hits:
+        return []
+    sentence_starts = [start for start, _ in sentences]
+
+    # sentence index ranges around every hit
+    ranges = []
+    for hit in hits:
+        index = max(bisect.bisect_right(sentence_starts, hit.start) - 1, 0)
+        ranges.append((max(index - window_sentences, 0), min(index + window_sentences, len(sentences) - 1)))
+    ranges.sort()
+
+    merged = [list(ranges[0])]
+    for first, last in ranges[1:]:
+        if first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [(sentences[first][0], sentences[last][1]) for first, last in merged]
+
+
+def _character_window(text: str, hit: TriggerHit, size: int) -> Tuple[int, int]:
+    """Returns a window of about size characters centred on a hit, kept inside the text and trimmed to whole words."""
+    start = max(min((hit.start + hit.end - size) // 2, len(text) - size), 0)
+    end = min(start + size, len(text))
+    # do not cut a word in half at either edge, unless that would cut into the hit
+    if start > 0:
+        space = text.find(" ", start, hit.start)
+        start = space + 1 if space != -1 else start
+    if end < len(text):
+        space = text.rfind(" ", hit.end, end)
+        end = space if space != -1 else end
+    return start, end
+
+
+def trim_to_hits(text: str, hits: Sequence[TriggerHit], max_tokens: int) -> str:
+    """
+    Cuts character windows centred on the trigger hits out of text that has no usable sentence boundaries.
+
+    The budget is shared equally between the windows. When it is too small to hold a window for
+    every hit, the windows of the most recent hits are kept.
+
+    :param text: The transcript the hits were found in.
+    :param hits: The trigger hits, at least one.
+    :param max_tokens: The token budget for the returned text.
+    :return: The windows, joined by WINDOW_SEPARATOR. Never empty.
+    """
+    hits = sorted(hits)
+    budget = max_tokens * 4
+    while budget > 0:
+        for count in range(len(hits), 0, -1):
+            kept = hits[-count:]
+            size = budget // count - len(WINDOW_SEPARATOR)
+            if size < max(hit.end - hit.start for hit in kept):
+                continue
+            spans = []
+            for start, end in (_character_window(text=text, hit=hit, size=size) for hit in kept):
+                if spans and start <= spans[-1][1]:
+                    spans[-1] = (spans[-1][0], max(spans[-1][1], end))
+                else:
+                    spans.append((start, end))
+            context = WINDOW_SEPARATOR.join(text[start:end] for start, end in spans)
+            if estimate_tokens(context) <= max_tokens:
+                return context
+            # the character estimate was too generous for this text, try a smaller budget
+            break
+        budget = budget * 9 // 10
+    # not even the latest trigger phrase fits, it is still the one thing worth sending
+    return text[hits[-1].start:hits[-1].end]
+
+
+def build_transcript_context(text: str, hits: Sequence[TriggerHit], window_sentences: int = 3, max_tokens: int = 2000) -> str:
+    """
+    Reduces a transcript to the sentences around its trigger hits while staying within a token budget.
+
+    When the windows exceed the budget, the window size is reduced one sentence at a time. If even
+    the hit sentences alone are too long (a transcript without punctuation is a single sentence),
+    character windows centred on the hits are kept instead, see trim_to_hits. A transcript without
+    hits that is over budget is cut to its end.
+
+    :param text: The full transcript.
+    :param hits: The trigger hits found in the transcript.
+    :param window_sentences: The number of sentences kept on each side of a hit.
+    :param max_tokens: The hard token budget for the returned text.
+    :return: The trimmed transcript, never empty when there are hits.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not text:
+        return ""
+    tokens_before = estimate_tokens(text)
+
+    if hits:
+        for size in range(window_sentences, -1, -1):
+            windows = [text[start:end] for start, end in extract_context_windows(text=text, hits=hits, window_sentences=size)]
+            context = WINDOW_SEPARATOR.join(windows)
+            if estimate_tokens(context) <= max_tokens:
+                break
+        else:
+            context = trim_to_hits(text=text, hits=hits, max_tokens=max_tokens)
+    else:
+        context = text
+        if estimate_tokens(context) > max_tokens:
+            # keep the end of a transcript without hits, the latest speech matters most
+            context = context[-max_tokens * 4:]
+            while context and estimate_tokens(context) > max_tokens:
+                context = context[len(context) // 10 + 1:]
+
+    tokens_after = estimate_tokens(context)
+    logger.info(f"Transcript trimmed from {tokens_before} to {tokens_after} tokens ({len(hits)} trigger hit(s)).")
+    return context
+
+
+def build_user_prompt(text_transcript: str) -> str:
+    """
+    Builds the user prompt asking the model to extract the winning word from a transcript.
+
+    :param text_transcript: The transcribed radio audio to search.
+    :return: The user prompt.
+    """
+    user_prompt = f"""You are attempting to extract the winning/code word out of a large corpus of text to win Olivia Rodrigo
+    concert tickets. The winning word may be referred to as the 'winning' word, the 'code' word, the
+    'magic' word, the 'entry' word or something similar to those. If the winning word is determined, respond back with
+    the winning word, and the context or sentence that led you to determine the word. If you cannot determine the 
+    winning word, reply back saying so. The text is provided below.
+
+    <text_transcript>
+    {text_transcript}
+    </text_transcript>"""
+    return user_prompt
+
+
+if __name__ == "__main__":
+    from detection import find_trigger_phrases
+
+    logging.basicConfig(level=logging.INFO)
+    sample = " ".join(f"Filler sentence number {i}." for i in range(200))
+    sample += " Your code word this hour is vampire. Text vampire to 92.5 now. " + sample
+    print(build_transcript_context(text=sample, hits=find_trigger_phrases(sample), window_sentences=2, max_tokens=200))
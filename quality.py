@@ -0,0 +1,239 @@
+from typing import Any, List, NamedTuple, Sequence, Tuple
+
+from timeline import Timeline, response_field
+
+Span = Tuple[float, float]
+
+
+class Transcript(NamedTuple):
+    """A transcription in the verbose_json shape, with segments and words as plain dicts."""
+    text: str
+    segments: List[dict]
+    words: List[dict]
+
+
+class QualityReport(NamedTuple):
+    """The verdict of a quality scorer on one transcription."""
+    accept: bool
+    reasons: List[str]
+    # spans worth transcribing again, in seconds from the start of the audio
+    retry_spans: List[Span]
+    # spans whose text should be dropped without another request, such as hallucinated text over music
+    drop_spans: List[Span]
+
+
+def as_transcript(transcription: Any) -> Transcript:
+    """
+    Converts a transcription response, or a dict from the cache, to a Transcript.
+
+    :param transcription: The transcription.
+    :return: The transcript.
+    """
+    def to_dict(item: Any) -> dict:
+        if isinstance(item, dict):
+            return dict(item)
+        if hasattr(item, "model_dump"):
+            return item.model_dump()
+        return dict(vars(item))
+
+    return Transcript(
+        text=response_field(transcription, "text", "") or "",
+        segments=[to_dict(s) for s in response_field(transcription, "segments") or []],
+        words=[to_dict(w) for w in response_field(transcription, "words") or []],
+    )
+
+
+def merge_spans(spans: Sequence[Span], padding_seconds: float = 0.0, limit_seconds: float = float("inf")) -> List[Span]:
+    """
+    Pads spans, clamps them to the audio and merges the ones that overlap.
+
+    :param spans: The spans, in any order.
+    :param padding_seconds: Added before and after every span.
+    :param limit_seconds: The length of the audio.
+    :return: The merged spans, in order.
+    """
+    merged = []
+    for start, end in sorted(spans):
+        start, end = max(start - padding_seconds, 0.0), min(end + padding_seconds, limit_seconds)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        elif end > start:
+            merged.append((start, end))
+    return merged
+
+
+def _inside(item: dict, spans: Sequence[Span]) -> bool:
+    middle = (float(item.get("start", 0.0)) + float(item.get("end", 0.0))) / 2
+    return any(start <= middle < end for start, end in spans)
+
+
+def splice_transcript(transcript: Transcript, replacements: Sequence[Tuple[Span, Any]] = (), drop_spans: Sequence[Span] = ()) -> Transcript:
+    """
+    Replaces or removes the parts of a transcript that fall within some spans.
+
+    Segments and words are assigned to a span by their midpoint. The segments and words of each
+    replacement are shifted by the start of its span, as they were transcribed from a slice of
+    the audio starting there.
+
+    :param transcript: The transcript to change.
+    :param replacements: Pairs of a span and the transcription of that span's audio.
+    :param drop_spans: Spans whose text is removed.
+    :return: The new transcript, with the text rebuilt from its segments.
+    """
+    spans = [span for span, _ in replacements] + list(drop_spans)
+    segments = [s for s in transcript.segments if not _inside(s, spans)]
+    words = [w for w in transcript.words if not _inside(w, spans)]
+    for (start, _), transcription in replacements:
+        replacement = as_transcript(transcription)
+        for item in replacement.segments + replacement.words:
+            item["start"] = float(item.get("start", 0.0)) + start
+            item["end"] = float(item.get("end", 0.0)) + start
+        segments.extend(replacement.segments)
+        words.extend(replacement.words)
+    segments.sort(key=lambda s: float(s.get("start", 0.0)))
+    words.sort(key=lambda w: float(w.get("start", 0.0)))
+    if segments:
+        text = " ".join(str(s.get("text", "")).strip() for s in segments if str(s.get("text", "")).strip())
+    else:
+        text = " ".join(str(w.get("word", "")).strip() for w in words)
+    return Transcript(text=text, segments=segments, words=words)
+
+
+def _normalize(word: str) -> str:
+    return "".join(c for c in word.lower() if c.isalnum())
+
+
+def find_repetition_loops(words: Sequence[str], max_ngram: int = 8, min_repeats: int = 4) -> List[Tuple[int, int]]:
+    """
+    Finds runs where the same phrase repeats back to back, the typical whisper hallucination loop.
+
+    :param words: The words of the transcript.
+    :param max_ngram: The longest phrase, in words, that is checked.
+    :param min_repeats: The number of back to back repeats that makes a loop. Single words need twice as many.
+    :return: The loops as (first word, last word + 1) index pairs.
+    """
+    normalized = [_normalize(w) for w in words]
+    loops = []
+    for n in range(1, max_ngram + 1):
+        needed = min_repeats * 2 if n == 1 else min_repeats
+        i = 0
+        while i + n * needed <= len(normalized):
+            phrase = normalized[i:i + n]
+            repeats = 1
+            while normalized[i + repeats * n:i + (repeats + 1) * n] == phrase:
+                repeats += 1
+            if repeats >= needed and any(phrase):
+                loops.append((i, i + repeats * n))
+                i += repeats * n
+            else:
+                i += 1
+    # a loop of a short phrase is also a loop of its multiples, keep the widest
+    return sorted({loop for loop in loops if not any(o != loop and o[0] <= loop[0] and loop[1] <= o[1] for o in loops)})
+
+
+class QualityScorer:
+    """
+    Judges a transcription from its text and the confidence fields whisper returns.
+
+    The checks are:
+        - repetition loops: the same phrase repeated back to back. The span is retried.
+        - segment compression ratio above max_compression_ratio: repetitive text. The segment is retried.
+        - low segment avg_logprob: an unsure decode. The segment is retried.
+        - high no_speech_prob together with a low avg_logprob: text made up over music or silence. The segment is dropped.
+        - a unique-token ratio below min_unique_ratio, or more words per audio second than anyone
+          speaks: the whole transcription is retried when no smaller span explains it.
+
+    Any object with a ``score(transcription, audio_seconds)`` method returning a QualityReport can
+    take its place.
+    """
+
+    def __init__(
+            self,
+            min_unique_ratio: float = 0.25,
+            max_words_per_second: float = 5.0,
+            min_words: int = 20,
+            max_compression_ratio: float = 2.4,
+            min_avg_logprob: float = -1.0,
+            max_no_speech_prob: float = 0.6,
+            min_loop_repeats: int = 4
+    ):
+        """
+        :param min_unique_ratio: The lowest share of distinct words accepted, checked once there are min_words words.
+        :param max_words_per_second: The fastest speech accepted, averaged over the audio.
+        :param min_words: The number of words needed before the unique-token ratio is judged.
+        :param max_compression_ratio: The highest segment compression ratio accepted.
+        :param min_avg_logprob: The lowest segment avg_logprob accepted.
+        :param max_no_speech_prob: Segments more likely than this to be non-speech are suspect.
+        :param min_loop_repeats: The number of back to back repeats of a phrase that counts as a loop.
+        """
+        self.min_unique_ratio = min_unique_ratio
+        self.max_words_per_second = max_words_per_second
+        self.min_words = min_words
+        self.max_compression_ratio = max_compression_ratio
+        self.min_avg_logprob = min_avg_logprob
+        self.max_no_speech_prob = max_no_speech_prob
+        self.min_loop_repeats = min_loop_repeats
+
+    def score(self, transcription: Any, audio_seconds: float) -> QualityReport:
+        """
+        Scores a transcription.
+
+        :param transcription: The transcription response, or a Transcript.
+        :param audio_seconds: The duration of the transcribed audio.
+        :return: The verdict, with the spans to retry or drop.
+        """
+        transcript = as_transcript(transcription)
+        reasons, retry_spans, drop_spans = [], [], []
+
+        for segment in transcript.segments:
+            span = (float(segment.get("start", 0.0)), float(segment.get("end", 0.0)))
+            avg_logprob = segment.get("avg_logprob")
+            no_speech_prob = segment.get("no_speech_prob")
+            compression_ratio = segment.get("compression_ratio")
+            unsure = avg_logprob is not None and avg_logprob < self.min_avg_logprob
+            if no_speech_prob is not None and no_speech_prob > self.max_no_speech_prob and unsure:
+                reasons.append(f"no speech at {span[0]:.0f}s (no_speech_prob {no_speech_prob:.2f})")
+                drop_spans.append(span)
+            elif compression_ratio is not None and compression_ratio > self.max_compression_ratio:
+                reasons.append(f"repetitive segment at {span[0]:.0f}s (compression ratio {compression_ratio:.1f})")
+                retry_spans.append(span)
+            elif unsure:
+                reasons.append(f"unsure segment at {span[0]:.0f}s (avg_logprob {avg_logprob:.2f})")
+                retry_spans.append(span)
+
+        timeline = Timeline.from_transcription(transcript)
+        words = timeline.words if len(timeline) else transcript.text.split()
+        if len(timeline):
+            for first, last in find_repetition_loops(timeline.words, min_repeats=self.min_loop_repeats):
+                span = (timeline.starts[first], timeline.ends[last - 1])
+                if any(start <= (span[0] + span[1]) / 2 < end for start, end in drop_spans):
+                    # already dropped as text made up over non-speech
+                    continue
+                reasons.append(f"loop of {last - first} words at {span[0]:.0f}s")
+                retry_spans.append(span)
+
+        if not retry_spans and not drop_spans:
+            normalized = [w for w in (_normalize(w) for w in words) if w]
+            unique_ratio = len(set(normalized)) / len(normalized) if normalized else 1.0
+            words_per_second = len(normalized) / audio_seconds if audio_seconds > 0 else 0.0
+            if len(normalized) >= self.min_words and unique_ratio < self.min_unique_ratio:
+                reasons.append(f"unique-token ratio {unique_ratio:.2f}")
+                retry_spans.append((0.0, audio_seconds))
+            elif words_per_second > self.max_words_per_second:
+                reasons.append(f"{words_per_second:.1f} words per second")
+                retry_spans.append((0.0, audio_seconds))
+
+        return QualityReport(accept=not retry_spans and not drop_spans, reasons=reasons,
+                             retry_spans=merge_spans(retry_spans, limit_seconds=audio_seconds),
+                             drop_spans=merge_spans(drop_spans, limit_seconds=audio_seconds))
+
+
+if __name__ == "__main__":
+    looping = {
+        "text": "The code word is vampire. Thank you. Thank you. Thank you. Thank you. Thank you.",
+        "segments": [
+            {"start": 0.0, "end": 4.0, "text": "The code word is vampire.", "avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.1},
+            {"start": 4.0, "end": 30.0, "text": "Thank you. " * 5, "avg_logprob": -1.4, "no_speech_prob": 0.9, "compression_ratio": 3.0},
+        ],
+    }
+    print(QualityScorer().score(looping, audio_seconds=30.0))
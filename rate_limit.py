@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket.
+
+    The bucket holds at most ``capacity`` tokens and refills continuously at ``refill_per_second``.
+    Callers block in ``acquire`` until enough tokens are available.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        """
+        Parameters:
+        - capacity (float): The maximum number of tokens, and the size of the largest burst.
+        - refill_per_second (float): The number of tokens added per second.
+        """
+        if capacity <= 0:
+            raise ValueError("Capacity must be positive")
+        if refill_per_second <= 0:
+            raise ValueError("Refill rate must be positive")
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Takes tokens from the bucket, waiting until enough are available.
+
+        Requests larger than the capacity are clamped to the capacity, so they wait for a full bucket
+        rather than forever.
+
+        Parameters:
+        - amount (float): The number of tokens to take.
+
+        Returns:
+        float: The number of seconds spent waiting.
+        """
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.refill_per_second
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self) -> None:
+        """Empties the bucket, for example after the provider reported that a limit was hit."""
+        with self._lock:
+            self._refill()
+            self._tokens = 0
+            self._updated = time.monotonic()
+
+
+class ProviderRateLimiter:
+    """
+    Keeps transcription requests within a provider's requests-per-minute and audio-seconds-per-hour limits.
+
+    When the provider still answers with a 429, ``back_off`` pauses every worker sharing the limiter
+    until the provider's retry-after delay has passed.
+    """
+
+    def __init__(self, requests_per_minute: float = 20, audio_seconds_per_hour: float = 7200):
+        """
+        Parameters:
+        - requests_per_minute (float): The number of requests allowed per minute.
+        - audio_seconds_per_hour (float): The number of seconds of audio that may be transcribed per hour.
+        """
+        self.requests = TokenBucket(capacity=requests_per_minute, refill_per_second=requests_per_minute / 60)
+        self.audio_seconds = TokenBucket(capacity=audio_seconds_per_hour, refill_per_second=audio_seconds_per_hour / 3600)
+        self.throttled = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, audio_seconds: float = 0) -> float:
+        """
+        Waits until a request transcribing ``audio_seconds`` of audio may be sent.
+
+        Parameters:
+        - audio_seconds (float): The duration of the audio in the request.
+
+        Returns:
+        float: The number of seconds spent waiting.
+        """
+        waited = 0.0
+        with self._lock:
+            pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+            waited += pause
+        waited += self.requests.acquire(1)
+        if audio_seconds > 0:
+            waited += self.audio_seconds.acquire(audio_seconds)
+        return waited
+
+    def back_off(self, retry_after: Optional[float] = None) -> None:
+        """
+        Records a 429 response and pauses all requests.
+
+        Parameters:
+        - retry_after (float): The delay asked for by the provider, in seconds. Defaults to the time needed to refill one request.
+        """
+        logger = logging.getLogger(__name__)
+
+        delay = retry_after if retry_after is not None else 1 / self.requests.refill_per_second
+        with self._lock:
+            self.throttled += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.requests.drain()
+        logger.info(f"Rate limited by provider, pausing requests for {delay:.2f} seconds.")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Checks whether an exception raised by a provider client is a 429 response.
+
+    Parameters:
+    - error (Exception): The exception raised by the client.
+
+    Returns:
+    bool: True when the provider rejected the request for exceeding a rate limit.
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Reads the retry-after header from a rate limit error, if the provider sent one.
+
+    Parameters:
+    - error (Exception): The exception raised by the client.
+
+    Returns:
+    Optional[float]: The delay in seconds, or None.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from stream_capture import capture_segments
+
+# Settings a station entry may override, with their defaults
+STATION_DEFAULTS = {
+    "segment_seconds": 60,
+    "overlap_seconds": 5,
+    "icy_metadata": True,
+    "skip_songs": False,
+}
+
+
+def load_stations(config_path: str = "stations.json") -> List[Dict[str, Any]]:
+    """
+    Loads the stations to monitor from a JSON config file.
+
+    The file holds a "stations" list; every entry needs a "name" and a "url" and may override
+    any of STATION_DEFAULTS. A top level "defaults" object overrides them for every station.
+
+    :param config_path: The path of the config file.
+    :return: The stations, with defaults filled in.
+    """
+    with open(file=config_path, mode="r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    defaults = {**STATION_DEFAULTS, **config.get("defaults", {})}
+    stations = []
+    names = set()
+    for entry in config.get("stations", []):
+        if not entry.get("name") or not entry.get("url"):
+            raise ValueError(f"Station entries need a name and a url: {entry}")
+        if not re.fullmatch(r"[A-Za-z0-9_\-]+", entry["name"]):
+            raise ValueError(f"Station name {entry['name']!r} may only contain letters, digits, '_' and '-'")
+        if entry["name"] in names:
+            raise ValueError(f"Duplicate station name {entry['name']!r}")
+        names.add(entry["name"])
+        stations.append({**defaults, **entry})
+    return stations
+
+
+def station_directories(name: str, base_directory: str = "recordings") -> Dict[str, str]:
+    """
+    Returns the recording directories of one station.
+
+    :param name: The station name.
+    :param base_directory: The directory holding every station's recordings.
+    :return: The in_progress, completed, archive and metadata directories of the station.
+    """
+    station_directory = os.path.join(base_directory, name)
+    return {
+        "in_progress": os.path.join(station_directory, "in_progress"),
+        "completed": os.path.join(station_directory, "completed"),
+        "archive": os.path.join(station_directory, "archive"),
+        "metadata": os.path.join(station_directory, "metadata"),
+    }
+
+
+def capture_stations(
+        stations: List[Dict[str, Any]],
+        duration: int,
+        base_directory: str = "recordings",
+        on_segment: Optional[Callable[[str, str], None]] = None,
+        chunk_size: int = 16 * 1024
+) -> Dict[str, List[str]]:
+    """
+    Captures many stations concurrently in a single process.
+
+    Every station is read by its own lightweight thread, which spends almost all of its time
+    blocked on the socket, so dozens of streams fit on one core. All captures share a single
+    requests session whose connection pool is sized for the number of stations, and each station
+    writes its segments into its own directory tree under base_directory.
+
+    :param stations: The stations, as returned by load_stations.
+    :param duration: The capture duration in seconds.
+    :param base_directory: The directory holding every station's recordings.
+    :param on_segment: Optional callback invoked with the station name and path of every published segment.
+    :param chunk_size: The read buffer size of each capture.
+    :return: The published segments of every station, keyed by station name.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not stations:
+        return {}
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=len(stations), pool_maxsize=len(stations))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    results = {}
+    lock = threading.Lock()
+
+    def capture(station: Dict[str, Any]) -> None:
+        name = station["name"]
+        directories = station_directories(name=name, base_directory=base_directory)
+        callback = (lambda path: on_segment(name, path)) if on_segment is not None else None
+        published = capture_segments(
+            url=station["url"],
+            duration=duration,
+            segment_seconds=station["segment_seconds"],
+            overlap_seconds=station["overlap_seconds"],
+            chunk_size=chunk_size,
+            in_process_recording_directory=directories["in_progress"],
+            completed_recording_directory=directories["completed"],
+            metadata_directory=directories["metadata"],
+            on_segment=callback,
+            icy_metadata=station["icy_metadata"],
+            skip_songs=station["skip_songs"],
+            session=session
+        )
+        with lock:
+            results[name] = published
+
+    logger.info(f"Starting capture of {len(stations)} station(s) for {duration} seconds.")
+    try:
+        with ThreadPoolExecutor(max_workers=len(stations), thread_name_prefix="station") as executor:
+            for future in [executor.submit(capture, station) for station in stations]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"An unexpected error occurred capturing a station: {type(e).__name__}, {e}")
+    finally:
+        session.close()
+
+    logger.info(f"Captured {sum(len(p) for p in results.values())} segment(s) from {len(results)} station(s).")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    capture_stations(stations=load_stations("stations.json"), duration=120)
@@ -1,25 +1,293 @@
+import json
 import os
 import requests
 import shutil
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
+from urllib3.exceptions import ProtocolError as Urllib3ProtocolError, ReadTimeoutError as Urllib3ReadTimeoutError
 
-def download_audio_chunk(url: str, duration: int, chunk_size: int = 1024, in_process_recording_directory: str = "recordings/in_progress", completed_recording_directory: str = "recordings/completed") -> None:
+from icy import ICY_REQUEST_HEADERS, IcyDemuxer, is_song_title
+from instrumentation import span
+from pipeline import PipelineStopped
+
+
+class RecordingWriter:
+    """
+    Writes the audio of one recording and keeps an index of the stream titles heard in it.
+
+    Each StreamTitle change is recorded with the byte offset in the file where it took effect.
+    With skip_songs, audio played under a song title is left out of the file, so that only talk
+    and ad breaks are transcribed; the index still records where the song was cut. Times within
+    such a file no longer line up with the clock, so no air times are given for it (see
+    read_recording_index).
+    """
+
+    def __init__(self, filepath: str, skip_songs: bool = False):
+        self.filepath = filepath
+        self.skip_songs = skip_songs
+        self.bytes_written = 0
+        self.bytes_dropped = 0
+        self.titles = []
+        self._fd = open(filepath, 'wb')
+        self._title = None
+
+    def write(self, data: bytes, title: Optional[str] = None) -> None:
+        """Writes a run of audio heard while the given StreamTitle was current."""
+        song = is_song_title(title)
+        if title is not None and (not self.titles or title != self._title):
+            self.titles.append({"offset": self.bytes_written, "title": title, "song": song, "dropped": song and self.skip_songs})
+        self._title = title
+        if song and self.skip_songs:
+            self.bytes_dropped += len(data)
+            return
+        self._fd.write(data)
+        self.bytes_written += len(data)
+
+    def close(self) -> None:
+        self._fd.close()
+
+    def write_index(self, metadata_directory: str) -> Optional[str]:
+        """
+        Writes the stream title index next to the other metadata sidecars.
+
+        Returns:
+        Optional[str]: The path of the index, or None when the stream carried no titles.
+        """
+        if not self.titles:
+            return None
+        os.makedirs(metadata_directory, exist_ok=True)
+        index_path = recording_index_path(self.filepath, metadata_directory=metadata_directory)
+        with open(file=index_path, mode='w', encoding='utf-8') as f:
+            json.dump({"titles": self.titles, "bytes_written": self.bytes_written, "bytes_dropped": self.bytes_dropped}, f, indent=4)
+        return index_path
+
+
+def recording_index_path(filepath: str, metadata_directory: Optional[str] = None) -> str:
+    """
+    Returns where the stream title index of a recording is written.
+
+    Parameters:
+    - filepath (str): The path of the recording, in any of its directories.
+    - metadata_directory (str): The directory of the indexes, defaults to the metadata directory next to the recording's directory,
+      which is where the capture functions put it for both the single station and the per-station layouts.
+
+    Returns:
+    str: The path of the index.
+    """
+    if metadata_directory is None:
+        metadata_directory = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(filepath))), "metadata")
+    return os.path.join(metadata_directory, f"{os.path.basename(filepath)}.icy.json")
+
+
+def read_recording_index(filepath: str, metadata_directory: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Reads the stream title index of a recording.
+
+    Parameters:
+    - filepath (str): The path of the recording.
+    - metadata_directory (str): The directory of the indexes, see recording_index_path.
+
+    Returns:
+    Optional[Dict[str, Any]]: The index, or None when the recording has none or it cannot be read.
+    """
+    logger = logging.getLogger(__name__)
+
+    index_path = recording_index_path(filepath, metadata_directory=metadata_directory)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(file=index_path, mode='r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Failed to read the stream title index {index_path}: {type(e).__name__}, {e}")
+        return None
+
+
+@span("capture.connect")
+def open_stream(url: str, timeout, icy_metadata: bool = True, session: Optional[requests.Session] = None) -> Tuple[requests.Response, IcyDemuxer]:
+    """
+    Opens a streaming connection to an audio stream.
+
+    Parameters:
+    - url (str): The URL of the audio stream.
+    - timeout: The timeout passed to requests.
+    - icy_metadata (bool): Whether to ask the server to interleave ICY metadata with the audio.
+    - session (requests.Session): Optional session to open the connection from, shared by concurrent captures.
+
+    Returns:
+    Tuple[requests.Response, IcyDemuxer]: The response, and the demuxer that strips its metadata.
+    """
+    headers = ICY_REQUEST_HEADERS if icy_metadata else {}
+    response = (session or requests).get(url, stream=True, timeout=timeout, headers=headers)
+    try:
+        response.raise_for_status()  # Raise an exception if the status code is not 2xx
+    except requests.HTTPError:
+        response.close()
+        raise
+    metaint = response.headers.get("icy-metaint")
+    return response, IcyDemuxer(metaint=int(metaint) if metaint else None)
+
+
+@span("capture.publish")
+def finish_recording(writer: RecordingWriter, completed_recording_directory: str, metadata_directory: str = "recordings/metadata") -> Optional[str]:
+    """
+    Closes a recording, writes its stream title index and publishes it.
+
+    A recording that ended up empty (for example because only songs played while skip_songs was set)
+    is removed instead of published.
+
+    Returns:
+    Optional[str]: The path of the published recording, or None if it was empty.
+    """
+    logger = logging.getLogger(__name__)
+
+    writer.close()
+    writer.write_index(metadata_directory=metadata_directory)
+    if writer.bytes_dropped:
+        logger.info(f"Dropped {writer.bytes_dropped} bytes of song audio from {os.path.basename(writer.filepath)}.")
+    if writer.bytes_written == 0:
+        os.remove(writer.filepath)
+        logger.info(f"Discarded empty recording {os.path.basename(writer.filepath)}.")
+        return None
+    return publish_recording(in_process_filepath=writer.filepath, completed_recording_directory=completed_recording_directory)
+
+
+@span("capture.stream")
+def capture_stream(
+        url: str,
+        duration: float,
+        on_audio: Callable[[memoryview, Optional[str]], None],
+        on_tick: Optional[Callable[[float], None]] = None,
+        buffer_size: int = 64 * 1024,
+        connect_timeout: float = 10,
+        stall_timeout: float = 15,
+        max_reconnects: int = 5,
+        reconnect_delay: float = 1,
+        icy_metadata: bool = True,
+        session: Optional[requests.Session] = None
+) -> Dict[str, Any]:
+    """
+    Reads an audio stream for a fixed duration, reconnecting after stalls and dropped connections.
+
+    The stream is read with readinto into one preallocated buffer, and the monotonic clock is checked
+    once per buffer rather than per read call. A read that receives nothing for stall_timeout seconds
+    counts as a stall. Stalls, dropped connections and failed connection attempts (refused, timed out or
+    answered with a 5xx) are retried with a doubling delay, and the audio from the new connection is
+    passed to the same on_audio callback, so the output continues in the same file(s).
+
+    Parameters:
+    - url (str): The URL of the audio stream.
+    - duration (float): The total duration to capture (in seconds).
+    - on_audio (Callable[[memoryview, Optional[str]], None]): Called with each run of audio and the current
+      StreamTitle. The memoryview is only valid during the call, since the buffer is reused.
+    - on_tick (Callable[[float], None]): Optional callback invoked with the monotonic time before every read.
+    - buffer_size (int): The size of the read buffer in bytes.
+    - connect_timeout (float): The timeout for establishing a connection (in seconds).
+    - stall_timeout (float): The longest wait for data before the connection is considered stalled (in seconds).
+    - max_reconnects (int): The number of reconnects allowed during the capture.
+    - reconnect_delay (float): The delay before the first reconnect, doubled after each one (in seconds).
+    - icy_metadata (bool): Whether to request inline ICY metadata.
+    - session (requests.Session): Optional session to open connections from.
+
+    Returns:
+    Dict[str, Any]: The bytes read, elapsed seconds, reconnects and stalls of the capture.
+    """
+    logger = logging.getLogger(__name__)
+
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    stats = {"bytes": 0, "seconds": 0.0, "reconnects": 0, "stalls": 0}
+    start = time.monotonic()
+    end_time = start + duration
+    response = None
+    delay = reconnect_delay
+    try:
+        while time.monotonic() < end_time:
+            try:
+                response, demuxer = open_stream(url=url, timeout=(connect_timeout, stall_timeout), icy_metadata=icy_metadata, session=session)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.info(f"Stream connect failed: {type(e).__name__}, {e}")
+            except requests.HTTPError as e:
+                # a relay that is down or overloaded answers 5xx for a while, anything else will not go away
+                if e.response is None or e.response.status_code < 500:
+                    raise
+                logger.info(f"Stream connect failed: {type(e).__name__}, {e}")
+            else:
+                raw = response.raw
+                now = time.monotonic()
+                while now < end_time:
+                    if on_tick is not None:
+                        on_tick(now)
+                    try:
+                        n = raw.readinto(buffer)
+                    except (requests.exceptions.ReadTimeout, Urllib3ReadTimeoutError, TimeoutError) as e:
+                        stats["stalls"] += 1
+                        logger.info(f"Stream stalled: {type(e).__name__}, {e}")
+                        n = -1
+                    except (requests.ConnectionError, Urllib3ProtocolError, ConnectionError) as e:
+                        logger.info(f"Stream connection dropped: {type(e).__name__}, {e}")
+                        n = -1
+                    if n <= 0:
+                        break
+                    stats["bytes"] += n
+                    for title, audio in demuxer.feed(view[:n]):
+                        on_audio(audio, title)
+                    now = time.monotonic()
+                else:
+                    break
+                # the stream ended or stalled before the capture window closed
+                response.close()
+                response = None
+
+            if stats["reconnects"] >= max_reconnects:
+                logger.error(f"Giving up on stream after {stats['reconnects']} reconnect(s).")
+                break
+            stats["reconnects"] += 1
+            logger.info(f"Reconnecting to stream in {delay:.1f} seconds (reconnect #{stats['reconnects']}).")
+            time.sleep(min(delay, max(end_time - time.monotonic(), 0)))
+            delay *= 2
+    finally:
+        if response is not None:
+            response.close()
+        view.release()
+        stats["seconds"] = time.monotonic() - start
+    return stats
+
+
+def download_audio_chunk(
+        url: str,
+        duration: int,
+        chunk_size: int = 64 * 1024,
+        in_process_recording_directory: str = "recordings/in_progress",
+        completed_recording_directory: str = "recordings/completed",
+        metadata_directory: str = "recordings/metadata",
+        icy_metadata: bool = True,
+        skip_songs: bool = False,
+        stall_timeout: float = 15,
+        max_reconnects: int = 5
+) -> None:
     """
     Downloads a chunk of audio from a given URL and stores it in a specified directory.
 
     This function streams audio from the specified URL for a given duration,
     saves the streamed audio as a chunk in an 'in progress' directory, and then
-    moves the completed audio file to a 'completed' directory.
+    moves the completed audio file to a 'completed' directory. If the stream
+    stalls or drops, it is reconnected and the capture continues in the same file.
 
     Parameters:
     - url (str): The URL of the audio stream.
     - duration (int): The duration for which to download the stream (in seconds).
-    - chunk_size (int): The size of chunks to read in bytes (default 1024).
+    - chunk_size (int): The size of the read buffer in bytes (default 64 KiB).
     - in_process_recording_directory (str): The directory to temporarily store the downloading audio chunk.
     - completed_recording_directory (str): The directory to store the audio chunk once download is complete.
-    - log_file (str): The file to which logs will be written.
+    - metadata_directory (str): The directory to store the stream title index in.
+    - icy_metadata (bool): Whether to request inline ICY metadata and index the stream titles.
+    - skip_songs (bool): Whether to leave audio played under a song title out of the recording.
+    - stall_timeout (float): The longest wait for data before the stream is reconnected (in seconds).
+    - max_reconnects (int): The number of reconnects allowed during the capture.
 
     Returns:
     None
@@ -42,25 +310,20 @@ def download_audio_chunk(url: str, duration: int, chunk_size: int = 1024, in_pro
     logger = logging.getLogger(__name__)
 
     try:
-        # Send a GET request to the audio stream URL
+        # Stream the audio from the URL into the recording
         logger.info(f"Starting stream capture.")
-        response = requests.get(url, stream=True, timeout=duration)
-        response.raise_for_status()  # Raise an exception if the status code is not 2xx
-
-        with open(in_process_filepath, 'wb') as fd:
-            end_time = datetime.now() + timedelta(seconds=duration)
-            while datetime.now() < end_time:
-                chunk = response.raw.read(chunk_size)
-                if not chunk:
-                    break
-                fd.write(chunk)
+        writer = RecordingWriter(filepath=in_process_filepath, skip_songs=skip_songs)
+        try:
+            stats = capture_stream(url=url, duration=duration, on_audio=writer.write, buffer_size=chunk_size,
+                                   stall_timeout=stall_timeout, max_reconnects=max_reconnects, icy_metadata=icy_metadata)
+        finally:
+            writer.close()
+        logger.info(f"Captured {stats['bytes']} bytes in {stats['seconds']:.1f} seconds with {stats['reconnects']} reconnect(s).")
 
         logger.info(f"Wrote file {filename} to {in_process_recording_directory}.")
 
         # Move the file from in_process_directory to completed_directory
-        completed_filepath = os.path.join(completed_recording_directory, filename)
-        shutil.move(in_process_filepath, completed_filepath)
-        logger.info(f"Moved file {filename} to {completed_recording_directory}.")
+        finish_recording(writer=writer, completed_recording_directory=completed_recording_directory, metadata_directory=metadata_directory)
 
     except requests.RequestException as e:
         logger.error(f"Request error: {e}")
@@ -70,11 +333,164 @@ def download_audio_chunk(url: str, duration: int, chunk_size: int = 1024, in_pro
         logger.error(f"An unexpected error occurred: {type(e).__name__}, {e}")
 
 
+def publish_recording(in_process_filepath: str, completed_recording_directory: str) -> str:
+    """
+    Moves a finished recording from the 'in progress' directory to the 'completed' directory.
+
+    The move is a rename when both directories are on the same filesystem, so a consumer
+    watching the completed directory never sees a partially written file.
+
+    Parameters:
+    - in_process_filepath (str): The path of the finished recording.
+    - completed_recording_directory (str): The directory to publish the recording to.
+
+    Returns:
+    str: The path of the published recording.
+    """
+    logger = logging.getLogger(__name__)
+
+    filename = os.path.basename(in_process_filepath)
+    completed_filepath = os.path.join(completed_recording_directory, filename)
+    shutil.move(in_process_filepath, completed_filepath)
+    logger.info(f"Moved file {filename} to {completed_recording_directory}.")
+    return completed_filepath
+
+
+def capture_segments(
+        url: str,
+        duration: int,
+        segment_seconds: int = 60,
+        overlap_seconds: int = 5,
+        chunk_size: int = 16 * 1024,
+        in_process_recording_directory: str = "recordings/in_progress",
+        completed_recording_directory: str = "recordings/completed",
+        on_segment: Optional[Callable[[str], None]] = None,
+        metadata_directory: str = "recordings/metadata",
+        icy_metadata: bool = True,
+        skip_songs: bool = False,
+        stall_timeout: float = 15,
+        max_reconnects: int = 5,
+        session: Optional[requests.Session] = None
+) -> List[str]:
+    """
+    Captures an audio stream as a series of fixed-length, overlapping segments.
+
+    A single HTTP connection is held open for the whole duration. A new segment is started
+    every (segment_seconds - overlap_seconds) seconds, so consecutive segments share
+    overlap_seconds of audio and a phrase spoken across a boundary is never cut in half.
+    Each segment is published to the 'completed' directory as soon as it is finished,
+    letting transcription begin before the capture window closes.
+
+    Parameters:
+    - url (str): The URL of the audio stream.
+    - duration (int): The total duration to capture (in seconds).
+    - segment_seconds (int): The length of each segment (in seconds).
+    - overlap_seconds (int): The audio shared by consecutive segments (in seconds).
+    - chunk_size (int): The size of the read buffer in bytes (default 16 KiB, about a second of 128 kbps audio,
+      which bounds how far a segment boundary can drift).
+    - in_process_recording_directory (str): The directory to store segments while they are written.
+    - completed_recording_directory (str): The directory to publish finished segments to.
+    - on_segment (Callable[[str], None]): Optional callback invoked with the path of each published segment.
+    - metadata_directory (str): The directory to store the stream title index of each segment in.
+    - icy_metadata (bool): Whether to request inline ICY metadata and index the stream titles.
+    - skip_songs (bool): Whether to leave audio played under a song title out of the segments. Segments
+      that contain nothing but songs are not published, and segments with a song cut out of them get no air times.
+    - stall_timeout (float): The longest wait for data before the stream is reconnected (in seconds).
+    - max_reconnects (int): The number of reconnects allowed during the capture.
+    - session (requests.Session): Optional session to open connections from, shared by concurrent captures.
+
+    Returns:
+    List[str]: The paths of the published segments, in capture order.
+    """
+    # Validate parameters
+    if not isinstance(url, str) or not url:
+        raise ValueError("URL must be a non-empty string")
+    if not isinstance(duration, int) or duration <= 0:
+        raise ValueError("Duration must be a positive integer")
+    if not isinstance(segment_seconds, int) or segment_seconds <= 0:
+        raise ValueError("Segment length must be a positive integer")
+    if not isinstance(overlap_seconds, int) or not 0 <= overlap_seconds < segment_seconds:
+        raise ValueError("Overlap must be a non-negative integer smaller than the segment length")
+    if not isinstance(chunk_size, int) or chunk_size <= 0:
+        raise ValueError("Chunk size must be a positive integer")
+
+    # Create the directories if they don't exist
+    os.makedirs(in_process_recording_directory, exist_ok=True)
+    os.makedirs(completed_recording_directory, exist_ok=True)
+
+    logger = logging.getLogger(__name__)
+
+    step_seconds = segment_seconds - overlap_seconds
+    published = []
+    # open segments as (writer, monotonic end time)
+    open_segments = []
+
+    def start_segment(now: float) -> None:
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp3"
+        filepath = os.path.join(in_process_recording_directory, filename)
+        open_segments.append((RecordingWriter(filepath=filepath, skip_songs=skip_songs), now + segment_seconds))
+        logger.info(f"Started segment {filename}.")
+
+    def finish_segment(segment: tuple) -> None:
+        completed_filepath = finish_recording(writer=segment[0], completed_recording_directory=completed_recording_directory, metadata_directory=metadata_directory)
+        if completed_filepath is None:
+            return
+        published.append(completed_filepath)
+        if on_segment is not None:
+            on_segment(completed_filepath)
+
+    next_start = None
+
+    def on_tick(now: float) -> None:
+        nonlocal next_start
+        # publish every segment that has reached its full length
+        while open_segments and open_segments[0][1] <= now:
+            finish_segment(open_segments.pop(0))
+        if next_start is None or now >= next_start:
+            start_segment(now)
+            next_start = now + step_seconds
+
+    def on_audio(audio: memoryview, title: Optional[str]) -> None:
+        for writer, _ in open_segments:
+            writer.write(audio, title)
+
+    try:
+        logger.info(f"Starting segmented stream capture.")
+        stats = capture_stream(url=url, duration=duration, on_audio=on_audio, on_tick=on_tick, buffer_size=chunk_size,
+                               stall_timeout=stall_timeout, max_reconnects=max_reconnects, icy_metadata=icy_metadata, session=session)
+        logger.info(f"Captured {stats['bytes']} bytes in {stats['seconds']:.1f} seconds with {stats['reconnects']} reconnect(s).")
+
+    except PipelineStopped:
+        # a normal shutdown of the pipeline this capture feeds, not a capture error
+        logger.info("Segmented stream capture stopped by its pipeline.")
+        raise
+    except requests.RequestException as e:
+        logger.error(f"Request error: {e}")
+    except IOError as e:
+        logger.error(f"I/O error: {e}")
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {type(e).__name__}, {e}")
+    finally:
+        # publish whatever was captured of the trailing segments
+        while open_segments:
+            segment = open_segments.pop(0)
+            try:
+                finish_segment(segment)
+            except PipelineStopped:
+                # the segment is published, the stopped pipeline just takes no more of them
+                pass
+            except Exception as e:
+                logger.error(f"Failed to publish segment {segment[0].filepath}: {type(e).__name__}, {e}")
+
+    logger.info(f"Segmented stream capture finished, {len(published)} segment(s) published.")
+    return published
+
+
 if __name__ == "__main__":
     url = 'https://18743.live.streamtheworld.com/KQMVFM.mp3?dist=hubbard&source=hubbard-web&ttag=web&gdpr=0'
     in_progress_directory = "recordings/in_progress"
     completed_directory = "recordings/completed"
     duration = 120  # seconds
     print(f"Starting audio download.")
-    download_audio_chunk(url=url, duration=duration, chunk_size=1024, in_process_recording_directory=in_progress_directory, completed_recording_directory=completed_directory)
+    download_audio_chunk(url=url, duration=duration, in_process_recording_directory=in_progress_directory, completed_recording_directory=completed_directory)
     print(f"Audio download complete.")
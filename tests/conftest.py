@@ -0,0 +1,14 @@
+import os
+import sys
+
+import pytest
+
+# the modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Runs the test in an empty directory, as the modules write recordings, transcripts and metrics relative to it."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,74 @@
+import pytest
+
+# numpy is optional, recordings are uploaded untrimmed without it
+np = pytest.importorskip("numpy")
+
+import audio_preprocess  # noqa: E402
+import transcriptions  # noqa: E402
+from audio_preprocess import SAMPLE_RATE, TrimResult, decode_to_pcm, find_speech_spans, make_sample_clip, trim_non_speech  # noqa: E402
+from mp3_frames import audio_duration, make_synthetic_frames  # noqa: E402
+from transcriptions import trim_recording  # noqa: E402
+
+
+def overlap(span, spans) -> float:
+    return sum(max(min(span[1], end) - max(span[0], start), 0.0) for start, end in spans)
+
+
+def test_talk_is_kept_and_long_dead_air_and_music_are_cut():
+    clip, speech = make_sample_clip()
+    duration = len(clip) / SAMPLE_RATE
+
+    kept = find_speech_spans(clip)
+
+    assert all(overlap(talk, kept) >= 0.95 * (talk[1] - talk[0]) for talk in speech)
+    # the 6 seconds of dead air and the 20 second music bed after it go, bar the windows around the cuts;
+    # the 4 second gap later on is short enough to keep
+    assert overlap((12, 38), kept) < 4
+    assert overlap((48, 52), kept) == 4
+    assert sum(end - start for start, end in kept) < 0.75 * duration
+
+
+def test_silence_is_dropped_whole_and_a_short_clip_is_kept_whole():
+    assert find_speech_spans(np.zeros(SAMPLE_RATE * 10, dtype=np.float32)) == []
+    clip, _ = make_sample_clip()
+    assert find_speech_spans(clip[:SAMPLE_RATE // 2]) == [(0.0, 0.5)]
+
+
+def test_trimmed_frames_and_times_map_back_to_the_recording():
+    clip, _ = make_sample_clip()
+    audio = make_synthetic_frames(seconds=len(clip) / SAMPLE_RATE)
+
+    result = trim_non_speech(audio, samples=clip)
+
+    assert 0.25 < result.removed_fraction < 0.6
+    assert abs(audio_duration(result.audio) - result.kept_seconds) < 0.1
+    first, second = result.kept_spans[:2]
+    assert result.to_original(1.0) == first[0] + 1.0
+    # a second into the second kept span
+    assert abs(result.to_original(first[1] - first[0] + 1.0) - (second[0] + 1.0)) < 1e-9
+
+
+def test_time_map_of_an_untrimmed_recording_is_the_identity():
+    result = TrimResult(audio=b"", kept_spans=[(0.0, 30.0)], original_seconds=30.0, kept_seconds=30.0)
+
+    assert result.removed_fraction == 0.0
+    assert result.to_original(12.5) == 12.5
+    assert result.to_original(45.0) == 30.0
+
+
+def test_decoding_without_ffmpeg_raises_a_clear_error(monkeypatch):
+    monkeypatch.setattr(audio_preprocess.shutil, "which", lambda name: None)
+
+    with pytest.raises(FileNotFoundError, match="ffmpeg"):
+        decode_to_pcm(b"")
+
+
+def test_recordings_are_uploaded_untrimmed_without_ffmpeg_or_numpy(monkeypatch):
+    audio = make_synthetic_frames(seconds=4)
+    monkeypatch.setattr(audio_preprocess.shutil, "which", lambda name: None)
+
+    assert trim_recording(audio, "20261016_120000.mp3") is None
+
+    # transcriptions imports the trimmer optionally, numpy being missing leaves it as None
+    monkeypatch.setattr(transcriptions, "trim_audio", None)
+    assert trim_recording(audio, "20261016_120000.mp3") is None
@@ -0,0 +1,102 @@
+import gc
+import threading
+import time
+
+import pytest
+
+import clients
+from clients import close_clients, configure_clients, connection_stats, get_http_session, get_openai_client
+from fake_services import FakeChatServer, FakeTextbeltServer
+
+
+@pytest.fixture
+def chat_server(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    with FakeChatServer() as server:
+        yield server
+    configure_clients(openai_base_url=None, keepalive_expiry=300.0)
+
+
+def ask(client) -> str:
+    completion = client.chat.completions.create(model="gpt-4o-mini", messages=[{"role": "user", "content": "<text_transcript>nothing</text_transcript>"}])
+    return completion.choices[0].message.content
+
+
+def test_requests_share_one_keep_alive_connection(chat_server):
+    configure_clients(openai_base_url=chat_server.api_url)
+
+    for _ in range(5):
+        ask(get_openai_client())
+
+    assert get_openai_client() is get_openai_client()
+    assert connection_stats()["openai"] == {"requests": 5, "connections": 1}
+
+
+def test_every_new_connection_is_counted_once(chat_server):
+    # connections expire as soon as they are returned to the pool, so every request opens a new one
+    configure_clients(openai_base_url=chat_server.api_url, keepalive_expiry=0.0)
+
+    for _ in range(20):
+        ask(get_openai_client())
+        # closed connections are collected, and a new stream may reuse a freed id
+        gc.collect()
+
+    assert connection_stats()["openai"] == {"requests": 20, "connections": 20}
+
+
+def test_plain_http_session_is_kept_alive():
+    close_clients()
+    with FakeTextbeltServer() as server:
+        for _ in range(3):
+            get_http_session().post(server.text_url, data={"phone": "5550100", "message": "hi"}).raise_for_status()
+
+        assert connection_stats()["http"] == {"requests": 3, "connections": 1}
+    close_clients()
+
+
+class SlowClient:
+    def __init__(self, release: threading.Event):
+        release.wait(timeout=5)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_building_a_client_does_not_hold_the_lock_the_response_hooks_take():
+    release = threading.Event()
+    result = []
+    thread = threading.Thread(target=lambda: result.append(clients._get("slow", lambda: (SlowClient(release), None))))
+    thread.start()
+    try:
+        # a response hook of another client, while the slow one is still being built
+        assert clients._lock.acquire(timeout=1)
+        clients._lock.release()
+    finally:
+        release.set()
+        thread.join()
+    assert result[0] is clients._clients.pop("slow")
+
+
+def test_only_one_of_two_concurrently_built_clients_is_kept():
+    release = threading.Event()
+    built = []
+
+    def factory():
+        client = SlowClient(release)
+        built.append(client)
+        return client, None
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(clients._get("race", factory))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    kept = clients._clients.pop("race")
+    assert results == [kept, kept]
+    assert len(built) == 2
+    assert [client.closed for client in built if client is not kept] == [True]
@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import pytest
+
+import daemon
+from clients import configure_clients
+from daemon import DEFAULT_SCHEDULE, RadioDaemon, parse_days, parse_schedule, upcoming_windows
+from fake_services import FakeChatServer, FakeTranscriptionServer
+from mp3_frames import make_synthetic_frames
+from notifications import NotificationDispatcher
+
+ANNOUNCEMENT = "your code word for this hour is vampire, text it in to 92.5 now for your tickets"
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def radio(workdir, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("GROQ_API_KEY", "test")
+    monkeypatch.setattr(daemon, "warm_up", lambda **kwargs: None)
+    radio = RadioDaemon(url="http://127.0.0.1:9/stream", schedule=parse_schedule(DEFAULT_SCHEDULE), max_attempts=3,
+                        dispatcher=NotificationDispatcher(phone_numbers=[]))
+    yield radio
+    radio.close()
+    configure_clients(openai_base_url=None, groq_base_url=None)
+
+
+def test_weekday_ranges_wrap_around_the_weekend():
+    assert parse_days("mon-fri") == frozenset(range(5))
+    assert parse_days("fri-mon") == frozenset({4, 5, 6, 0})
+    assert parse_days("sat, sun") == frozenset({5, 6})
+    with pytest.raises(ValueError):
+        parse_days("someday")
+
+
+def test_touching_dayparts_join_and_overnight_ones_run_past_midnight():
+    schedule = parse_schedule([
+        {"name": "late", "days": "fri", "start": "22:00", "end": "02:00"},
+        {"name": "morning", "days": "sat", "start": "06:00", "end": "08:00"},
+        {"name": "brunch", "days": "sat", "start": "08:00", "end": "11:00"},
+    ])
+
+    # Saturday 01:00, inside Friday's late show
+    windows = upcoming_windows(schedule, now=datetime(2026, 10, 17, 1, 0), days=1)
+
+    assert [(w.start, w.end, w.names) for w in windows] == [
+        (datetime(2026, 10, 16, 22, 0), datetime(2026, 10, 17, 2, 0), ["late"]),
+        (datetime(2026, 10, 17, 6, 0), datetime(2026, 10, 17, 11, 0), ["morning", "brunch"]),
+    ]
+
+
+def test_recover_publishes_any_partial_segment_and_drops_empty_ones(radio):
+    # cut before its first whole frame, so it holds no decodable audio yet
+    with open(os.path.join(radio.in_progress_directory, "20261016_120000.mp3"), "wb") as f:
+        f.write(make_synthetic_frames(seconds=1)[:100])
+    open(os.path.join(radio.in_progress_directory, "20261016_120100.mp3"), "wb").close()
+
+    names = radio.recover()
+
+    assert names == ["20261016_120000.mp3"]
+    assert os.listdir(radio.completed_directory) == ["20261016_120000.mp3"]
+    assert os.listdir(radio.in_progress_directory) == []
+
+
+def test_failed_model_request_is_retried_in_the_next_window_instead_of_marked_done(radio):
+    name = "20261016_120000.mp3"
+    with open(os.path.join(radio.completed_directory, name), "wb") as f:
+        f.write(make_synthetic_frames(seconds=4))
+
+    with FakeTranscriptionServer(transcriber=lambda seconds, rng: ANNOUNCEMENT.split()) as groq, \
+            FakeChatServer(error_rate=1.0, error_status=400) as failing_chat:
+        configure_clients(groq_base_url=groq.url, openai_base_url=failing_chat.api_url)
+        assert radio.run_window() == []
+
+        entry = radio.journal.get(name)
+        assert entry.stage == "transcribed"
+        assert entry.attempts == 1
+        assert radio.store.get_checkpoint("detector") == 0
+
+        with FakeChatServer() as chat:
+            configure_clients(groq_base_url=groq.url, openai_base_url=chat.api_url)
+            responses = radio.run_window()
+
+        # the transcript was stored once and not sent again
+        assert groq.requests == 1
+    assert len(responses) == 1
+    assert radio.journal.get(name).stage == "done"
+    assert radio.store.get_checkpoint("detector") == entry.segment_id
+
+    summaries = sorted(os.listdir("metrics/runs"))
+    assert len(summaries) == 2
+    with open(os.path.join("metrics/runs", summaries[-1]), encoding="utf-8") as f:
+        assert json.load(f)["mode"] == "daemon"
+
+
+def test_importing_the_daemon_leaves_logging_and_the_provider_sdks_alone(tmp_path):
+    code = ("import logging, sys; import daemon; "
+            "print(sorted(m for m in ('main', 'openai', 'groq', 'httpx') if m in sys.modules), len(logging.getLogger().handlers))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env={**os.environ, "PYTHONPATH": REPOSITORY},
+                            capture_output=True, text=True, check=True)
+
+    assert result.stdout.split() == ["[]", "0"]
+    assert not (tmp_path / "log.log").exists()
+
+
+def test_abandoned_recording_does_not_hold_the_checkpoint_below_later_ones(radio):
+    with open(os.path.join(radio.completed_directory, "20261016_120000.mp3"), "wb") as f:
+        f.write(make_synthetic_frames(seconds=4))
+
+    with FakeTranscriptionServer(transcriber=lambda seconds, rng: ANNOUNCEMENT.split()) as groq:
+        with FakeChatServer(error_rate=1.0, error_status=400) as failing_chat:
+            configure_clients(groq_base_url=groq.url, openai_base_url=failing_chat.api_url)
+            for _ in range(radio.max_attempts):
+                assert radio.run_window() == []
+        assert radio.journal.get("20261016_120000.mp3").stage == "abandoned"
+        assert radio.journal.unfinished() == []
+
+        with open(os.path.join(radio.completed_directory, "20261016_120100.mp3"), "wb") as f:
+            f.write(make_synthetic_frames(seconds=6))
+        with FakeChatServer() as chat:
+            configure_clients(groq_base_url=groq.url, openai_base_url=chat.api_url)
+            assert len(radio.run_window()) == 1
+
+    assert radio.store.get_checkpoint("detector") == radio.journal.get("20261016_120100.mp3").segment_id
@@ -0,0 +1,27 @@
+import pytest
+
+from detection import detect_candidate_announcements, find_trigger_phrases
+
+
+@pytest.mark.parametrize("text, phrase", [
+    ("your code word for this hour is vampire", "code word"),
+    ("the code-word is guts", "code-word"),
+    ("the codeword is drivers", "codeword"),
+    ("listen for the magic word after the break", "magic word"),
+    ("the winning words are on the way", "winning words"),
+    ("today's keyword is butterfly", "keyword"),
+    ("text in the word to 72881", "text in the word"),
+])
+def test_announcements_are_found(text, phrase):
+    assert [hit.phrase for hit in find_trigger_phrases(text)] == [phrase]
+
+
+@pytest.mark.parametrize("text", [
+    "He is such a coward, always was.",
+    "never tell anyone your password",
+    "sailing along the windward islands",
+    "she wrote it in her keyboard words",
+    "the cold weather is back this weekend",
+])
+def test_ordinary_words_are_not_trigger_phrases(text):
+    assert detect_candidate_announcements(text=text) == []
@@ -0,0 +1,125 @@
+import time
+
+import pytest
+
+from fake_services import FakeTranscriptionServer
+from hedging import CircuitOpenError, DeadlineExceeded, HedgedExecutor, LatencyTracker
+from mp3_frames import make_synthetic_frames
+from rate_limit import ProviderRateLimiter
+from transcriptions import transcribe_audio
+
+
+def test_waiting_in_acquire_neither_hedges_nor_runs_into_the_deadline():
+    executor = HedgedExecutor(name="test", default_hedge_seconds=0.1, min_hedge_seconds=0.1, deadline_seconds=0.3)
+    calls = []
+
+    def request():
+        calls.append("primary")
+        time.sleep(0.05)
+        return "done"
+
+    result = executor.call(primary=request, fallback=lambda: "fallback", acquire=lambda: time.sleep(0.5))
+    executor.close()
+
+    assert result == "done"
+    assert calls == ["primary"]
+    assert executor.stats["hedged"] == 0 and executor.stats["deadline_exceeded"] == 0
+    # the recorded latency is the request's, not the wait's
+    assert max(executor.latencies._latencies) < 0.3
+
+
+def test_a_slow_request_is_still_hedged_after_the_wait():
+    executor = HedgedExecutor(name="test", default_hedge_seconds=0.1, min_hedge_seconds=0.1)
+
+    result = executor.call(primary=lambda: time.sleep(1.0) or "primary", fallback=lambda: "fallback", acquire=lambda: time.sleep(0.2))
+    executor.close()
+
+    assert result == "fallback"
+    assert executor.stats["hedged"] == 1 and executor.stats["hedge_wins"] == 1
+
+
+def test_a_rate_limited_transcription_is_not_hedged():
+    from groq import Groq
+
+    rate_limiter = ProviderRateLimiter(requests_per_minute=120)
+    # the next token is half a second away, longer than the hedge delay and the deadline
+    rate_limiter.requests.drain()
+    executor = HedgedExecutor(name="groq", default_hedge_seconds=0.2, min_hedge_seconds=0.2, deadline_seconds=0.4)
+
+    with FakeTranscriptionServer() as server:
+        client = Groq(base_url=server.url, api_key="test", max_retries=0)
+        models = []
+        transcribe_audio(client=client, full_path="20261016_120000.mp3", audio=make_synthetic_frames(seconds=4), rate_limiter=rate_limiter,
+                         executor=executor, fallback_model="whisper-large-v3-turbo", models_used=models)
+        client.close()
+    executor.close()
+
+    assert models == ["whisper-large-v3"]
+    assert server.models == ["whisper-large-v3"]
+    assert executor.stats["hedged"] == 0 and executor.stats["deadline_exceeded"] == 0
+
+
+def fail():
+    raise ConnectionError("provider down")
+
+
+def test_the_circuit_opens_after_consecutive_failures_and_closes_after_a_good_trial():
+    executor = HedgedExecutor(name="test", failure_threshold=3, reset_seconds=0.2)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            executor.call(primary=fail)
+    assert executor.breaker.state == "open"
+
+    # while open the primary is skipped, for the fallback or an error
+    with pytest.raises(CircuitOpenError):
+        executor.call(primary=lambda: "primary")
+    assert executor.call(primary=lambda: "primary", fallback=lambda: "fallback") == "fallback"
+
+    time.sleep(0.25)
+    assert executor.call(primary=lambda: "primary") == "primary"
+    executor.close()
+
+    assert executor.breaker.state == "closed"
+    assert executor.stats["circuit_rejections"] == 1
+
+
+def test_a_failed_trial_opens_the_circuit_again():
+    executor = HedgedExecutor(name="test", failure_threshold=1, reset_seconds=0.1)
+
+    with pytest.raises(ConnectionError):
+        executor.call(primary=fail)
+    time.sleep(0.15)
+    with pytest.raises(ConnectionError):
+        executor.call(primary=fail)
+    executor.close()
+
+    assert executor.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        executor.call(primary=lambda: "primary")
+
+
+def test_deadline_is_exceeded_when_both_attempts_run_past_it():
+    executor = HedgedExecutor(name="test", default_hedge_seconds=0.05, min_hedge_seconds=0.05, deadline_seconds=0.2)
+    start = time.monotonic()
+
+    with pytest.raises(DeadlineExceeded):
+        executor.call(primary=lambda: time.sleep(1.0), fallback=lambda: time.sleep(1.0))
+    elapsed = time.monotonic() - start
+    executor.close()
+
+    assert elapsed < 0.5
+    assert executor.stats["hedged"] == 1 and executor.stats["deadline_exceeded"] == 1
+
+
+def test_hedge_delay_is_the_nearest_rank_percentile_of_recent_latencies():
+    tracker = LatencyTracker(min_samples=10)
+    for latency in range(1, 10):
+        tracker.add(latency / 100)
+    assert tracker.percentile(95) is None
+
+    tracker.add(0.10)
+    for latency in range(11, 101):
+        tracker.add(latency / 100)
+
+    assert (tracker.percentile(50), tracker.percentile(95), tracker.percentile(99)) == (0.5, 0.95, 0.99)
@@ -0,0 +1,96 @@
+import pytest
+
+from fake_services import FakeStreamServer
+from icy import IcyDemuxer, is_song_title, parse_stream_title
+from mp3_frames import audio_duration, iter_frames
+from stream_capture import capture_stream
+
+METAINT = 100
+
+
+def metadata_block(title: str) -> bytes:
+    metadata = f"StreamTitle='{title}';".encode("utf-8")
+    blocks = (len(metadata) + 15) // 16
+    return bytes([blocks]) + metadata.ljust(blocks * 16, b"\x00")
+
+
+def build_stream(titles):
+    """Interleaves one metadata block (an empty one for None) after every METAINT bytes of audio."""
+    audio = bytes(range(256)) * 4
+    stream = bytearray()
+    expected = []
+    title = None
+    for index, next_title in enumerate(titles):
+        run = audio[index * METAINT:(index + 1) * METAINT]
+        stream += run
+        expected.append((title, run))
+        stream += metadata_block(next_title) if next_title is not None else b"\x00"
+        title = next_title if next_title is not None else title
+    return bytes(stream), expected
+
+
+def feed_in_chunks(demuxer, stream, size):
+    runs = []
+    for start in range(0, len(stream), size):
+        runs.extend(demuxer.feed(memoryview(stream)[start:start + size]))
+    return runs
+
+
+def merge_runs(runs):
+    """Joins consecutive runs played under the same title, as chunking splits them arbitrarily."""
+    merged = []
+    for title, audio in runs:
+        if merged and merged[-1][0] == title:
+            merged[-1] = (title, merged[-1][1] + bytes(audio))
+        else:
+            merged.append((title, bytes(audio)))
+    return merged
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 17, METAINT, METAINT + 1, 4096])
+def test_metadata_is_stripped_whatever_the_chunk_boundaries(chunk_size):
+    stream, expected = build_stream(["Movin 92.5", None, "Olivia Rodrigo - Vampire", "Olivia Rodrigo - Vampire", "Morning Show"])
+    demuxer = IcyDemuxer(metaint=METAINT)
+
+    runs = feed_in_chunks(demuxer, stream, chunk_size)
+
+    assert b"".join(bytes(audio) for _, audio in runs) == b"".join(audio for _, audio in expected)
+    assert merge_runs(runs) == merge_runs(expected)
+    assert demuxer.title == "Morning Show"
+    assert demuxer.title_changes == 3
+
+
+def test_stream_without_metadata_is_passed_through():
+    demuxer = IcyDemuxer(metaint=None)
+
+    assert demuxer.feed(b"abc") == [(None, b"abc")]
+    assert demuxer.feed(b"") == []
+
+
+def test_stream_title_parsing():
+    assert parse_stream_title(b"StreamTitle='Artist - Song';StreamUrl='';\x00\x00") == "Artist - Song"
+    assert parse_stream_title(b"StreamUrl='x';") is None
+    assert is_song_title("Olivia Rodrigo - Vampire")
+    assert not is_song_title("Movin 92.5")
+    assert not is_song_title("")
+    assert not is_song_title(None)
+
+
+def test_captured_audio_has_no_metadata_left_in_it():
+    audio = bytearray()
+    titles = set()
+
+    def on_audio(run, title):
+        audio.extend(run)
+        titles.add(title)
+
+    # an odd metaint puts metadata blocks in the middle of frames and across read buffers
+    with FakeStreamServer(bytes_per_second=None, metaint=1001, title_every=2) as server:
+        stats = capture_stream(url=f"{server.url}/stream.mp3", duration=0.5, on_audio=on_audio, buffer_size=4000)
+
+    assert stats["bytes"] > len(audio) > 0
+    frames = list(iter_frames(bytes(audio)))
+    # every frame follows the previous one directly, no metadata byte is wedged between them
+    assert all(previous.offset + previous.length == frame.offset for previous, frame in zip(frames, frames[1:]))
+    assert audio_duration(bytes(audio)) > 1
+    assert {"Movin 92.5", "Olivia Rodrigo - Vampire"} <= titles
@@ -0,0 +1,82 @@
+import json
+import os
+
+import pytest
+
+import instrumentation
+from instrumentation import Metrics, export_metrics, increment, observe, span
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    # a registry of its own, so the samples the rest of the suite records do not show up
+    registry = Metrics(buckets=(0.1, 1.0))
+    monkeypatch.setattr(instrumentation, "METRICS", registry)
+    return registry
+
+
+def test_spans_record_blocks_and_decorated_calls_and_count_failures(metrics):
+    @span("sms.send")
+    def send(fail: bool) -> None:
+        if fail:
+            raise ConnectionError("no route")
+
+    send(False)
+    with pytest.raises(ConnectionError):
+        send(True)
+    with span("detection"):
+        pass
+
+    stages = metrics.summary()["stages"]
+    assert stages["sms.send"]["count"] == 2 and stages["sms.send"]["errors"] == 1
+    assert stages["detection"]["count"] == 1 and stages["detection"]["errors"] == 0
+
+
+def test_observed_latencies_give_percentiles(metrics):
+    for seconds in range(1, 101):
+        observe("air_to_alert", seconds / 100)
+
+    stats = metrics.summary()["stages"]["air_to_alert"]
+
+    assert (stats["p50_seconds"], stats["p95_seconds"], stats["p99_seconds"]) == (0.5, 0.95, 0.99)
+    assert stats["mean_seconds"] == pytest.approx(0.505)
+
+
+def test_prometheus_text_has_cumulative_buckets_errors_and_counters(metrics):
+    observe("transcription.request", 0.05)
+    observe("transcription.request", 0.5)
+    observe("transcription.request", 5.0, error=True)
+    increment("trimmed_audio_seconds", 12.5)
+
+    lines = metrics.to_prometheus().splitlines()
+
+    assert "# TYPE radioapp_stage_duration_seconds histogram" in lines
+    assert [line for line in lines if line.startswith("radioapp_stage_duration_seconds_")] == [
+        'radioapp_stage_duration_seconds_bucket{stage="transcription.request",le="0.1"} 1',
+        'radioapp_stage_duration_seconds_bucket{stage="transcription.request",le="1.0"} 2',
+        'radioapp_stage_duration_seconds_bucket{stage="transcription.request",le="+Inf"} 3',
+        'radioapp_stage_duration_seconds_sum{stage="transcription.request"} 5.550000',
+        'radioapp_stage_duration_seconds_count{stage="transcription.request"} 3',
+    ]
+    assert 'radioapp_stage_errors_total{stage="transcription.request"} 1' in lines
+    assert lines[-2:] == ["# TYPE radioapp_trimmed_audio_seconds_total counter", "radioapp_trimmed_audio_seconds_total 12.5"]
+
+
+def test_export_writes_the_prometheus_file_and_a_json_run_summary(metrics, workdir):
+    with span("model.cascade"):
+        pass
+    observe("air_to_alert", 42.0)
+    increment("sms.sent")
+
+    paths = export_metrics(prometheus_path="metrics/radioapp.prom", summary_directory="metrics/runs", summary_name="daemon_window", mode="daemon")
+
+    assert paths == ["metrics/radioapp.prom", os.path.join("metrics/runs", "daemon_window.json")]
+    with open("metrics/radioapp.prom", encoding="utf-8") as f:
+        assert f.read() == metrics.to_prometheus()
+    assert not [name for name in os.listdir("metrics") if name.endswith(".tmp")]
+    with open(paths[1], encoding="utf-8") as f:
+        summary = json.load(f)
+    assert summary["mode"] == "daemon"
+    assert summary["stages"]["air_to_alert"]["p95_seconds"] == 42.0
+    assert summary["stages"]["model.cascade"]["count"] == 1
+    assert summary["counters"] == {"sms.sent": 1}
@@ -0,0 +1,146 @@
+import importlib
+import os
+import threading
+import time
+
+import pytest
+
+from models import ModelRequestError
+from notifications import NotificationDispatcher
+from transcript_store import TranscriptStore
+
+ANNOUNCEMENT = "the code word for this hour is lighthouse, text it in now"
+
+
+@pytest.fixture
+def main(workdir, monkeypatch):
+    # main configures logging to log.log on import, keep it in the test directory
+    module = importlib.import_module("main")
+    monkeypatch.setattr(module, "warm_up", lambda **kwargs: None)
+    monkeypatch.setattr(module, "get_groq_client", lambda: None)
+    monkeypatch.setattr(module.NotificationDispatcher, "from_env", classmethod(lambda cls, **kwargs: cls(phone_numbers=[])))
+    return module
+
+
+def stub_run_once_capture(main, monkeypatch, texts):
+    monkeypatch.setattr(main, "download_audio_chunk", lambda url, duration: None)
+
+    def transcribe(store, **kwargs):
+        for text in texts:
+            store.append(text=text, start_time=time.time(), end_time=time.time() + 60)
+
+    monkeypatch.setattr(main, "transcribe_and_move_audio_files", lambda **kwargs: transcribe(**kwargs))
+
+
+def detector_checkpoint() -> int:
+    with TranscriptStore() as store:
+        return store.get_checkpoint("detector")
+
+
+def test_run_once_keeps_the_checkpoint_when_the_model_request_fails(main, monkeypatch):
+    stub_run_once_capture(main, monkeypatch, ["music", ANNOUNCEMENT])
+
+    def fail(**kwargs):
+        raise ModelRequestError("gpt-4o request failed")
+
+    monkeypatch.setattr(main, "run_cascade", fail)
+    main.run_once(url="http://127.0.0.1:9/stream")
+
+    assert detector_checkpoint() == 0
+
+
+def test_run_once_advances_the_checkpoint_when_the_cascade_rejects_the_window(main, monkeypatch):
+    stub_run_once_capture(main, monkeypatch, ["music", ANNOUNCEMENT])
+    monkeypatch.setattr(main, "run_cascade", lambda **kwargs: None)
+    main.run_once(url="http://127.0.0.1:9/stream")
+
+    assert detector_checkpoint() == 2
+
+
+def test_run_once_closes_its_executors_and_store_when_a_step_raises(main, monkeypatch):
+    closed = []
+
+    class Store(TranscriptStore):
+        def close(self):
+            closed.append("store")
+            super().close()
+
+    class Executor(main.HedgedExecutor):
+        def close(self):
+            closed.append(self.name)
+            super().close()
+
+    def fail(**kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(main, "download_audio_chunk", lambda url, duration: None)
+    monkeypatch.setattr(main, "transcribe_and_move_audio_files", fail)
+    monkeypatch.setattr(main, "TranscriptStore", Store)
+    monkeypatch.setattr(main, "HedgedExecutor", Executor)
+
+    with pytest.raises(OSError):
+        main.run_once(url="http://127.0.0.1:9/stream")
+
+    assert sorted(closed) == ["groq", "openai", "store"]
+
+
+def test_pipelined_checkpoint_stops_below_segments_still_in_flight_or_failed(main, monkeypatch):
+    os.makedirs("recordings/completed", exist_ok=True)
+    # the first segment is transcribed last, the third one's model request fails
+    delays = [0.3, 0.0, 0.05, 0.1]
+    texts = ["music", "traffic", ANNOUNCEMENT, "weather"]
+    checkpoints = []
+
+    def capture(on_segment, **kwargs):
+        for index in range(len(texts)):
+            path = os.path.join("recordings/completed", f"segment_{index}.mp3")
+            with open(path, "wb") as f:
+                f.write(b"\x00" * 1024)
+            on_segment(path)
+
+    def transcribe(full_path, **kwargs):
+        index = int(os.path.basename(full_path)[len("segment_"):-len(".mp3")])
+        time.sleep(delays[index])
+        return texts[index], None, "whisper-large-v3"
+
+    def fail(**kwargs):
+        raise ModelRequestError("gpt-4o request failed")
+
+    class Store(TranscriptStore):
+        def set_checkpoint(self, name, segment_id):
+            checkpoints.append(segment_id)
+            super().set_checkpoint(name, segment_id)
+
+    monkeypatch.setattr(main, "capture_segments", capture)
+    monkeypatch.setattr(main, "transcribe_recording_timed", transcribe)
+    monkeypatch.setattr(main, "run_cascade", fail)
+    monkeypatch.setattr(main, "TranscriptStore", Store)
+
+    main.main_pipelined(url="http://127.0.0.1:9/stream", dispatcher=NotificationDispatcher(phone_numbers=[]))
+
+    with TranscriptStore() as store:
+        segments = {segment.text: segment.id for segment in store.iter_since(0)}
+        assert store.get_checkpoint("detector") == segments[ANNOUNCEMENT] - 1
+    # the segment transcribed last was stored last, and nothing was checkpointed past a segment before it was detected
+    assert checkpoints == sorted(checkpoints)
+    assert max(checkpoints) < segments[ANNOUNCEMENT]
+
+
+def test_pipelined_run_checks_segments_an_earlier_run_did_not_finish(main, monkeypatch):
+    with TranscriptStore() as store:
+        store.append(text="music", start_time=time.time(), end_time=time.time() + 60)
+        store.set_checkpoint("detector", 1)
+        left_behind = store.append(text=ANNOUNCEMENT, start_time=time.time(), end_time=time.time() + 60)
+    checked = []
+
+    def cascade(text, **kwargs):
+        checked.append(text)
+        return None
+
+    monkeypatch.setattr(main, "capture_segments", lambda **kwargs: None)
+    monkeypatch.setattr(main, "run_cascade", cascade)
+
+    main.main_pipelined(url="http://127.0.0.1:9/stream", dispatcher=NotificationDispatcher(phone_numbers=[]))
+
+    assert len(checked) == 1 and "lighthouse" in checked[0]
+    assert detector_checkpoint() == left_behind
@@ -0,0 +1,113 @@
+import pytest
+
+from clients import configure_clients
+from detection import score_announcement
+from fake_services import FakeChatServer, default_chat_reply
+from models import CASCADE_CONFIG, ModelRequestError, parse_code_word, run_cascade, screen_window
+
+SCREEN_MODEL = CASCADE_CONFIG["screen_model"]
+FINAL_MODEL = CASCADE_CONFIG["final_model"]
+
+# one trigger phrase and nothing else that sounds like an announcement
+AMBIGUOUS = "stay tuned, we will have the code word coming up after the break with the traffic on the nines"
+# a trigger phrase, the word itself, where to text it and the prize
+CLEAR = "your code word for this hour is vampire, text it in to 92.5 now for your tickets"
+# no trigger phrase at all
+CHATTER = "that was the new one from olivia rodrigo, traffic and weather on the nines"
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    servers = []
+
+    def start(**kwargs) -> FakeChatServer:
+        server = FakeChatServer(**kwargs).start()
+        servers.append(server)
+        configure_clients(openai_base_url=server.api_url)
+        return server
+
+    yield start
+    configure_clients(openai_base_url=None)
+    for server in servers:
+        server.stop()
+
+
+def screen_replying(reply: str):
+    def responder(model, messages):
+        return reply if model == SCREEN_MODEL else default_chat_reply(model, messages)
+    return responder
+
+
+def cascade(text: str, words=None):
+    return run_cascade(system_prompt="Find the winning word.", user_prompt=f"<text_transcript>{text}</text_transcript>", text=text,
+                       on_code_word=words.append if words is not None else None)
+
+
+def test_scores_place_the_examples_in_their_tiers():
+    assert score_announcement(CHATTER) < CASCADE_CONFIG["heuristic_reject_below"]
+    assert CASCADE_CONFIG["heuristic_reject_below"] <= score_announcement(AMBIGUOUS) < CASCADE_CONFIG["heuristic_escalate_above"]
+    assert score_announcement(CLEAR) >= CASCADE_CONFIG["heuristic_escalate_above"]
+
+
+def test_window_without_a_trigger_phrase_is_dropped_without_a_model_call(chat):
+    server = chat()
+
+    assert cascade(CHATTER) is None
+    assert server.models == []
+
+
+def test_a_single_trigger_phrase_is_screened_by_the_cheap_model(chat):
+    server = chat(responder=screen_replying("0.1"))
+
+    assert cascade(AMBIGUOUS) is None
+    assert server.models == [SCREEN_MODEL]
+
+
+def test_a_likely_announcement_escalates_from_the_screen_to_the_final_model(chat):
+    server = chat(responder=screen_replying("0.7"))
+
+    cascade(AMBIGUOUS)
+
+    assert server.models == [SCREEN_MODEL, FINAL_MODEL]
+
+
+def test_an_unusable_screen_reply_escalates(chat):
+    server = chat(responder=screen_replying("maybe"))
+
+    cascade(AMBIGUOUS)
+
+    assert server.models == [SCREEN_MODEL, FINAL_MODEL]
+
+
+def test_a_clear_announcement_skips_the_screen_and_alerts_early(chat):
+    server = chat()
+    words = []
+
+    response = cascade(CLEAR, words)
+
+    assert server.models == [FINAL_MODEL]
+    assert parse_code_word(response) == "vampire"
+    assert words == ["vampire"]
+
+
+def test_a_failed_final_request_is_an_error_not_a_rejection(chat):
+    chat(error_rate=1.0, error_status=500)
+
+    with pytest.raises(ModelRequestError):
+        cascade(CLEAR)
+
+
+@pytest.mark.parametrize("reply, probability", [
+    ("0.7", 0.7),
+    ("Probability: .85", 0.85),
+    (".3", 0.3),
+    ("1", 1.0),
+    ("0", 0.0),
+    ("10", None),
+    ("maybe", None),
+])
+def test_screen_replies_are_read_as_probabilities(chat, reply, probability):
+    chat(responder=screen_replying(reply))
+
+    assert screen_window(AMBIGUOUS) == probability
@@ -0,0 +1,63 @@
+import pytest
+
+from mp3_frames import audio_duration, iter_frames, make_synthetic_frames, slice_seconds, split_frames
+from transcriptions import stitch_transcripts
+
+FRAME_SECONDS = 1152 / 44100
+
+
+def test_duration_is_read_from_the_frames_after_leading_junk():
+    audio = b"junk" + make_synthetic_frames(seconds=10)
+
+    assert audio_duration(audio) == pytest.approx(10, abs=FRAME_SECONDS)
+
+
+def test_split_pieces_are_whole_frames_covering_the_recording_with_overlap():
+    audio = make_synthetic_frames(seconds=300)
+
+    chunks = split_frames(audio, chunk_seconds=120, overlap_seconds=5)
+
+    assert len(chunks) == 3
+    assert chunks[0].start_seconds == 0
+    assert chunks[-1].end_seconds == pytest.approx(audio_duration(audio))
+    for chunk in chunks:
+        # every piece parses as MP3 on its own, from its first byte to its last
+        frames = list(iter_frames(chunk.data))
+        assert frames[0].offset == 0
+        assert frames[-1].offset + frames[-1].length == len(chunk.data)
+        assert audio_duration(chunk.data) == pytest.approx(chunk.end_seconds - chunk.start_seconds)
+        assert chunk.end_seconds - chunk.start_seconds <= 120 + FRAME_SECONDS
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert previous.end_seconds - chunk.start_seconds == pytest.approx(5, abs=2 * FRAME_SECONDS)
+
+
+def test_recording_shorter_than_a_piece_is_not_split():
+    audio = make_synthetic_frames(seconds=30)
+
+    chunks = split_frames(audio, chunk_seconds=120, overlap_seconds=5)
+
+    assert len(chunks) == 1
+    assert chunks[0].data == audio
+
+
+def test_slice_keeps_the_frames_overlapping_the_interval():
+    audio = make_synthetic_frames(seconds=20)
+
+    piece = slice_seconds(audio, 5, 8)
+
+    assert audio_duration(piece) == pytest.approx(3, abs=2 * FRAME_SECONDS)
+    assert slice_seconds(audio, 30, 40) == b""
+
+
+def test_stitching_removes_the_words_heard_twice_at_the_overlap():
+    texts = [
+        "the morning show is back and your code word",
+        "And your code word this hour is vampire, text it",
+        "vampire text it to 92.5 now",
+    ]
+
+    assert stitch_transcripts(texts) == "the morning show is back and your code word this hour is vampire, text it to 92.5 now"
+
+
+def test_pieces_without_a_shared_run_are_concatenated():
+    assert stitch_transcripts(["one two three", "", "four five six"]) == "one two three four five six"
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+
+from fake_services import FakeSmtpServer, FakeTextbeltServer
+from notifications import NotificationDispatcher, alert_code_word
+
+
+@pytest.fixture
+def textbelt():
+    with FakeTextbeltServer() as server:
+        yield server
+
+
+def make_dispatcher(server, **kwargs) -> NotificationDispatcher:
+    return NotificationDispatcher(phone_numbers=["5550100", "5550101", ""], textbelt_url=server.text_url, **kwargs)
+
+
+def test_every_recipient_is_notified(textbelt):
+    dispatcher = make_dispatcher(textbelt)
+
+    deliveries = dispatcher.dispatch("Movin 92.5 code word: vampire")
+    dispatcher.close()
+
+    assert sorted(d.recipient for d in deliveries if d.ok) == ["5550100", "5550101"]
+    assert sorted(m["phone"] for m in textbelt.messages) == ["5550100", "5550101"]
+
+
+def test_identical_messages_are_sent_once_within_the_window(textbelt):
+    dispatcher = make_dispatcher(textbelt, dedupe_window_seconds=0.5)
+
+    assert len(dispatcher.dispatch("Movin 92.5 code word: vampire")) == 2
+    # case and spacing do not make a message new
+    assert dispatcher.dispatch("movin 92.5  CODE word:   vampire") == []
+    assert len(dispatcher.dispatch("Movin 92.5 code word: butterfly")) == 2
+    time.sleep(0.6)
+    assert len(dispatcher.dispatch("Movin 92.5 code word: vampire")) == 2
+    dispatcher.close()
+
+    assert len(textbelt.messages) == 6
+
+
+def test_a_message_that_reached_nobody_is_not_suppressed():
+    with FakeTextbeltServer(error_rate=1.0, error_status=500) as server:
+        dispatcher = make_dispatcher(server)
+
+        failed = dispatcher.dispatch("Movin 92.5 code word: vampire")
+        server.error_rate = 0.0
+        retried = dispatcher.dispatch("Movin 92.5 code word: vampire")
+        dispatcher.close()
+
+    assert failed and not any(d.ok for d in failed)
+    assert all(d.ok for d in retried) and len(retried) == 2
+    assert len(server.messages) == 2
+
+
+def test_sms_and_email_go_out_concurrently():
+    with FakeTextbeltServer(latency_seconds=0.3) as textbelt, FakeSmtpServer(latency_seconds=0.3) as smtp:
+        dispatcher = NotificationDispatcher(phone_numbers=["5550100", "5550101", "5550102"], emails=["a@example.com", "b@example.com"],
+                                            email_sender="alerts@example.com", email_password=None, smtp_host="127.0.0.1",
+                                            smtp_port=smtp.port, smtp_use_tls=False, textbelt_url=textbelt.text_url)
+        start = time.monotonic()
+        deliveries = dispatcher.dispatch("Movin 92.5 code word: vampire")
+        elapsed = time.monotonic() - start
+        dispatcher.close()
+
+    assert sorted(d.channel for d in deliveries if d.ok) == ["email", "email", "sms", "sms", "sms"]
+    # three texts sent one after the other would take at least 0.9 seconds
+    assert elapsed < 0.8
+
+
+def test_concurrent_dispatches_of_the_same_message_send_it_once():
+    # slow enough that every dispatch starts while the first one is still in flight
+    with FakeTextbeltServer(latency_seconds=0.3) as server:
+        dispatcher = make_dispatcher(server)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(dispatcher.dispatch("Movin 92.5 code word: vampire"))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        dispatcher.close()
+
+    assert sorted(len(deliveries) for deliveries in results) == [0, 0, 0, 2]
+    assert len(server.messages) == 2
+
+
+def test_code_word_alert_names_the_station(textbelt):
+    dispatcher = make_dispatcher(textbelt)
+
+    alert_code_word(dispatcher=dispatcher, word="vampire", station="KQMV")
+    dispatcher.close()
+
+    assert {m["message"] for m in textbelt.messages} == {"KQMV code word: vampire"}
@@ -0,0 +1,112 @@
+import logging
+import threading
+import time
+
+from fake_services import FakeStreamServer
+from pipeline import Pipeline, PipelineStopped, Stage, run_pipeline
+from stream_capture import capture_segments
+
+
+def test_single_worker_stages_keep_item_order():
+    def produce(emit):
+        for i in range(20):
+            emit(i)
+
+    results = run_pipeline(producer=produce, stages=[
+        Stage(name="double", func=lambda x: x * 2),
+        Stage(name="skip_multiples_of_three", func=lambda x: x if x % 3 else None),
+    ])
+
+    assert results == [x * 2 for x in range(20) if (x * 2) % 3]
+
+
+def test_bounded_queue_blocks_the_producer_behind_a_slow_stage():
+    in_flight = []
+    lock = threading.Lock()
+
+    def slow(item):
+        with lock:
+            in_flight.append(item)
+        time.sleep(0.02)
+        return item
+
+    def produce(emit):
+        for i in range(10):
+            emit(i)
+
+    pipeline = Pipeline(producer=produce, stages=[Stage(name="slow", func=slow, max_queue_size=1)])
+    results = pipeline.run()
+
+    stats = pipeline.stats()["slow"]
+    assert sorted(results) == list(range(10))
+    assert stats["max_queue_depth"] <= 1
+    # the producer waited for the stage instead of queueing every item at once
+    assert stats["upstream_blocked_seconds"] > 0.05
+
+
+def test_stop_interrupts_the_producer_and_drains_queued_items():
+    emitted = []
+    pipeline = None
+
+    def produce(emit):
+        for i in range(100):
+            if i == 3:
+                pipeline.stop()
+            emit(i)
+            emitted.append(i)
+
+    pipeline = Pipeline(producer=produce, stages=[Stage(name="identity", func=lambda x: x, workers=2)])
+    results = pipeline.run()
+
+    assert emitted == [0, 1, 2]
+    assert sorted(results) == [0, 1, 2]
+
+
+def test_failing_items_are_counted_and_do_not_stop_the_stage():
+    def produce(emit):
+        for i in range(5):
+            emit(i)
+
+    def fail_on_two(item):
+        if item == 2:
+            raise RuntimeError("boom")
+        return item
+
+    pipeline = Pipeline(producer=produce, stages=[Stage(name="flaky", func=fail_on_two)])
+
+    assert pipeline.run() == [0, 1, 3, 4]
+    assert pipeline.stats()["flaky"]["failed"] == 1
+
+
+def test_emit_after_stop_raises():
+    pipeline = Pipeline(producer=lambda emit: None, stages=[Stage(name="identity", func=lambda x: x)])
+    pipeline.stop()
+    try:
+        pipeline.emit(1)
+    except PipelineStopped:
+        pass
+    else:
+        raise AssertionError("emit should raise once the pipeline is stopped")
+
+
+def test_stopping_a_segmented_capture_is_not_logged_as_an_error(workdir, caplog):
+    pipeline = None
+
+    def produce(emit):
+        capture_segments(url=f"{server.url}/stream.mp3", duration=20, segment_seconds=2, overlap_seconds=0, on_segment=emit)
+
+    def stop_after_first(path):
+        pipeline.stop()
+        return path
+
+    with FakeStreamServer(bytes_per_second=16000) as server, caplog.at_level(logging.INFO):
+        pipeline = Pipeline(producer=produce, stages=[Stage(name="transcription", func=stop_after_first)])
+        start = time.monotonic()
+        results = pipeline.run()
+
+    assert time.monotonic() - start < 10
+    assert len(results) == 1
+    assert "Pipeline stopped" in caplog.text
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    # the segment that was still recording is published, not left in progress
+    assert not list((workdir / "recordings" / "in_progress").iterdir())
@@ -0,0 +1,69 @@
+import pytest
+
+from detection import find_trigger_phrases
+from prompts import WINDOW_SEPARATOR, build_transcript_context, estimate_tokens
+
+ANNOUNCEMENT = "your code word this hour is vampire text it to 92 5"
+
+
+def unpunctuated_transcript(position: str, filler_words: int = 3000) -> str:
+    filler = [f"filler{i}" for i in range(filler_words)]
+    index = {"start": 0, "middle": filler_words // 2, "end": filler_words}[position]
+    return " ".join(filler[:index] + [ANNOUNCEMENT] + filler[index:])
+
+
+@pytest.mark.parametrize("position", ["start", "middle", "end"])
+def test_unpunctuated_transcript_keeps_the_announcement(position):
+    text = unpunctuated_transcript(position)
+    hits = find_trigger_phrases(text)
+    assert hits
+
+    context = build_transcript_context(text=text, hits=hits, max_tokens=200)
+
+    assert "code word this hour is vampire" in context
+    assert estimate_tokens(context) <= 200
+    assert len(context) < len(text)
+
+
+def test_every_hit_gets_a_window_when_the_budget_allows():
+    filler = " ".join(f"filler{i}" for i in range(3000))
+    text = f"the code word is alpha {filler} the code word is omega"
+    hits = find_trigger_phrases(text)
+
+    context = build_transcript_context(text=text, hits=hits, max_tokens=200)
+
+    assert "code word is alpha" in context
+    assert "code word is omega" in context
+    assert WINDOW_SEPARATOR in context
+    assert estimate_tokens(context) <= 200
+
+
+def test_latest_hit_is_kept_when_the_budget_is_tiny():
+    filler = " ".join(f"filler{i}" for i in range(500))
+    text = f"the code word is alpha {filler} the code word is omega {filler}"
+    hits = find_trigger_phrases(text)
+
+    context = build_transcript_context(text=text, hits=hits, max_tokens=8)
+
+    assert context
+    assert "code word" in context
+    assert "alpha" not in context
+
+
+def test_punctuated_transcript_is_cut_to_the_sentences_around_the_hit():
+    filler = " ".join(f"Filler sentence number {i}." for i in range(200))
+    text = f"{filler} Your code word this hour is vampire. Text vampire to 92.5 now. {filler}"
+    hits = find_trigger_phrases(text)
+
+    context = build_transcript_context(text=text, hits=hits, window_sentences=1, max_tokens=200)
+
+    assert context == "Filler sentence number 199. Your code word this hour is vampire. Text vampire to 92.5 now."
+
+
+def test_transcript_without_hits_keeps_its_end():
+    text = " ".join(f"filler{i}" for i in range(3000))
+
+    context = build_transcript_context(text=text, hits=[], max_tokens=50)
+
+    assert text.endswith(context)
+    assert 0 < estimate_tokens(context) <= 50
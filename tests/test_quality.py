@@ -0,0 +1,112 @@
+from types import SimpleNamespace
+
+from mp3_frames import audio_duration, make_synthetic_frames
+from quality import QualityScorer, Transcript, find_repetition_loops, splice_transcript
+from transcriptions import transcribe_audio
+
+GOOD = {"avg_logprob": -0.2, "no_speech_prob": 0.01, "compression_ratio": 1.2}
+
+
+def segment(start: float, end: float, text: str, **fields) -> dict:
+    return {"start": start, "end": end, "text": text, **{**GOOD, **fields}}
+
+
+def response(*segments: dict) -> dict:
+    return {"text": " ".join(s["text"] for s in segments), "segments": list(segments)}
+
+
+def test_a_confident_transcript_is_accepted():
+    report = QualityScorer().score(response(segment(0, 10, "the code word for this hour is vampire"),
+                                            segment(10, 20, "text it in now for your tickets")), audio_seconds=20)
+
+    assert report.accept
+    assert report.reasons == [] and report.retry_spans == [] and report.drop_spans == []
+
+
+def test_text_made_up_over_music_is_dropped_not_retried():
+    report = QualityScorer().score(response(segment(0, 10, "the code word is vampire"),
+                                            segment(10, 30, "thank you for watching", no_speech_prob=0.9, avg_logprob=-1.5)), audio_seconds=30)
+
+    assert not report.accept
+    assert report.drop_spans == [(10, 30)]
+    assert report.retry_spans == []
+
+
+def test_a_likely_non_speech_segment_decoded_with_confidence_is_kept():
+    report = QualityScorer().score(response(segment(0, 10, "the code word is vampire", no_speech_prob=0.9)), audio_seconds=10)
+
+    assert report.accept
+
+
+def test_repetitive_and_unsure_segments_are_retried():
+    report = QualityScorer().score(response(segment(0, 10, "the code word is vampire"),
+                                            segment(10, 20, "and and and the the", compression_ratio=3.1),
+                                            segment(20, 30, "text it in mow", avg_logprob=-1.3)), audio_seconds=30)
+
+    assert not report.accept
+    assert report.retry_spans == [(10, 30)]
+    assert report.drop_spans == []
+    assert len(report.reasons) == 2
+
+
+def test_repetition_loops_are_found_and_retried_by_their_words():
+    words = "the code word is".split() + ["thank", "you"] * 5 + ["now"]
+    assert find_repetition_loops(words) == [(4, 14)]
+
+    transcription = {"text": " ".join(words), "words": [{"word": w, "start": i, "end": i + 0.9} for i, w in enumerate(words)]}
+    report = QualityScorer().score(transcription, audio_seconds=len(words))
+
+    assert report.retry_spans == [(4, 13.9)]
+
+
+def test_a_transcript_faster_than_anyone_speaks_is_retried_whole():
+    report = QualityScorer().score({"text": " ".join(f"word{i}" for i in range(60))}, audio_seconds=5)
+
+    assert report.retry_spans == [(0.0, 5)]
+
+
+def test_splicing_replaces_a_span_with_its_retranscription_shifted_into_place():
+    transcript = Transcript(text="", segments=[segment(0, 10, "the code word"), segment(10, 20, "is fampire")], words=[])
+
+    spliced = splice_transcript(transcript, replacements=[((9.0, 21.0), response(segment(1, 11, "is vampire")))])
+
+    assert spliced.text == "the code word is vampire"
+    assert (spliced.segments[-1]["start"], spliced.segments[-1]["end"]) == (10.0, 20.0)
+
+
+class ScriptedClient:
+    """Answers transcription requests with canned responses, keeping the name and duration of every upload."""
+
+    def __init__(self, *responses: dict):
+        self.responses = list(responses)
+        self.uploads = []
+        self.audio = SimpleNamespace(transcriptions=SimpleNamespace(create=self.create))
+
+    def create(self, file, **params):
+        name, audio = file
+        self.uploads.append((name, audio_duration(audio)))
+        return self.responses.pop(0)
+
+
+def test_only_the_flagged_span_is_transcribed_again():
+    audio = make_synthetic_frames(seconds=30)
+    client = ScriptedClient(response(segment(0, 10, "the code word"), segment(10, 20, "is fampire", avg_logprob=-1.4),
+                                     segment(20, 30, "text it in now")),
+                            response(segment(1, 11, "is vampire")))
+
+    transcription = transcribe_audio(client=client, full_path="20261016_120000.mp3", audio=audio)
+
+    assert transcription.text == "the code word is vampire text it in now"
+    # the first pass, then the flagged 10 seconds padded by a second on both sides
+    assert [name for name, _ in client.uploads] == ["20261016_120000.mp3", "20261016_120000_9s-21s.mp3"]
+    assert abs(client.uploads[1][1] - 12) < 0.1
+
+
+def test_a_good_pass_or_dropped_non_speech_needs_no_second_request():
+    audio = make_synthetic_frames(seconds=20)
+    client = ScriptedClient(response(segment(0, 10, "the code word is vampire")),
+                            response(segment(0, 10, "the code word is vampire"), segment(10, 20, "thank you", no_speech_prob=0.95, avg_logprob=-2.0)))
+
+    assert transcribe_audio(client=client, full_path="a.mp3", audio=audio)["text"] == "the code word is vampire"
+    assert transcribe_audio(client=client, full_path="b.mp3", audio=audio).text == "the code word is vampire"
+    assert len(client.uploads) == 2
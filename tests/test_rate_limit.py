@@ -0,0 +1,91 @@
+import pytest
+
+import rate_limit
+from fake_services import FakeTranscriptionServer
+from mp3_frames import make_synthetic_frames
+from rate_limit import ProviderRateLimiter, TokenBucket
+from transcriptions import request_transcription
+
+
+class FakeClock:
+    """Stands in for the time module, so waiting on a bucket takes no real time."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+        self.slept += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "time", clock)
+    return clock
+
+
+def test_full_bucket_allows_a_burst_without_waiting(clock):
+    bucket = TokenBucket(capacity=5, refill_per_second=1)
+
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    assert clock.slept == 0.0
+
+
+def test_empty_bucket_waits_for_the_refill(clock):
+    bucket = TokenBucket(capacity=2, refill_per_second=0.5)
+    bucket.acquire(2)
+
+    waited = bucket.acquire(1)
+
+    assert waited == pytest.approx(2.0)
+    assert clock.slept == pytest.approx(2.0)
+
+
+def test_refill_is_capped_at_the_capacity(clock):
+    bucket = TokenBucket(capacity=3, refill_per_second=1)
+    bucket.acquire(3)
+    clock.now += 3600
+
+    assert bucket.acquire(3) == 0.0
+    assert bucket.acquire(1) == pytest.approx(1.0)
+
+
+def test_requests_larger_than_the_capacity_wait_for_a_full_bucket(clock):
+    bucket = TokenBucket(capacity=10, refill_per_second=5)
+    bucket.acquire(10)
+
+    assert bucket.acquire(25) == pytest.approx(2.0)
+
+
+def test_back_off_pauses_every_caller_and_drains_the_bucket(clock):
+    limiter = ProviderRateLimiter(requests_per_minute=60, audio_seconds_per_hour=3600)
+
+    limiter.back_off(retry_after=5)
+
+    assert limiter.acquire() == pytest.approx(5.0)
+    assert limiter.throttled == 1
+    # only what refilled during the pause is left of the full minute's burst
+    assert [limiter.acquire() for _ in range(4)] == [0.0] * 4
+    assert limiter.acquire() == pytest.approx(1.0)
+
+
+def test_rate_limited_transcriptions_are_retried():
+    from groq import Groq
+
+    audio = make_synthetic_frames(seconds=2)
+    limiter = ProviderRateLimiter(requests_per_minute=6000, audio_seconds_per_hour=1e9)
+    with FakeTranscriptionServer(error_rate=0.5, error_status=429, seed=3) as server:
+        # the SDK's own retries are turned off, so every 429 reaches the limiter
+        client = Groq(base_url=server.url, api_key="test", max_retries=0)
+        texts = [request_transcription(client=client, full_path="a.mp3", audio=audio, rate_limiter=limiter, max_rate_limit_retries=10,
+                                       model="whisper-large-v3").text for _ in range(6)]
+        client.close()
+
+    assert all(texts)
+    assert server.errors > 0
+    assert limiter.throttled == server.errors
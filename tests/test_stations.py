@@ -0,0 +1,66 @@
+import json
+import socket
+import threading
+
+import pytest
+
+from fake_services import FakeStreamServer
+from stations import capture_stations, load_stations
+
+
+def write_config(path, config) -> str:
+    path.write_text(json.dumps(config))
+    return str(path)
+
+
+def test_station_entries_get_the_defaults_filled_in(tmp_path):
+    config_path = write_config(tmp_path / "stations.json", {
+        "defaults": {"segment_seconds": 30},
+        "stations": [{"name": "KQMV", "url": "http://a"}, {"name": "KISW", "url": "http://b", "skip_songs": True}],
+    })
+
+    stations = load_stations(config_path=config_path)
+
+    assert [s["name"] for s in stations] == ["KQMV", "KISW"]
+    assert all(s["segment_seconds"] == 30 for s in stations)
+    assert [s["skip_songs"] for s in stations] == [False, True]
+
+
+@pytest.mark.parametrize("stations", [
+    [{"name": "KQMV"}],
+    [{"name": "../etc", "url": "http://a"}],
+    [{"name": "KQMV", "url": "http://a"}, {"name": "KQMV", "url": "http://b"}],
+])
+def test_invalid_station_entries_are_rejected(tmp_path, stations):
+    config_path = write_config(tmp_path / "stations.json", {"stations": stations})
+
+    with pytest.raises(ValueError):
+        load_stations(config_path=config_path)
+
+
+def test_stations_are_captured_concurrently_into_their_own_directories(workdir):
+    segments = []
+    lock = threading.Lock()
+
+    def on_segment(name, path):
+        with lock:
+            segments.append((name, path))
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        dead_port = sock.getsockname()[1]
+    with FakeStreamServer() as first, FakeStreamServer() as second:
+        stations = [
+            {"name": "first", "url": f"{first.url}/stream.mp3"},
+            {"name": "second", "url": f"{second.url}/stream.mp3"},
+            # a station that cannot be reached does not hold up the others
+            {"name": "dead", "url": f"http://127.0.0.1:{dead_port}/stream.mp3"},
+        ]
+        stations = [{"segment_seconds": 2, "overlap_seconds": 0, "icy_metadata": True, "skip_songs": False, **s} for s in stations]
+        results = capture_stations(stations=stations, duration=4, base_directory="recordings", on_segment=on_segment)
+
+    assert results["dead"] == []
+    for name in ("first", "second"):
+        assert len(results[name]) >= 2
+        assert all(f"recordings/{name}/completed/" in path.replace("\\", "/") for path in results[name])
+    assert sorted(segments) == sorted((name, path) for name, paths in results.items() for path in paths)
@@ -0,0 +1,72 @@
+import socket
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+import requests
+
+from fake_services import FakeServer, FakeStreamServer
+from stream_capture import capture_segments, capture_stream
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_a_stalled_stream_is_reconnected():
+    received = []
+    with FakeStreamServer(bytes_per_second=None, stall_after_bytes=20000) as server:
+        stats = capture_stream(url=f"{server.url}/stream.mp3", duration=3, on_audio=lambda audio, title: received.append(len(audio)),
+                               stall_timeout=0.5, reconnect_delay=0.05)
+
+    assert stats["stalls"] == 1
+    assert stats["reconnects"] == 1
+    assert server.requests == 2
+    assert sum(received) > 20000
+
+
+def test_failed_connection_attempts_back_off_instead_of_ending_the_capture():
+    stats = capture_stream(url=f"http://127.0.0.1:{unused_port()}/stream.mp3", duration=5, on_audio=lambda audio, title: None,
+                           max_reconnects=3, reconnect_delay=0.01)
+
+    assert stats["reconnects"] == 3
+    assert stats["bytes"] == 0
+    assert stats["seconds"] < 5
+
+
+class _ErrorHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server_state.count_request()
+        self.send_error(self.server_state.status)
+
+
+class ErrorServer(FakeServer):
+    handler_class = _ErrorHandler
+
+    def __init__(self, status: int):
+        super().__init__()
+        self.status = status
+
+
+def test_a_missing_stream_is_not_retried():
+    with ErrorServer(status=404) as server, pytest.raises(requests.HTTPError):
+        capture_stream(url=f"{server.url}/stream.mp3", duration=5, on_audio=lambda audio, title: None, reconnect_delay=0.01)
+
+    assert server.requests == 1
+
+
+def test_a_relay_answering_503_is_retried():
+    with ErrorServer(status=503) as server:
+        stats = capture_stream(url=f"{server.url}/stream.mp3", duration=5, on_audio=lambda audio, title: None, max_reconnects=2, reconnect_delay=0.01)
+
+    assert stats["reconnects"] == 2
+    assert server.requests == 3
+
+
+def test_segments_keep_coming_after_a_stall(workdir):
+    with FakeStreamServer(bytes_per_second=32000, stall_after_bytes=40000) as server:
+        published = capture_segments(url=f"{server.url}/stream.mp3", duration=6, segment_seconds=2, overlap_seconds=0, stall_timeout=0.5)
+
+    assert len(published) >= 2
+    assert server.requests == 2
@@ -0,0 +1,67 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from timeline import Timeline, log_air_lag
+
+TEXT = "That was Olivia. The code word is vampire, text it in now."
+WORDS = "That was Olivia The code word is vampire text it in now".split()
+
+
+def word_response(step: float = 0.5) -> dict:
+    return {"text": TEXT, "words": [{"word": w, "start": i * step, "end": i * step + step * 0.8} for i, w in enumerate(WORDS)]}
+
+
+def test_word_timestamps_become_the_timeline_shifted_by_the_piece_offset():
+    timeline = Timeline.from_transcription(word_response(), recording_start=datetime(2026, 10, 17, 8, 0), offset_seconds=60)
+
+    assert timeline.words == WORDS
+    assert timeline.starts[0] == 60 and timeline.starts[-1] == 60 + 0.5 * (len(WORDS) - 1)
+    assert timeline.air_time(timeline.starts[4]) == datetime(2026, 10, 17, 8, 1, 2)
+
+
+def test_segment_words_are_spread_evenly_when_there_are_no_word_timestamps():
+    response = {"text": "the code word is vampire", "segments": [{"text": "the code word is", "start": 10.0, "end": 12.0},
+                                                                    {"text": "vampire", "start": 12.0, "end": 13.0}]}
+
+    timeline = Timeline.from_transcription(response)
+
+    assert timeline.words == ["the", "code", "word", "is", "vampire"]
+    assert timeline.starts == [10.0, 10.5, 11.0, 11.5, 12.0]
+    assert timeline.ends[-1] == 13.0
+    assert timeline.air_time(10.0) is None
+
+
+def test_stitching_drops_the_words_spoken_in_the_overlap_twice():
+    first = Timeline(words="a b c d e f".split(), starts=[0, 1, 2, 3, 4, 5], ends=[1, 2, 3, 4, 5, 6])
+    second = Timeline(words="d e f g h".split(), starts=[3.1, 4.1, 5.1, 6.1, 7.1], ends=[4.1, 5.1, 6.1, 7.1, 8.1])
+
+    stitched = Timeline.stitch([first, second])
+
+    assert stitched.words == "a b c d e f g h".split()
+    assert stitched.starts == [0, 1, 2, 3, 4, 5, 6.1, 7.1]
+
+
+def test_a_character_offset_maps_to_the_word_it_points_into():
+    timeline = Timeline.from_transcription(word_response())
+
+    # punctuation in the transcript does not throw the word count off, an offset inside a word finds that word
+    assert timeline.word_index(TEXT, TEXT.index("vampire")) == WORDS.index("vampire")
+    assert timeline.word_index(TEXT, TEXT.index("ampire")) == WORDS.index("vampire")
+    assert timeline.word_index(TEXT, 0) == 0
+
+
+def test_air_lag_is_measured_from_when_the_hit_aired():
+    recording_start = datetime.fromtimestamp(time.time() - 100)
+    timeline = Timeline.from_transcription(word_response(step=2.0), recording_start=recording_start)
+
+    lag = log_air_lag(timeline=timeline, text=TEXT, char_offset=TEXT.index("code word"))
+
+    # "code" is the fifth word, spoken 8 seconds into a recording that started 100 seconds ago
+    assert lag == pytest.approx(92, abs=1)
+
+
+def test_air_lag_is_unknown_without_a_recording_start_or_any_words():
+    assert log_air_lag(timeline=Timeline.from_transcription(word_response()), text=TEXT, char_offset=0) is None
+    assert log_air_lag(timeline=Timeline(words=[], starts=[], ends=[], recording_start=time.time()), text=TEXT, char_offset=0) is None
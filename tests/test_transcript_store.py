@@ -0,0 +1,31 @@
+import time
+
+from timeline import Timeline
+from transcript_store import CheckpointTracker, TranscriptStore
+
+
+def test_deleting_a_segment_deletes_its_timeline(workdir):
+    with TranscriptStore(path="transcripts.db") as store:
+        segment_id = store.append(text="the code word is vampire", start_time=time.time(), end_time=time.time() + 60)
+        store.put_timeline(segment_id, Timeline(words=["vampire"], starts=[1.0], ends=[1.5]))
+
+        with store._connection:
+            store._connection.execute("DELETE FROM segments WHERE id = ?", (segment_id,))
+
+        assert store.get_timeline(segment_id) is None
+        assert store._connection.execute("SELECT COUNT(*) FROM timelines").fetchone()[0] == 0
+
+
+
+def test_checkpoint_tracker_stops_below_pending_segments(workdir):
+    with TranscriptStore(path="transcripts.db") as store:
+        tracker = CheckpointTracker(store=store, name="detector")
+        for segment_id in (1, 2, 3):
+            tracker.register(segment_id)
+
+        tracker.done(2)
+        assert store.get_checkpoint("detector") == 0
+        tracker.done(1)
+        assert store.get_checkpoint("detector") == 2
+        tracker.done(3)
+        assert store.get_checkpoint("detector") == 3
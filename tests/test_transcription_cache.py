@@ -0,0 +1,50 @@
+import os
+
+from transcription_cache import TranscriptionCache
+
+# each entry is a little over 100 bytes on disk, so the cache below holds two of them
+ENTRY = {"text": "x" * 100}
+
+
+def age(cache: TranscriptionCache, key: str, mtime: float) -> None:
+    # file times are set explicitly, the entries are written faster than the clock resolution
+    os.utime(cache._path(key), (mtime, mtime))
+
+
+def test_going_over_capacity_evicts_the_oldest_entry(workdir):
+    cache = TranscriptionCache(directory="cache", max_bytes=250)
+    cache.put("first", ENTRY)
+    age(cache, "first", 1000)
+    cache.put("second", ENTRY)
+    age(cache, "second", 2000)
+
+    cache.put("third", ENTRY)
+
+    assert cache.get("first") is None
+    assert cache.get("second") == ENTRY
+    assert cache.get("third") == ENTRY
+    assert sum(os.path.getsize(os.path.join("cache", name)) for name in os.listdir("cache")) <= 250
+
+
+def test_a_hit_keeps_an_entry_from_being_evicted(workdir):
+    cache = TranscriptionCache(directory="cache", max_bytes=250)
+    cache.put("first", ENTRY)
+    age(cache, "first", 1000)
+    cache.put("second", ENTRY)
+    age(cache, "second", 2000)
+
+    assert cache.get("first") == ENTRY
+    cache.put("third", ENTRY)
+
+    assert cache.get("second") is None
+    assert cache.get("first") == ENTRY
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_key_depends_on_audio_model_and_parameters():
+    key = TranscriptionCache.make_key(b"audio", "whisper-large-v3", temperature=0)
+
+    assert key == TranscriptionCache.make_key(b"audio", "whisper-large-v3", temperature=0)
+    assert key != TranscriptionCache.make_key(b"other", "whisper-large-v3", temperature=0)
+    assert key != TranscriptionCache.make_key(b"audio", "whisper-large-v3-turbo", temperature=0)
+    assert key != TranscriptionCache.make_key(b"audio", "whisper-large-v3", temperature=0.2)
@@ -0,0 +1,128 @@
+import json
+import os
+
+import pytest
+
+from fake_services import FakeTranscriptionServer
+from hedging import HedgedExecutor
+from mp3_frames import make_synthetic_frames
+from transcript_store import TranscriptStore
+from transcription_cache import TranscriptionCache
+from transcriptions import store_transcription, transcribe_and_move_audio_files, transcribe_recording_timed
+
+PRIMARY = "whisper-large-v3"
+FALLBACK = "whisper-large-v3-turbo"
+
+
+@pytest.fixture
+def recording(workdir):
+    path = workdir / "20261016_120000.mp3"
+    path.write_bytes(make_synthetic_frames(seconds=4))
+    return str(path)
+
+
+@pytest.fixture
+def groq():
+    from groq import Groq
+
+    # the primary model is slow enough that a hedged request to the fallback answers first
+    with FakeTranscriptionServer(model_latency_seconds={PRIMARY: 1.5}) as server:
+        client = Groq(base_url=server.url, api_key="test", max_retries=0)
+        yield server, client
+        client.close()
+
+
+def test_transcript_is_labelled_with_the_primary_model(recording, groq):
+    server, client = groq
+
+    result = transcribe_recording_timed(client=client, full_path=recording)
+
+    assert result.model == PRIMARY
+    assert result.text and len(result.timeline)
+
+
+def test_transcript_is_labelled_with_the_fallback_that_won_the_hedge(recording, groq):
+    server, client = groq
+    executor = HedgedExecutor(name="groq", default_hedge_seconds=0.2, min_hedge_seconds=0.1)
+    store = TranscriptStore(path="transcripts.db")
+
+    text, timeline, model = transcribe_recording_timed(client=client, full_path=recording, executor=executor, fallback_model=FALLBACK)
+    segment_id = store_transcription(store=store, text=text, full_path=recording, model=model, timeline=timeline)
+    executor.close()
+
+    assert model == FALLBACK
+    assert store.get(segment_id).model == FALLBACK
+    store.close()
+
+
+def test_cached_transcript_keeps_the_model_that_produced_it(recording, groq):
+    server, client = groq
+    executor = HedgedExecutor(name="groq", default_hedge_seconds=0.2, min_hedge_seconds=0.1)
+    cache = TranscriptionCache(directory="cache")
+
+    first = transcribe_recording_timed(client=client, full_path=recording, executor=executor, fallback_model=FALLBACK, cache=cache)
+    requests = server.requests
+    second = transcribe_recording_timed(client=client, full_path=recording, cache=cache)
+    executor.close()
+
+    assert server.requests == requests
+    assert second.text == first.text
+    assert second.model == FALLBACK
+
+
+def test_batch_reads_the_directory_the_capture_writes_to(workdir):
+    from groq import Groq
+
+    os.makedirs("recordings/completed")
+    with open("recordings/completed/20261016_120000.mp3", "wb") as f:
+        f.write(make_synthetic_frames(seconds=4))
+
+    with FakeTranscriptionServer() as server, TranscriptStore(path="transcripts.db") as store:
+        client = Groq(base_url=server.url, api_key="test", max_retries=0)
+        transcribe_and_move_audio_files(client=client, store=store, completed_transcription_directory=None, cache_directory=None)
+        client.close()
+
+        assert [segment.source for segment in store.iter_since(0)] == ["20261016_120000.mp3"]
+    assert os.listdir("recordings/completed") == []
+    assert os.listdir("recordings/archive") == ["20261016_120000.mp3"]
+
+
+def test_a_failed_recording_is_left_for_the_next_run_and_the_rest_are_saved(workdir, monkeypatch):
+    from groq import Groq
+    import transcriptions
+
+    os.makedirs("recordings/completed")
+    names = ["20261016_120000.mp3", "20261016_120100.mp3", "20261016_120200.mp3"]
+    for name in names:
+        with open(os.path.join("recordings/completed", name), "wb") as f:
+            f.write(make_synthetic_frames(seconds=4))
+
+    def transcribe(full_path, **kwargs):
+        if full_path.endswith(names[0]):
+            raise ConnectionError("provider unreachable")
+        return transcribe_recording_timed(full_path=full_path, **kwargs)
+
+    monkeypatch.setattr(transcriptions, "transcribe_recording_timed", transcribe)
+    with FakeTranscriptionServer() as server, TranscriptStore(path="transcripts.db") as store:
+        client = Groq(base_url=server.url, api_key="test", max_retries=0)
+        transcribe_and_move_audio_files(client=client, store=store, completed_transcription_directory=None, cache_directory=None)
+        client.close()
+
+        assert [segment.source for segment in store.iter_since(0)] == names[1:]
+    assert os.listdir("recordings/completed") == names[:1]
+    assert sorted(os.listdir("recordings/archive")) == names[1:]
+
+
+def test_a_recording_with_songs_cut_out_gets_no_air_times(workdir, groq):
+    server, client = groq
+    os.makedirs("recordings/completed")
+    os.makedirs("recordings/metadata")
+    kept, cut = "recordings/completed/20261016_120000.mp3", "recordings/completed/20261016_120100.mp3"
+    for path, bytes_dropped in ((kept, 0), (cut, 48000)):
+        with open(path, "wb") as f:
+            f.write(make_synthetic_frames(seconds=4))
+        with open(f"recordings/metadata/{os.path.basename(path)}.icy.json", "w", encoding="utf-8") as f:
+            json.dump({"titles": [], "bytes_written": 64000, "bytes_dropped": bytes_dropped}, f)
+
+    assert transcribe_recording_timed(client=client, full_path=kept).timeline.recording_start is not None
+    assert transcribe_recording_timed(client=client, full_path=cut).timeline.recording_start is None
@@ -7,9 +7,62 @@ from dotenv import load_dotenv
 
 import requests
 
+from clients import get_http_session
+from instrumentation import span
+
 load_dotenv()
 
 
+# URL for the Textbelt API endpoint
+TEXTBELT_URL = 'https://textbelt.com/text'
+
+
+@span("sms.send")
+def send_single_sms(phone_number: str, message: str, save_request_response: bool = False, textbelt_url: str = TEXTBELT_URL) -> dict:
+    """
+    Sends an SMS message to one phone number using the Textbelt API.
+
+    Args:
+        phone_number (str): The phone number to send the SMS to.
+        message (str): The message to be sent.
+        save_request_response (bool): Whether to save the response as json.
+        textbelt_url (str): The Textbelt endpoint.
+
+    Returns:
+        dict: The JSON body of the Textbelt response.
+
+    Raises:
+        Requests.RequestException: If there is an error during the HTTP request.
+    """
+    # Get a logger instance for logging the status and errors
+    logger = logging.getLogger(__name__)
+
+    # Prepare the payload for the POST request
+    payload = {
+        'phone': phone_number,
+        'message': message,
+        # Retrieve the Textbelt API key from environment variables
+        'key': os.getenv("TEXTBELT_API_KEY")
+    }
+    # Send a POST request to the Textbelt API over the shared keep-alive session
+    response = get_http_session().post(url=textbelt_url, data=payload)
+    response.raise_for_status()
+    body = response.json()
+
+    # Log the remaining quota from the API response
+    logger.info(f"Response received, quotaRemaining: {body.get('quotaRemaining')}.")
+    if save_request_response:
+        request_dir = "requests"
+        os.makedirs(name=request_dir, exist_ok=True)
+        # microseconds keep concurrent sends from overwriting each other
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.json"
+        full_path = os.path.join(request_dir, filename)
+        with open(file=full_path, mode='w', encoding='utf-8') as f:
+            f.write(json.dumps(obj=body, indent=4))
+        logger.info("Response from request.post() has been saved.")
+    return body
+
+
 def send_sms(phone_numbers: List[str], message: str, save_request_response: bool = False) -> None:
     """
     Sends an SMS message to a list of phone numbers using the Textbelt API.
@@ -29,43 +82,16 @@ def send_sms(phone_numbers: List[str], message: str, save_request_response: bool
     # Get a logger instance for logging the status and errors
     logger = logging.getLogger(__name__)
 
-    # Retrieve the Textbelt API key from environment variables
-    key = os.getenv("TEXTBELT_API_KEY")
-
-    # URL for the Textbelt API endpoint
-    textbelt_url = 'https://textbelt.com/text'
-
-    try:
-        # Iterate through each phone number in the provided list
-        for phone_number in phone_numbers:
-            # Prepare the payload for the POST request
-            payload = {
-                'phone': phone_number,
-                'message': message,
-                'key': key
-            }
-            # Send a POST request to the Textbelt API
-            response = requests.post(url=textbelt_url, data=payload)
-
-            # Check if the response status code indicates success
-            if response.status_code == 200:
-                # Log the remaining quota from the API response
-                # print(f"response.json(): {response.json()}")
-                logger.info(f"Response received, quotaRemaining: {response.json()['quotaRemaining']}.")
-                if save_request_response:
-                    request_dir = "requests"
-                    os.makedirs(name=request_dir, exist_ok=True)
-                    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                    full_path = os.path.join(request_dir, filename)
-                    with open(file=full_path, mode='w', encoding='utf-8') as f:
-                        f.write(json.dumps(obj=response.json(), indent=4))
-                    logger.info("Response from request.post() has been saved.")
-    except requests.RequestException as e:
-        # Log an error if there's a request exception
-        logger.error(f"Request error: {type(e).__name__}, {e}")
-    except Exception as e:
-        # Log any other unexpected errors that occur
-        logger.error(f"An unexpected error occurred while sending SMS: {type(e).__name__}, {e}")
+    # Iterate through each phone number in the provided list
+    for phone_number in phone_numbers:
+        try:
+            send_single_sms(phone_number=phone_number, message=message, save_request_response=save_request_response)
+        except requests.RequestException as e:
+            # Log an error if there's a request exception
+            logger.error(f"Request error: {type(e).__name__}, {e}")
+        except Exception as e:
+            # Log any other unexpected errors that occur
+            logger.error(f"An unexpected error occurred while sending SMS: {type(e).__name__}, {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+import bisect
+import logging
+from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+
+from mp3_frames import slice_seconds
+
+
+class TimelineWindow(NamedTuple):
+    """A stretch of a recording around a transcript hit."""
+    start_seconds: float
+    end_seconds: float
+    text: str
+    air_start: Optional[datetime]
+    air_end: Optional[datetime]
+
+
+def response_field(item: Any, name: str, default: Any = None) -> Any:
+    """
+    Reads a field of a transcription response, a segment or a word, whichever form it comes in.
+
+    The SDKs return pydantic models with the verbose fields as extras, the cache holds plain dicts.
+
+    :param item: The response, segment or word.
+    :param name: The field name.
+    :param default: Returned when the field is missing.
+    :return: The field's value.
+    """
+    if isinstance(item, dict):
+        return item.get(name, default)
+    value = getattr(item, name, None)
+    if value is None:
+        value = (getattr(item, "model_extra", None) or {}).get(name, default)
+    return value
+
+
+def _normalize_word(word: str) -> str:
+    return "".join(c for c in word.lower() if c.isalnum())
+
+
+class Timeline:
+    """
+    The words of a transcript with the time each one was spoken.
+
+    Times are kept as seconds from the start of the recording in two parallel lists, next to the
+    recording's wall-clock start, so a long broadcast costs a few floats per word. A character
+    offset into the transcript text (for example a detection.TriggerHit) can be turned into a
+    time, and a window of seconds around it into air times or an audio slice.
+    """
+
+    def __init__(self, words: List[str], starts: List[float], ends: List[float], recording_start: Optional[float] = None):
+        """
+        :param words: The words, in spoken order.
+        :param starts: The start of every word, in seconds from the start of the recording.
+        :param ends: The end of every word, in seconds from the start of the recording.
+        :param recording_start: When the recording started, in epoch seconds, None when unknown.
+        """
+        if not len(words) == len(starts) == len(ends):
+            raise ValueError("Words, starts and ends must have the same length")
+        self.words = words
+        self.starts = starts
+        self.ends = ends
+        self.recording_start = recording_start
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    @classmethod
+    def from_transcription(cls, transcription: Any, recording_start: Optional[datetime] = None, offset_seconds: float = 0.0) -> "Timeline":
+        """
+        Builds a timeline from a verbose_json transcription.
+
+        Word timestamps are used when the response has them. Otherwise every segment's words are
+        spread evenly over the segment, which is coarser but still places a hit within seconds.
+
+        :param transcription: The transcription response, or its dict form.
+        :param recording_start: When the recording started.
+        :param offset_seconds: Where the transcribed audio starts within the recording, for pieces of a split recording.
+        :return: The timeline, empty when the response has no timing information.
+        """
+        words, starts, ends = [], [], []
+        for word in response_field(transcription, "words") or []:
+            text = str(response_field(word, "word", "")).strip()
+            if text:
+                words.append(text)
+                starts.append(float(response_field(word, "start", 0.0)) + offset_seconds)
+                ends.append(float(response_field(word, "end", 0.0)) + offset_seconds)
+        if not words:
+            for segment in response_field(transcription, "segments") or []:
+                segment_words = str(response_field(segment, "text", "")).split()
+                if not segment_words:
+                    continue
+                start = float(response_field(segment, "start", 0.0))
+                step = (float(response_field(segment, "end", start)) - start) / len(segment_words)
+                for i, text in enumerate(segment_words):
+                    words.append(text)
+                    starts.append(start + i * step + offset_seconds)
+                    ends.append(start + (i + 1) * step + offset_seconds)
+        return cls(words=words, starts=starts, ends=ends, recording_start=recording_start.timestamp() if recording_start else None)
+
+    @classmethod
+    def stitch(cls, timelines: Sequence["Timeline"], max_overlap_words: int = 40, min_match_words: int = 3) -> "Timeline":
+        """
+        Joins the timelines of overlapping pieces of one recording, dropping the words spoken in each overlap twice.
+
+        The pieces are aligned the same way transcriptions.stitch_transcripts aligns their text.
+
+        :param timelines: The timelines, in audio order, with times relative to the whole recording.
+        :param max_overlap_words: The number of words searched at the end and start of each pair.
+        :param min_match_words: The shortest run of words accepted as the overlap.
+        :return: The stitched timeline.
+        """
+        stitched = cls(words=[], starts=[], ends=[], recording_start=timelines[0].recording_start if timelines else None)
+        for timeline in timelines:
+            if not timeline.words:
+                continue
+            keep, skip = len(stitched.words), 0
+            if stitched.words:
+                tail_start = max(len(stitched.words) - max_overlap_words, 0)
+                tail = [_normalize_word(w) for w in stitched.words[tail_start:]]
+                head = [_normalize_word(w) for w in timeline.words[:max_overlap_words]]
+                match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+                if match.size >= min_match_words:
+                    keep, skip = tail_start + match.a + match.size, match.b + match.size
+            stitched.words = stitched.words[:keep] + timeline.words[skip:]
+            stitched.starts = stitched.starts[:keep] + timeline.starts[skip:]
+            stitched.ends = stitched.ends[:keep] + timeline.ends[skip:]
+        return stitched
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Returns the timeline in a compact JSON-friendly form, with times in whole milliseconds.
+        """
+        return {
+            "recording_start": self.recording_start,
+            "words": self.words,
+            "starts_ms": [round(s * 1000) for s in self.starts],
+            "ends_ms": [round(e * 1000) for e in self.ends],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Timeline":
+        return cls(words=list(data["words"]), starts=[s / 1000 for s in data["starts_ms"]], ends=[e / 1000 for e in data["ends_ms"]],
+                   recording_start=data.get("recording_start"))
+
+    def air_time(self, seconds: float) -> Optional[datetime]:
+        """
+        Converts a time within the recording to the wall-clock time it aired.
+
+        :param seconds: Seconds from the start of the recording.
+        :return: The air time, or None when the recording's start is unknown.
+        """
+        if self.recording_start is None:
+            return None
+        return datetime.fromtimestamp(self.recording_start + seconds)
+
+    def word_index(self, text: str, char_offset: int) -> int:
+        """
+        Finds the timeline word at a character offset into a transcript of the same audio.
+
+        The transcript and the timeline's words need not match exactly (the transcript keeps
+        punctuation, word timestamps usually do not). The offset's word number is scaled onto the
+        timeline, then moved to the nearest word that reads the same.
+
+        :param text: The transcript the offset points into.
+        :param char_offset: The character offset, for example TriggerHit.start.
+        :return: The index of the word in the timeline.
+        """
+        if not self.words:
+            raise ValueError("The timeline is empty")
+        text_words = text.split()
+        word_number = len(text[:char_offset].split())
+        if 0 < char_offset < len(text) and not text[char_offset].isspace() and not text[char_offset - 1].isspace():
+            # the offset is inside a word, which split counted already
+            word_number -= 1
+        estimate = min(round(word_number * len(self.words) / max(len(text_words), 1)), len(self.words) - 1)
+        if word_number >= len(text_words):
+            return estimate
+        target = _normalize_word(text_words[word_number])
+        for distance in range(0, 16):
+            for index in (estimate - distance, estimate + distance):
+                if 0 <= index < len(self.words) and _normalize_word(self.words[index]) == target:
+                    return index
+        return estimate
+
+    def window(self, text: str, start_char: int, end_char: int, before_seconds: float = 10.0, after_seconds: float = 20.0) -> TimelineWindow:
+        """
+        Returns the stretch of the recording around a hit in a transcript of it.
+
+        :param text: The transcript the hit was found in.
+        :param start_char: The start offset of the hit.
+        :param end_char: The end offset of the hit.
+        :param before_seconds: The seconds kept before the hit.
+        :param after_seconds: The seconds kept after the hit, where the word itself is usually said.
+        :return: The window's times within the recording, its words and its air times.
+        """
+        first = self.word_index(text, start_char)
+        last = max(self.word_index(text, max(end_char - 1, start_char)), first)
+        start_seconds = max(self.starts[first] - before_seconds, 0.0)
+        end_seconds = self.ends[last] + after_seconds
+        lo = bisect.bisect_left(self.ends, start_seconds)
+        hi = bisect.bisect_right(self.starts, end_seconds)
+        return TimelineWindow(start_seconds=start_seconds, end_seconds=end_seconds, text=" ".join(self.words[lo:hi]),
+                              air_start=self.air_time(start_seconds), air_end=self.air_time(end_seconds))
+
+    def slice_audio(self, audio: bytes, window: TimelineWindow) -> bytes:
+        """
+        Cuts a window out of the recording's audio at MP3 frame boundaries, for example to re-transcribe just the announcement.
+
+        :param audio: The whole recording.
+        :param window: A window returned by window.
+        :return: The frames of the window.
+        """
+        return slice_seconds(audio, window.start_seconds, window.end_seconds)
+
+
+def log_air_lag(timeline: Timeline, text: str, char_offset: int) -> Optional[float]:
+    """
+    Logs when a hit in a transcript aired and how far behind live it was detected.
+
+    :param timeline: The timeline of the recording the transcript came from.
+    :param text: The transcript.
+    :param char_offset: The offset of the hit in the transcript.
+    :return: The seconds between the hit airing and now, None when the air time is unknown.
+    """
+    logger = logging.getLogger(__name__)
+
+    if not timeline.words:
+        return None
+    air_time = timeline.air_time(timeline.starts[timeline.word_index(text, char_offset)])
+    if air_time is None:
+        return None
+    lag = (datetime.now() - air_time).total_seconds()
+    logger.info(f"Announcement aired at {air_time:%H:%M:%S}, detected {lag:.1f} seconds behind live.")
+    return lag
+
+
+if __name__ == "__main__":
+    response = {
+        "text": "That was Olivia. The code word is vampire, text it in now.",
+        "words": [{"word": w, "start": i * 0.4, "end": i * 0.4 + 0.35} for i, w in
+                  enumerate("That was Olivia The code word is vampire text it in now".split())],
+    }
+    timeline = Timeline.from_transcription(response, recording_start=datetime(2024, 5, 1, 8, 0, 0))
+    hit_start = response["text"].index("code word")
+    print(timeline.window(response["text"], hit_start, hit_start + len("code word"), before_seconds=1, after_seconds=1))
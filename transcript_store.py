@@ -0,0 +1,424 @@
+import json
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+from timeline import Timeline
+
+_RECORDING_TIME = re.compile(r"(\d{8}_\d{6})")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    station TEXT NOT NULL,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    model TEXT,
+    source TEXT,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS segments_station_start ON segments (station, start_time);
+CREATE INDEX IF NOT EXISTS segments_source ON segments (source);
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(text, content='segments', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS segments_fts_insert AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS segments_fts_delete AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TABLE IF NOT EXISTS timelines (
+    segment_id INTEGER PRIMARY KEY REFERENCES segments (id) ON DELETE CASCADE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    name TEXT PRIMARY KEY,
+    segment_id INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = "id, station, start_time, end_time, model, source, text"
+
+Timestamp = Union[datetime, float]
+
+
+class Segment(NamedTuple):
+    """A transcribed piece of a station's broadcast."""
+    id: int
+    station: str
+    start_time: datetime
+    end_time: datetime
+    model: Optional[str]
+    source: Optional[str]
+    text: str
+
+
+def parse_recording_time(path: str) -> Optional[datetime]:
+    """
+    Reads the start time of a recording from its file name.
+
+    Parameters:
+    - path (str): A recording or transcription path named after the recording's '%Y%m%d_%H%M%S' start time.
+
+    Returns:
+    Optional[datetime]: The start time, or None when the name holds no timestamp.
+    """
+    match = _RECORDING_TIME.search(os.path.basename(path))
+    if match is None:
+        return None
+    try:
+        return datetime.strptime(match.group(1), "%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def _to_epoch(value: Timestamp) -> float:
+    return value.timestamp() if isinstance(value, datetime) else float(value)
+
+
+def _to_segment(row: tuple) -> Segment:
+    return Segment(id=row[0], station=row[1], start_time=datetime.fromtimestamp(row[2]), end_time=datetime.fromtimestamp(row[3]),
+                   model=row[4], source=row[5], text=row[6])
+
+
+class TranscriptStore:
+    """
+    A local SQLite store of transcript segments with a full-text index.
+
+    Every segment records its station, the wall-clock time span it covers, the transcription model
+    and the recording it came from, and optionally the timeline of its words. Segments are appended as they are transcribed and can be read
+    back by time range, by full-text query, or incrementally: ``iter_since`` streams every segment
+    added after a given id, and named checkpoints let a consumer such as the detector remember how
+    far it has read across runs.
+    """
+
+    def __init__(self, path: str = "transcriptions/transcripts.db"):
+        """
+        Parameters:
+        - path (str): The database file, created along with its directory when missing.
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # SQLite leaves foreign keys off per connection, the timelines rely on them to go with their segment
+        self._connection.execute("PRAGMA foreign_keys = ON")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def append(self, text: str, start_time: Timestamp, end_time: Timestamp, station: str = "KQMV", model: Optional[str] = None, source: Optional[str] = None) -> int:
+        """
+        Adds a transcribed segment.
+
+        Parameters:
+        - text (str): The transcript.
+        - start_time (datetime | float): When the segment started airing, as a datetime or epoch seconds.
+        - end_time (datetime | float): When it stopped airing.
+        - station (str): The station name.
+        - model (str): The transcription model.
+        - source (str): The recording the segment was transcribed from.
+
+        Returns:
+        int: The id of the new segment.
+        """
+        logger = logging.getLogger(__name__)
+
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO segments (station, start_time, end_time, model, source, text, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (station, _to_epoch(start_time), _to_epoch(end_time), model, source, text or "", datetime.now().timestamp())
+            )
+        logger.info(f"Stored transcript segment {cursor.lastrowid} of {station} ({len(text or '')} characters).")
+        return cursor.lastrowid
+
+    def put_timeline(self, segment_id: int, timeline: Timeline) -> None:
+        """
+        Stores the word timings of a segment.
+
+        Parameters:
+        - segment_id (int): The id returned by append.
+        - timeline (Timeline): The segment's timeline.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO timelines (segment_id, data) VALUES (?, ?)",
+                                     (segment_id, json.dumps(timeline.to_dict(), separators=(",", ":"))))
+
+    def get_timeline(self, segment_id: int) -> Optional[Timeline]:
+        """
+        Returns the word timings of a segment.
+
+        Parameters:
+        - segment_id (int): The segment's id.
+
+        Returns:
+        Optional[Timeline]: The timeline, or None when none was stored.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM timelines WHERE segment_id = ?", (segment_id,)).fetchone()
+        return Timeline.from_dict(json.loads(row[0])) if row else None
+
+    def _query(self, sql: str, params: tuple) -> List[Segment]:
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [_to_segment(row) for row in rows]
+
+    def get(self, segment_id: int) -> Optional[Segment]:
+        """
+        Returns a segment by its id.
+
+        Parameters:
+        - segment_id (int): The segment's id.
+
+        Returns:
+        Optional[Segment]: The segment, or None when there is no such segment.
+        """
+        segments = self._query(f"SELECT {_COLUMNS} FROM segments WHERE id = ?", (segment_id,))
+        return segments[0] if segments else None
+
+    def find_source(self, source: str, station: Optional[str] = None) -> Optional[Segment]:
+        """
+        Returns the latest segment transcribed from a recording, to tell whether it was transcribed already.
+
+        Parameters:
+        - source (str): The recording's file name.
+        - station (str): Only return segments of this station.
+
+        Returns:
+        Optional[Segment]: The segment, or None when the recording was not stored.
+        """
+        sql = f"SELECT {_COLUMNS} FROM segments WHERE source = ?"
+        params = (source,)
+        if station is not None:
+            sql += " AND station = ?"
+            params += (station,)
+        segments = self._query(sql + " ORDER BY id DESC LIMIT 1", params)
+        return segments[0] if segments else None
+
+    def between(self, start_time: Timestamp, end_time: Timestamp, station: Optional[str] = None) -> List[Segment]:
+        """
+        Returns the segments that overlap a time range, in air order.
+
+        Parameters:
+        - start_time (datetime | float): The start of the range.
+        - end_time (datetime | float): The end of the range.
+        - station (str): Only return segments of this station.
+
+        Returns:
+        List[Segment]: The segments.
+        """
+        sql = f"SELECT {_COLUMNS} FROM segments WHERE end_time > ? AND start_time < ?"
+        params = (_to_epoch(start_time), _to_epoch(end_time))
+        if station is not None:
+            sql += " AND station = ?"
+            params += (station,)
+        return self._query(sql + " ORDER BY start_time, id", params)
+
+    def search(self, query: str, station: Optional[str] = None, start_time: Optional[Timestamp] = None, end_time: Optional[Timestamp] = None, limit: int = 50) -> List[Segment]:
+        """
+        Finds segments matching a full-text query, best matches first.
+
+        Parameters:
+        - query (str): An FTS5 query, for example '"code word"' or 'vampire OR drivers'.
+        - station (str): Only return segments of this station.
+        - start_time (datetime | float): Only return segments ending after this time.
+        - end_time (datetime | float): Only return segments starting before this time.
+        - limit (int): The maximum number of segments returned.
+
+        Returns:
+        List[Segment]: The matching segments.
+        """
+        columns = ", ".join(f"s.{column.strip()}" for column in _COLUMNS.split(","))
+        sql = f"SELECT {columns} FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid WHERE segments_fts MATCH ?"
+        params = (query,)
+        if station is not None:
+            sql += " AND s.station = ?"
+            params += (station,)
+        if start_time is not None:
+            sql += " AND s.end_time > ?"
+            params += (_to_epoch(start_time),)
+        if end_time is not None:
+            sql += " AND s.start_time < ?"
+            params += (_to_epoch(end_time),)
+        return self._query(sql + " ORDER BY rank LIMIT ?", params + (limit,))
+
+    def iter_since(self, last_id: int = 0, station: Optional[str] = None, batch_size: int = 100) -> Iterator[Segment]:
+        """
+        Streams the segments added after a given id, in the order they were added.
+
+        Segments are fetched batch_size at a time, so a large backlog is never loaded at once.
+
+        Parameters:
+        - last_id (int): The id of the last segment already seen, 0 for all segments.
+        - station (str): Only return segments of this station.
+        - batch_size (int): The number of segments fetched per query.
+
+        Yields:
+        Segment: The new segments.
+        """
+        while True:
+            sql = f"SELECT {_COLUMNS} FROM segments WHERE id > ?"
+            params = (last_id,)
+            if station is not None:
+                sql += " AND station = ?"
+                params += (station,)
+            batch = self._query(sql + " ORDER BY id LIMIT ?", params + (batch_size,))
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+
+    def get_checkpoint(self, name: str) -> int:
+        """
+        Returns the id of the last segment a consumer has processed.
+
+        Parameters:
+        - name (str): The consumer's name.
+
+        Returns:
+        int: The segment id, 0 when the consumer has not processed anything yet.
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT segment_id FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def set_checkpoint(self, name: str, segment_id: int) -> None:
+        """
+        Records the id of the last segment a consumer has processed. The checkpoint never moves back,
+        so segments finished out of order by concurrent workers cannot rewind it.
+
+        Parameters:
+        - name (str): The consumer's name.
+        - segment_id (int): The id of the last processed segment.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("INSERT INTO checkpoints (name, segment_id) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET segment_id = MAX(segment_id, excluded.segment_id)",
+                                     (name, segment_id))
+
+    def read_new(self, consumer: str, station: Optional[str] = None) -> List[Segment]:
+        """
+        Returns the segments a consumer has not seen yet and moves its checkpoint past them.
+
+        Parameters:
+        - consumer (str): The consumer's name, for example "detector".
+        - station (str): Only return segments of this station.
+
+        Returns:
+        List[Segment]: The new segments, in the order they were added.
+        """
+        segments = list(self.iter_since(last_id=self.get_checkpoint(consumer), station=station))
+        if segments:
+            self.set_checkpoint(consumer, segments[-1].id)
+        return segments
+
+    def import_directory(self, directory: str = "transcriptions/completed", station: str = "KQMV", archive_directory: Optional[str] = "transcriptions/archive") -> int:
+        """
+        Moves the transcription text files of a directory into the store.
+
+        The start time is read from each file name; as the audio is gone, the end time is estimated
+        from the transcript's length at 2.5 words per second. Imported files are moved to
+        archive_directory, or left in place when it is None.
+
+        Parameters:
+        - directory (str): The directory holding the transcription_<timestamp>.txt files.
+        - station (str): The station the transcripts belong to.
+        - archive_directory (str): Where imported files are moved.
+
+        Returns:
+        int: The number of files imported.
+        """
+        logger = logging.getLogger(__name__)
+
+        if not os.path.isdir(directory):
+            return 0
+        if archive_directory:
+            os.makedirs(archive_directory, exist_ok=True)
+        imported = 0
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith(".txt"):
+                continue
+            file_path = os.path.join(directory, file_name)
+            start_time = parse_recording_time(file_name) or datetime.fromtimestamp(os.path.getmtime(file_path))
+            with open(file=file_path, mode="r", encoding="utf-8") as f:
+                text = f.read()
+            end_time = start_time + timedelta(seconds=len(text.split()) / 2.5)
+            self.append(text=text, start_time=start_time, end_time=end_time, station=station, source=file_name)
+            if archive_directory:
+                shutil.move(file_path, archive_directory)
+            imported += 1
+        logger.info(f"Imported {imported} transcription file(s) from {directory}.")
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self) -> "TranscriptStore":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CheckpointTracker:
+    """
+    Moves a consumer's checkpoint over segments that are processed out of order.
+
+    Segments are registered as they are stored and marked done once processed. The checkpoint
+    only moves up to the highest done id below every segment still registered, so a segment that
+    is still in flight, or whose processing failed, is never skipped by a consumer resuming from it.
+    Hold lock while storing a segment and registering it, so no later segment can move the
+    checkpoint past it in between.
+    """
+
+    def __init__(self, store: TranscriptStore, name: str):
+        """
+        Parameters:
+        - store (TranscriptStore): The store holding the checkpoint.
+        - name (str): The consumer's name, for example "detector".
+        """
+        self.store = store
+        self.name = name
+        self.lock = threading.RLock()
+        self._pending = set()
+        self._done = set()
+
+    def register(self, segment_id: int) -> None:
+        """
+        Holds the checkpoint below a segment until it is done.
+
+        Parameters:
+        - segment_id (int): The id of the stored segment.
+        """
+        with self.lock:
+            self._pending.add(segment_id)
+
+    def done(self, segment_id: int) -> None:
+        """
+        Marks a segment as processed and moves the checkpoint as far as the segments still pending allow.
+
+        Parameters:
+        - segment_id (int): The id of the processed segment.
+        """
+        with self.lock:
+            self._pending.discard(segment_id)
+            self._done.add(segment_id)
+            limit = min(self._pending) if self._pending else None
+            covered = {i for i in self._done if limit is None or i < limit}
+            if covered:
+                self.store.set_checkpoint(self.name, max(covered))
+                self._done.difference_update(covered)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    with TranscriptStore(path="transcriptions/transcripts.db") as store:
+        store.import_directory()
+        for segment in store.search('"code word"'):
+            print(f"{segment.start_time:%Y-%m-%d %H:%M:%S} {segment.station}: {segment.text[:120]}")
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+
+class TranscriptionCache:
+    """
+    A persistent, size-bounded cache of transcription results stored on local disk.
+
+    Entries are keyed by a hash of the audio bytes together with the model and request
+    parameters, so a recording that is transcribed twice (after a crash, or because it was
+    re-queued) costs one request. When the cache grows past ``max_bytes`` the least recently
+    used entries are evicted; a hit refreshes an entry's modification time.
+    """
+
+    def __init__(self, directory: str = "cache/transcriptions", max_bytes: int = 50 * 1024 * 1024):
+        """
+        Parameters:
+        - directory (str): The directory the cache entries are stored in.
+        - max_bytes (int): The maximum total size of the cache entries.
+        """
+        if not isinstance(max_bytes, int) or max_bytes <= 0:
+            raise ValueError("Max bytes must be a positive integer")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(audio: bytes, model: str, **params: Any) -> str:
+        """
+        Builds the cache key for a transcription request.
+
+        Parameters:
+        - audio (bytes): The audio that is transcribed.
+        - model (str): The transcription model.
+        - params: Any other request parameters that change the result.
+
+        Returns:
+        str: The hex digest identifying the request.
+        """
+        digest = hashlib.sha256(audio)
+        digest.update(json.dumps({"model": model, **params}, sort_keys=True, default=str).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Looks up a cached result.
+
+        Parameters:
+        - key (str): The key built by make_key.
+
+        Returns:
+        Optional[Dict[str, Any]]: The cached result, or None on a miss.
+        """
+        logger = logging.getLogger(__name__)
+
+        path = self._path(key)
+        try:
+            with open(file=path, mode="r", encoding="utf-8") as f:
+                value = json.load(f)
+            # mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Unreadable transcription cache entry {path}: {type(e).__name__}, {e}")
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Stores a result, then evicts the least recently used entries if the cache is over its size limit.
+
+        Parameters:
+        - key (str): The key built by make_key.
+        - value (Dict[str, Any]): The JSON serializable result to store.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(file=tmp_path, mode="w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits within max_bytes."""
+        logger = logging.getLogger(__name__)
+
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.info(f"Evicted {os.path.normpath(path)} from transcription cache.")
+                except FileNotFoundError:
+                    pass
+
+    def log_stats(self) -> None:
+        """Logs the hit and miss counters."""
+        logger = logging.getLogger(__name__)
+        logger.info(f"Transcription cache: {self.hits} hit(s), {self.misses} miss(es).")
@@ -2,14 +2,39 @@ import logging
 import os
 import shutil
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from difflib import SequenceMatcher
+from typing import Any, List, NamedTuple, Optional, Tuple
 
-from groq import Groq
 from dotenv import load_dotenv
 
+from clients import get_groq_client
+from hedging import HedgedExecutor
+from instrumentation import increment, span
+from mp3_frames import Mp3Chunk, audio_duration, slice_seconds, split_frames
+from quality import QualityScorer, as_transcript, merge_spans, splice_transcript
+from rate_limit import ProviderRateLimiter, is_rate_limit_error, get_retry_after
+from stream_capture import read_recording_index
+from timeline import Timeline
+from transcript_store import TranscriptStore, parse_recording_time
+from transcription_cache import TranscriptionCache
+
+try:
+    from audio_preprocess import TrimResult, trim_non_speech as trim_audio
+except ImportError:  # numpy is only needed to trim silence and music before upload
+    TrimResult, trim_audio = None, None
+
 load_dotenv()
 
 
+class TimedTranscription(NamedTuple):
+    """The transcription of a recording, the timeline of its words and the model(s) that produced it."""
+    text: str
+    timeline: Timeline
+    model: str
+
+
 def transcribe_audio_file(model, file_path: str) -> str:
     """
     Transcribes an audio file to text using the specified Whisper model.
@@ -86,71 +111,542 @@ def transcribe_audio_file(model, file_path: str) -> str:
 #     except Exception as e:
 #         logger.error(f"An unexpected error occurred while transcribing and moving file(s): {type(e).__name__}, {e}")
 
+def estimate_audio_seconds(num_bytes: int, bitrate_kbps: int = 128) -> float:
+    """
+    Estimates the duration of a constant bitrate MP3 from its size.
+
+    Parameters:
+    - num_bytes (int): The size of the audio in bytes.
+    - bitrate_kbps (int): The bitrate of the stream in kilobits per second.
+
+    Returns:
+    - float: The estimated duration in seconds.
+    """
+    return num_bytes * 8 / (bitrate_kbps * 1000)
+
+
+def request_transcription(client, full_path: str, audio: bytes, rate_limiter: Optional[ProviderRateLimiter] = None, max_rate_limit_retries: int = 5,
+                          prepaid: bool = False, **params):
+    """
+    Sends one transcription request, waiting for the rate limiter and retrying when the provider answers with a 429.
+
+    Parameters:
+    - client: The Groq client used for the transcription request.
+    - full_path (str): The path of the audio file, sent as its name.
+    - audio (bytes): The audio to transcribe.
+    - rate_limiter (ProviderRateLimiter): Optional limiter shared by every worker sending requests.
+    - max_rate_limit_retries (int): The number of times a rate limited request is resent.
+    - prepaid (bool): Whether the caller already waited for the limiter before the first request,
+      as a HedgedExecutor does so the wait is not timed as part of the request.
+    - params: The remaining arguments of the transcription request.
+
+    Returns:
+    - The transcription returned by the client.
+    """
+    audio_seconds = estimate_audio_seconds(len(audio))
+    for attempt in range(max_rate_limit_retries + 1):
+        if rate_limiter is not None and not (prepaid and attempt == 0):
+            rate_limiter.acquire(audio_seconds=audio_seconds)
+        try:
+            with span("transcription.request"):
+                return client.audio.transcriptions.create(file=(full_path, audio), **params)
+        except Exception as e:
+            if rate_limiter is None or not is_rate_limit_error(e) or attempt == max_rate_limit_retries:
+                raise
+            rate_limiter.back_off(retry_after=get_retry_after(e))
+
+
+def transcribe_audio(
+        client,
+        full_path: str,
+        audio: bytes,
+        model: str = "whisper-large-v3",
+        max_retries: int = 3,
+        scorer: Optional[QualityScorer] = None,
+        rate_limiter: Optional[ProviderRateLimiter] = None,
+        executor: Optional[HedgedExecutor] = None,
+        fallback_model: Optional[str] = None,
+        retry_padding_seconds: float = 1.0,
+        models_used: Optional[List[str]] = None
+) -> Any:
+    """
+    Transcribes a buffer of audio, retrying only the parts whose transcription looks wrong.
+
+    The transcription is requested as verbose_json with segment and word timestamps, so the
+    returned response carries the timing of every word next to its text. The scorer judges it;
+    a good transcription is accepted on the first pass. Otherwise the text made up over music or
+    silence is dropped, and only the spans the scorer flagged are cut out of the audio (at MP3
+    frame boundaries), transcribed again and spliced back in, for up to max_retries passes in all.
+
+    With an executor, every request has a deadline and is hedged when it runs long: the second
+    attempt goes to fallback_model when given, and is a duplicate request otherwise.
+
+    Parameters:
+    - client: The Groq client used for the transcription requests.
+    - full_path (str): The path of the audio file the buffer was read from, used as its name.
+    - audio (bytes): The audio to transcribe.
+    - model (str): The transcription model.
+    - max_retries (int): The maximum number of transcription passes.
+    - scorer (QualityScorer): Judges each pass, defaults to a QualityScorer with its default thresholds.
+    - rate_limiter (ProviderRateLimiter): Optional limiter shared by every worker sending requests.
+    - executor (HedgedExecutor): Optional executor adding deadlines, hedging and circuit breaking to the requests.
+    - fallback_model (str): The model the hedged or fallback request is sent to, None to repeat the request with model.
+    - retry_padding_seconds (float): The audio added around each retried span, so words on its edges are heard whole.
+    - models_used (List[str]): Optional list the model of every response that went into the transcription is appended to.
+      When the fallback wins a hedged request, that is the fallback model.
+
+    Returns:
+    - The transcription response, or a quality.Transcript when parts of it were replaced.
+    """
+    # Set up logging
+    logger = logging.getLogger(__name__)
+
+    scorer = scorer or QualityScorer()
+
+    def send(request_model: str, request_path: str, request_audio: bytes, temperature: float, prepaid: bool = False):
+        return request_transcription(
+            client=client,
+            full_path=request_path,
+            audio=request_audio,
+            rate_limiter=rate_limiter,
+            prepaid=prepaid,
+            model=request_model,
+            prompt="",
+            response_format="verbose_json",
+            timestamp_granularities=["word", "segment"],
+            temperature=temperature
+        )
+
+    def transcribe(request_path: str, request_audio: bytes, temperature: float):
+        if executor is None:
+            used_model, result = model, send(model, request_path, request_audio, temperature)
+        else:
+            # the executor waits for the limiter before each attempt and only times the request itself,
+            # so a wait for a token neither fires a hedge nor counts against the deadline
+            acquire = (lambda: rate_limiter.acquire(audio_seconds=estimate_audio_seconds(len(request_audio)))) if rate_limiter is not None else None
+            prepaid = acquire is not None
+            # each attempt names its model, as either may be the one that answers first
+            fallback = (lambda: (fallback_model, send(fallback_model, request_path, request_audio, temperature, prepaid))) if fallback_model else None
+            used_model, result = executor.call(primary=lambda: (model, send(model, request_path, request_audio, temperature, prepaid)), fallback=fallback, acquire=acquire)
+        if models_used is not None:
+            models_used.append(used_model)
+        return result
+
+    abbrevFileName = os.path.basename(full_path)
+    audio_seconds = audio_duration(audio) or estimate_audio_seconds(len(audio))
+
+    start_time = time.time()
+    transcription = transcribe(full_path, audio, 0)
+    logger.info(f"Attempt #1, Transcription of {abbrevFileName} completed in {time.time() - start_time: .2f} seconds.")
+    report = scorer.score(transcription, audio_seconds)
+    if report.accept:
+        logger.info(f"Transcription of {abbrevFileName} accepted on the first pass, no retries needed.")
+        return transcription
+
+    retried_seconds = 0.0
+    for i in range(2, max_retries + 2):
+        if report.accept:
+            break
+        logger.info(f"Transcription of {abbrevFileName} looks wrong: {'; '.join(report.reasons)}.")
+        if report.drop_spans:
+            # text over non-speech comes back the same when retried, so it is dropped for free
+            transcription = splice_transcript(as_transcript(transcription), drop_spans=report.drop_spans)
+            report = scorer.score(transcription, audio_seconds)
+        if report.accept or not report.retry_spans or i > max_retries:
+            break
+        # a retry at temperature 0 decodes the same way, a little randomness breaks repetition loops
+        start_time = time.time()
+        replacements = []
+        for start, end in merge_spans(report.retry_spans, padding_seconds=retry_padding_seconds, limit_seconds=audio_seconds):
+            span_audio = slice_seconds(audio, start, end)
+            if not span_audio:
+                continue
+            span_path = f"{os.path.splitext(full_path)[0]}_{start:.0f}s-{end:.0f}s.mp3"
+            replacements.append(((start, end), transcribe(span_path, span_audio, 0.2)))
+            retried_seconds += end - start
+        transcription = splice_transcript(as_transcript(transcription), replacements=replacements)
+        logger.info(f"Attempt #{i}, retried {len(replacements)} span(s) of {abbrevFileName} in {time.time() - start_time: .2f} seconds.")
+        report = scorer.score(transcription, audio_seconds)
+
+    full_retry_seconds = audio_seconds * (max_retries - 1)
+    if report.accept:
+        logger.info(f"Transcription of {abbrevFileName} accepted after retrying {retried_seconds:.1f} of {audio_seconds:.1f} seconds of audio "
+                    f"(blind retries would have resent up to {full_retry_seconds:.1f} seconds).")
+    else:
+        logger.info(f"Transcription of {abbrevFileName} still looks wrong ({'; '.join(report.reasons)}) and will be used, "
+                    f"{retried_seconds:.1f} seconds of audio were retried.")
+    return transcription
+
+
+def transcribe_recording(client, full_path: str, **kwargs: Any) -> str:
+    """
+    Transcribes a single recording, see transcribe_recording_timed.
+
+    Parameters:
+    - client: The Groq client used for the transcription requests.
+    - full_path (str): The path to the audio file to be transcribed.
+    - kwargs: The remaining arguments of transcribe_recording_timed.
+
+    Returns:
+    - str: The transcribed text from the audio file.
+    """
+    return transcribe_recording_timed(client=client, full_path=full_path, **kwargs)[0]
+
+
+@span("transcription.recording")
+def transcribe_recording_timed(
+        client,
+        full_path: str,
+        max_retries: int = 3,
+        scorer: Optional[QualityScorer] = None,
+        cache: Optional[TranscriptionCache] = None,
+        rate_limiter: Optional[ProviderRateLimiter] = None,
+        split_seconds: Optional[int] = None,
+        overlap_seconds: int = 5,
+        max_upload_bytes: int = 25 * 1024 * 1024,
+        max_split_workers: int = 4,
+        executor: Optional[HedgedExecutor] = None,
+        fallback_model: Optional[str] = None,
+        trim_non_speech: bool = False
+) -> TimedTranscription:
+    """
+    Transcribes a single recording with the Groq whisper model, retrying the parts that look wrong.
+
+    Recordings longer than split_seconds, or larger than the provider's upload limit, are cut into
+    overlapping pieces at MP3 frame boundaries. The pieces are transcribed concurrently and their
+    transcripts stitched back together.
+
+    The word timestamps of the transcription are kept as a Timeline, anchored to the wall-clock
+    start time in the recording's file name. When skip_songs cut song audio out of the recording
+    (its stream title index says so), the times within the file no longer match the clock and the
+    timeline is left unanchored, so no air time is reported for it.
+
+    With trim_non_speech, long stretches of silence and music are cut out locally before upload
+    (see audio_preprocess), and the timeline is mapped back to the untrimmed recording.
+
+    Parameters:
+    - client: The Groq client used for the transcription requests.
+    - full_path (str): The path to the audio file to be transcribed.
+    - max_retries (int): The maximum number of transcription passes.
+    - scorer (QualityScorer): Judges each transcription pass, defaults to a QualityScorer with its default thresholds.
+    - cache (TranscriptionCache): Optional cache consulted before, and filled after, the transcription requests.
+    - rate_limiter (ProviderRateLimiter): Optional limiter shared by every worker sending requests.
+    - split_seconds (int): The length of the pieces long recordings are cut into, or None to only split oversized uploads.
+    - overlap_seconds (int): The audio shared by consecutive pieces in seconds.
+    - max_upload_bytes (int): The largest file the provider accepts.
+    - max_split_workers (int): The number of pieces transcribed concurrently.
+    - executor (HedgedExecutor): Optional executor adding deadlines, hedging and circuit breaking to the requests.
+    - fallback_model (str): The model hedged or fallback requests are sent to, None to repeat the request.
+    - trim_non_speech (bool): Whether silence and music are cut out before upload. Skipped with a warning when numpy or ffmpeg is missing.
+
+    Returns:
+    - TimedTranscription: The transcribed text from the audio file, the timeline of its words, and the model that produced it
+      (models joined by "+" when the fallback model transcribed part of it).
+    """
+    # Set up logging
+    logger = logging.getLogger(__name__)
+
+    abbrevFileName = os.path.basename(full_path)
+    model = "whisper-large-v3"
+    recording_start = parse_recording_time(full_path)
+    index = read_recording_index(full_path)
+    if recording_start is not None and index is not None and index.get("bytes_dropped"):
+        logger.info(f"Song audio was cut out of {abbrevFileName}, its air times are unknown.")
+        recording_start = None
+    with open(file=full_path, mode='rb') as file:
+        audio = file.read()
+
+    # identical audio transcribed with identical parameters gives the cached result
+    cache_key = None
+    if cache is not None:
+        cache_key = TranscriptionCache.make_key(audio, model=model, prompt="", response_format="verbose_json", timestamp_granularities="word,segment",
+                                                temperature=0, split_seconds=split_seconds, trim_non_speech=trim_non_speech)
+        cached = cache.get(cache_key)
+        if cached is not None and "timeline" in cached:
+            logger.info(f"Transcription of {abbrevFileName} found in cache.")
+            timeline = Timeline.from_dict(cached["timeline"])
+            # the cached timeline is anchored to the recording it was made for
+            timeline.recording_start = recording_start.timestamp() if recording_start else None
+            return TimedTranscription(text=cached["text"], timeline=timeline, model=cached.get("model", model))
+
+    trim = trim_recording(audio, abbrevFileName) if trim_non_speech else None
+    if trim is not None:
+        if not trim.kept_spans:
+            logger.info(f"{abbrevFileName} holds no speech, nothing to transcribe.")
+            return TimedTranscription(text="", timeline=Timeline(words=[], starts=[], ends=[], recording_start=recording_start.timestamp() if recording_start else None),
+                                      model=model)
+        audio = trim.audio
+
+    models_used = []
+
+    pieces = []
+    if split_seconds or len(audio) > max_upload_bytes:
+        duration = audio_duration(audio)
+        piece_seconds = split_seconds or duration
+        if len(audio) > max_upload_bytes and duration:
+            # size the pieces so each one fits within the upload limit
+            piece_seconds = min(piece_seconds, duration * max_upload_bytes / len(audio) * 0.9)
+        if duration > piece_seconds > overlap_seconds:
+            pieces = split_frames(audio, chunk_seconds=piece_seconds, overlap_seconds=overlap_seconds)
+
+    if len(pieces) > 1:
+        def transcribe_piece(piece: Mp3Chunk) -> Tuple[str, Timeline]:
+            piece_path = f"{os.path.splitext(full_path)[0]}_{piece.start_seconds:.0f}s.mp3"
+            transcription = transcribe_audio(client=client, full_path=piece_path, audio=piece.data, model=model, max_retries=max_retries, scorer=scorer,
+                                             rate_limiter=rate_limiter, executor=executor, fallback_model=fallback_model, models_used=models_used)
+            return transcription.text, Timeline.from_transcription(transcription, recording_start=recording_start, offset_seconds=piece.start_seconds)
+
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=max_split_workers) as pool:
+            results = list(pool.map(transcribe_piece, pieces))
+        text = stitch_transcripts([piece_text for piece_text, _ in results])
+        timeline = Timeline.stitch([piece_timeline for _, piece_timeline in results])
+        logger.info(f"Transcription of {abbrevFileName} in {len(pieces)} pieces completed in {time.time() - start_time: .2f} seconds.")
+    else:
+        transcription = transcribe_audio(client=client, full_path=full_path, audio=audio, model=model, max_retries=max_retries, scorer=scorer,
+                                         rate_limiter=rate_limiter, executor=executor, fallback_model=fallback_model, models_used=models_used)
+        text = transcription.text
+        timeline = Timeline.from_transcription(transcription, recording_start=recording_start)
+
+    if trim is not None and trim.removed_fraction > 0:
+        # word times are within the trimmed audio, move them back to where they aired
+        timeline.ends = [trim.to_original(max(end - 0.001, start)) for start, end in zip(timeline.starts, timeline.ends)]
+        timeline.starts = [trim.to_original(start) for start in timeline.starts]
+
+    # the requested model first, then any fallback that stood in for it
+    used_model = "+".join(sorted(set(models_used), key=lambda name: (name != model, name))) or model
+    if used_model != model:
+        logger.info(f"Transcription of {abbrevFileName} was produced by {used_model}.")
+    if cache is not None:
+        cache.put(cache_key, {"text": text, "model": used_model, "timeline": timeline.to_dict()})
+    return TimedTranscription(text=text, timeline=timeline, model=used_model)
+
+
+def trim_recording(audio: bytes, abbrevFileName: str) -> Optional["TrimResult"]:
+    """
+    Cuts the silence and music out of a recording before upload, when the tools for it are available.
+
+    Parameters:
+    - audio (bytes): The MP3 recording.
+    - abbrevFileName (str): The file name of the recording, used in logs.
+
+    Returns:
+    - Optional[TrimResult]: The trimmed audio and its time map, or None when the recording is uploaded as it is.
+    """
+    # Set up logging
+    logger = logging.getLogger(__name__)
+
+    if trim_audio is None:
+        logger.warning("numpy is not installed, uploading recordings untrimmed.")
+        return None
+    try:
+        with span("transcription.trim"):
+            trimmed = trim_audio(audio)
+        increment("trimmed_audio_seconds", trimmed.original_seconds - trimmed.kept_seconds)
+        return trimmed
+    except Exception as e:
+        logger.warning(f"Could not trim {abbrevFileName}, uploading it untrimmed: {type(e).__name__}, {e}")
+        return None
+
+
+def _normalize_word(word: str) -> str:
+    return "".join(c for c in word.lower() if c.isalnum())
+
+
+def stitch_transcripts(texts: List[str], max_overlap_words: int = 40, min_match_words: int = 3) -> str:
+    """
+    Joins the transcripts of overlapping audio pieces, removing the text duplicated at each overlap.
+
+    The end of the stitched text and the start of the next piece are aligned on their longest
+    common run of words (ignoring case and punctuation). Everything up to the end of that run is
+    kept from the earlier text and everything after it from the next piece. Pieces that do not
+    share at least min_match_words words are simply concatenated.
+
+    Parameters:
+    - texts (List[str]): The transcripts, in audio order.
+    - max_overlap_words (int): The number of words searched at the end and start of each pair.
+    - min_match_words (int): The shortest run of words accepted as the overlap.
+
+    Returns:
+    - str: The stitched transcript.
+    """
+    words = []
+    for text in texts:
+        next_words = text.split()
+        if not next_words:
+            continue
+        if not words:
+            words = next_words
+            continue
+        tail_start = max(len(words) - max_overlap_words, 0)
+        tail = [_normalize_word(w) for w in words[tail_start:]]
+        head = [_normalize_word(w) for w in next_words[:max_overlap_words]]
+        match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+        if match.size >= min_match_words:
+            words = words[:tail_start + match.a + match.size] + next_words[match.b + match.size:]
+        else:
+            words = words + next_words
+    return " ".join(words)
+
+
+def save_transcription(text: str, abbrevFileName: str, completed_transcription_directory: str = os.path.join("transcriptions", "completed")) -> str:
+    """
+    Saves the transcription of a recording next to the other completed transcriptions.
+
+    Parameters:
+    - text (str): The transcribed text.
+    - abbrevFileName (str): The file name of the transcribed recording.
+    - completed_transcription_directory (str): Target directory for saving transcriptions.
+
+    Returns:
+    - str: The path of the saved transcription.
+    """
+    # Set up logging
+    logger = logging.getLogger(__name__)
+
+    # Prepare the transcription filename and path
+    transcription_filename = f"transcription_{abbrevFileName}".replace(".mp3", ".txt")
+    transcription_path = os.path.join(completed_transcription_directory, transcription_filename)
+
+    # Save the transcription
+    with open(file=transcription_path, mode="w", encoding="utf-8") as f:
+        f.write(text)
+
+    logger.info(f"Transcription saved to {transcription_path}")
+    return transcription_path
+
+
+def store_transcription(store: TranscriptStore, text: str, full_path: str, station: str = "KQMV", model: str = "whisper-large-v3", timeline: Optional[Timeline] = None) -> int:
+    """
+    Appends the transcription of a recording, and the timeline of its words, to the transcript store.
+
+    The recording's start time is read from its file name and its end time estimated from its size.
+
+    Parameters:
+    - store (TranscriptStore): The store to append to.
+    - text (str): The transcribed text.
+    - full_path (str): The path of the recording, before it is archived.
+    - station (str): The station the recording was captured from.
+    - model (str): The transcription model.
+    - timeline (Timeline): Optional timeline of the transcription's words.
+
+    Returns:
+    - int: The id of the stored segment.
+    """
+    start_time = parse_recording_time(full_path) or datetime.fromtimestamp(os.path.getmtime(full_path))
+    end_time = start_time.timestamp() + estimate_audio_seconds(os.path.getsize(full_path))
+    segment_id = store.append(text=text, start_time=start_time, end_time=end_time, station=station, model=model, source=os.path.basename(full_path))
+    if timeline is not None and len(timeline):
+        store.put_timeline(segment_id, timeline)
+    return segment_id
+
+
 def transcribe_and_move_audio_files(
-        completed_recordings_directory: str = "recordings\\completed",
-        archive_recordings_directory: str = "recordings\\archive",
-        completed_transcription_directory: str = "transcriptions\\completed",
+        completed_recordings_directory: str = os.path.join("recordings", "completed"),
+        archive_recordings_directory: str = os.path.join("recordings", "archive"),
+        completed_transcription_directory: Optional[str] = os.path.join("transcriptions", "completed"),
         max_retries: int = 3,
-        min_unique_words: int = 100
-) -> None:
+        scorer: Optional[QualityScorer] = None,
+        cache_directory: Optional[str] = "cache/transcriptions",
+        cache_max_bytes: int = 50 * 1024 * 1024,
+        max_workers: int = 4,
+        rate_limiter: Optional[ProviderRateLimiter] = None,
+        client=None,
+        split_seconds: Optional[int] = 120,
+        executor: Optional[HedgedExecutor] = None,
+        fallback_model: Optional[str] = "whisper-large-v3-turbo",
+        store: Optional[TranscriptStore] = None,
+        station: str = "KQMV",
+        trim_non_speech: bool = False
+) -> List[str]:
+    """
+    Transcribes every recording in a directory, saves the transcriptions and archives the recordings.
+
+    Up to max_workers recordings are transcribed concurrently, behind a rate limiter shared by all
+    workers. Transcriptions are saved in recording timestamp order regardless of which finishes first.
+    A recording that fails to transcribe is logged and left in completed_recordings_directory for
+    the next run; the others are still saved and archived.
+    With a store, every transcription is appended to it as a segment; text files are then only written
+    when completed_transcription_directory is given.
+
+    Parameters:
+    - completed_recordings_directory (str): Directory containing completed audio recordings.
+    - archive_recordings_directory (str): Directory recordings are moved to once transcribed.
+    - completed_transcription_directory (str): Target directory for saving transcriptions, None to only use the store.
+    - max_retries (int): The maximum number of transcription passes per recording.
+    - scorer (QualityScorer): Judges each transcription pass, defaults to a QualityScorer with its default thresholds.
+    - cache_directory (str): Directory of the transcription cache, or None to disable caching.
+    - cache_max_bytes (int): The maximum size of the transcription cache.
+    - max_workers (int): The number of recordings transcribed concurrently.
+    - rate_limiter (ProviderRateLimiter): The limiter for the provider, defaults to Groq's free tier limits.
+    - client: The transcription client, defaults to the shared Groq client.
+    - split_seconds (int): Recordings longer than this are transcribed as concurrent pieces, None to disable.
+    - executor (HedgedExecutor): Optional executor adding deadlines, hedging and circuit breaking to the requests.
+    - fallback_model (str): The model hedged or fallback requests are sent to when an executor is given, None to repeat the request.
+    - store (TranscriptStore): Optional store the transcriptions are appended to.
+    - station (str): The station the recordings were captured from, recorded in the store.
+    - trim_non_speech (bool): Whether silence and music are cut out of each recording before upload.
+
+    Returns:
+    - List[str]: The paths of the saved transcription files, in recording order.
+    """
     # Set up logging
     logger = logging.getLogger(__name__)
 
+    if completed_transcription_directory is None and store is None:
+        raise ValueError("Transcriptions need a directory or a store to be saved to")
     # Ensure directory for completed transcriptions exists
-    os.makedirs(completed_transcription_directory, exist_ok=True)
-    # Ensure directory for completed recordings exists
+    if completed_transcription_directory is not None:
+        os.makedirs(completed_transcription_directory, exist_ok=True)
+    # Ensure directories for completed and archived recordings exist
     os.makedirs(completed_recordings_directory, exist_ok=True)
+    os.makedirs(archive_recordings_directory, exist_ok=True)
+
+    client = client or get_groq_client()
+    rate_limiter = rate_limiter or ProviderRateLimiter()
+    cache = TranscriptionCache(directory=cache_directory, max_bytes=cache_max_bytes) if cache_directory else None
 
-    client = Groq()
+    # recordings are named by their start timestamp, so name order is recording order
+    file_names = sorted(os.listdir(completed_recordings_directory))
 
-    for abbrevFileName in os.listdir(completed_recordings_directory):
+    def transcribe(abbrevFileName: str) -> TimedTranscription:
         full_path = os.path.join(completed_recordings_directory, abbrevFileName)
         logger.info(f"Processing file: {abbrevFileName}")
-        for i in range(max_retries):
-            i += 1
-            # Transcribe the audio file
-            start_time = time.time()
-            with open(file=full_path, mode='rb') as file:
-                transcription = client.audio.transcriptions.create(
-                    file=(full_path, file.read()),
-                    model="whisper-large-v3",
-                    prompt="",
-                    response_format="json",
-                    temperature=0
-                )
-            end_time = time.time()
-            transcription_time = end_time - start_time
-            logger.info(f"Attempt #{i}, Transcription of {abbrevFileName} completed in {transcription_time: .2f} seconds.")
-            # print(f"Transcription of {abbrevFileName} completed in {transcription_time: .2f} seconds.")
-            # print(f"transcription: \n{transcription}")
-
-            # check transcription for errors
-            num_words = len(set(transcription.text))
-            if num_words > min_unique_words:
-                # valid transcription
-                logger.info(f"Attempt #{i}, number of unique words in transcription is {num_words}, continuing with this transcription")
-                break
-            # log retry attempts
-            logger.info(f"Transcription text: \n{transcription.text}")
-            if i < 3:
-                logger.info(f"Attempt number {i} had {num_words} unique words. That seems too low, attempting a retry.")
-            else:
-                logger.info(f"On final attempt transcription had {num_words} unique words and will be used.")
-
-        # Prepare the transcription filename and path
-        transcription_filename = f"transcription_{abbrevFileName}".replace(".mp3", ".txt")
-        transcription_path = os.path.join(completed_transcription_directory, transcription_filename)
-
-        # Save the transcription
-        with open(file=transcription_path, mode="w", encoding="utf-8") as f:
-            f.write(transcription.text)
-
-        logger.info(f"Transcription saved to {transcription_path}")
-        # Move the original audio file to the archive directory
-        shutil.move(full_path, archive_recordings_directory)
-        logger.info(f"{abbrevFileName} moved to {archive_recordings_directory}")
-
-
+        return transcribe_recording_timed(client=client, full_path=full_path, max_retries=max_retries, scorer=scorer, cache=cache, rate_limiter=rate_limiter, split_seconds=split_seconds,
+                                          executor=executor, fallback_model=fallback_model, trim_non_speech=trim_non_speech)
+
+    transcription_paths = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(abbrevFileName, pool.submit(transcribe, abbrevFileName)) for abbrevFileName in file_names]
+        # results are saved in submission order, a failed recording does not hold back the others
+        for abbrevFileName, future in futures:
+            try:
+                text, timeline, model = future.result()
+            except Exception as e:
+                logger.error(f"Failed to transcribe {abbrevFileName}, leaving it for the next run: {type(e).__name__}, {e}")
+                continue
+            full_path = os.path.join(completed_recordings_directory, abbrevFileName)
+
+            # Save the transcription
+            if store is not None:
+                store_transcription(store=store, text=text, full_path=full_path, station=station, model=model, timeline=timeline)
+            if completed_transcription_directory is not None:
+                transcription_paths.append(save_transcription(text=text, abbrevFileName=abbrevFileName, completed_transcription_directory=completed_transcription_directory))
+
+            # Move the original audio file to the archive directory
+            shutil.move(full_path, archive_recordings_directory)
+            logger.info(f"{abbrevFileName} moved to {archive_recordings_directory}")
+
+    if cache is not None:
+        cache.log_stats()
+    if rate_limiter.throttled:
+        logger.info(f"Transcription requests were rate limited {rate_limiter.throttled} time(s).")
+    if executor is not None:
+        executor.log_stats()
+    return transcription_paths
+
+
+@span("transcription.get_contents")
 def get_contents(completed_transcription_dir: str = "transcriptions/completed", archive_transcription_dir: str = "transcriptions/archive") -> str:
     """
     Walks a directory path and reads each text file concatenating their transcription, afterwards it moves the text file to an archive directory.
@@ -164,20 +660,22 @@ def get_contents(completed_transcription_dir: str = "transcriptions/completed",
     if not os.path.exists(archive_transcription_dir):
         os.makedirs(archive_transcription_dir)
 
-    transcription = ""
+    # collect the pieces and join them once, appending to a string copies it every time
+    transcriptions = []
     try:
         for root, dirs, files in os.walk(completed_transcription_dir):
-            for file in files:
+            # transcriptions are named by their recording timestamp, so name order is air order
+            for file in sorted(files):
                 if file.endswith(".txt"):
                     # full file path
                     file_path = os.path.join(root, file)
                     # normalize file path(s)
                     norm_file_path = os.path.normpath(path=file_path)
                     norm_archive_dir = os.path.normpath(path=archive_transcription_dir)
-                    transcription += read_file(file_path=file_path)
+                    transcriptions.append(read_file(file_path=file_path))
                     shutil.move(src=file_path, dst=archive_transcription_dir)
                     logger.info(f"Moved {norm_file_path} to {norm_archive_dir}")
-        return transcription
+        return "".join(transcriptions)
     except Exception as e:
         logger.error(f"An unexpected error occurred while getting transcription file contents: {type(e).__name__}, {e}")
 